@@ -0,0 +1,352 @@
+"""
+HTTP rendering API.
+
+Serves invoice generation to other programs next to the Streamlit app.
+Invoices are rendered by a pool of worker processes, which are started and
+warmed up (logo normalized, fonts loaded, template compiled) before the first
+request is accepted. Connections are kept alive between requests.
+
+Endpoints:
+    POST /invoice   One invoice record as JSON, in the format of a batch.py
+                    JSONL line; returns the PDF
+    POST /batch     {"invoices": [...]}, a JSON array, or JSONL sent as
+                    application/x-ndjson; returns a ZIP archive with
+                    manifest.json, or one bookmarked PDF with ?bundle=pdf
+    GET  /metrics   Request counts and latencies in the OpenMetrics format
+    GET  /health    Worker pool status (no token needed)
+
+Set API_TOKEN (or --token) to require an "Authorization: Bearer <token>"
+header on every other endpoint.
+
+Usage:
+    python api.py --company-name "ABC123 INC" [--port 8600] [--workers 4]
+    curl -X POST --data @invoice.json http://127.0.0.1:8600/invoice -o invoice.pdf
+"""
+import argparse
+import hmac
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from dotenv import load_dotenv
+
+from batch import _init_worker, add_company_arguments, company_from_args, invoice_filename, normalize_record
+from batch import render_pdf, run_batch
+from bundle import BUNDLE_FORMATS
+from catalog import read_catalog_csv
+from models import Invoice, LineItem
+from render_queue import QueueFull
+from render_stats import OPENMETRICS_CONTENT_TYPE, RequestStats
+
+DEFAULT_PORT = 8600
+# Largest request body accepted, and most invoices in one /batch request
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_BATCH_INVOICES = 1000
+# Seconds an idle keep-alive connection is held open
+KEEP_ALIVE_TIMEOUT = 30
+
+# Rendered by every worker before the first request
+WARMUP_INVOICE = Invoice('WARMUP', 'Warm-up', items=[LineItem('WARMUP', 'Warm-up', hours=1, rate=1)])
+
+
+class RequestError(Exception):
+    """A request the API cannot answer, with the HTTP status to reply with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class InvoiceAPI:
+    """
+    Invoice rendering shared by the request threads of the HTTP server.
+
+    company is the dictionary batch.run_batch takes; every worker process
+    builds its InvoiceGenerator from it once and keeps it, with its compiled
+    templates and logo, for every later request. At most max_pending invoices
+    are rendered or waiting for a worker at a time, batches included, and one
+    batch at a time; requests beyond that raise QueueFull, so a burst is turned away at once
+    instead of piling up.
+    """
+
+    def __init__(self, company, workers=None, max_pending=None, catalog=None, token=None):
+        self.company = company
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 8
+        self.catalog = catalog
+        self.token = token
+        self.stats = RequestStats()
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+        self._batch = threading.Lock()
+        self._pool = None
+
+    def start(self):
+        """Start the worker processes and render a warm-up invoice in each"""
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                         initargs=(self.company,))
+        # Submitted together, so every worker process is started right away
+        wait([self._pool.submit(render_pdf, WARMUP_INVOICE) for _ in range(self.workers)])
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def authorized(self, header):
+        if not self.token:
+            return True
+        scheme, _, token = (header or '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), self.token)
+
+    def _invoice(self, raw):
+        if not isinstance(raw, dict):
+            raise ValueError("An invoice must be a JSON object")
+        return normalize_record(raw, self.catalog)
+
+    def render(self, raw):
+        """Validate one invoice record and render it; returns the Invoice and the PDF bytes"""
+        invoice = self._invoice(raw)
+        if not self._pending.acquire(blocking=False):
+            raise QueueFull(f"{self.max_pending} invoices are already being rendered; try again shortly")
+        try:
+            pdf_bytes, render_ms = self._pool.submit(render_pdf, invoice).result()
+        finally:
+            self._pending.release()
+        self.stats.observe_render(render_ms / 1000, len(pdf_bytes))
+        return invoice, pdf_bytes
+
+    def render_batch(self, records, bundle, output_dir):
+        """
+        Validate every record, then render them into a bundle in output_dir.
+        Returns the batch manifest (see batch.run_batch).
+
+        The batch keeps as many invoices in flight as it holds pending slots,
+        taking those free when it starts (at least one).
+        """
+        if not records:
+            raise ValueError("The batch has no invoices")
+        if len(records) > MAX_BATCH_INVOICES:
+            raise RequestError(413, f"A batch may have at most {MAX_BATCH_INVOICES} invoices, got {len(records)}")
+        invoices = [self._invoice(raw) for raw in records]
+        numbers = set()
+        for invoice in invoices:
+            if invoice.invoice_number in numbers:
+                raise RequestError(400, f"Invoice number {invoice.invoice_number} appears more than once")
+            numbers.add(invoice.invoice_number)
+        if not self._batch.acquire(blocking=False):
+            raise QueueFull("Another batch is being rendered; try again shortly")
+        slots = 0
+        try:
+            while slots < len(invoices) and self._pending.acquire(blocking=False):
+                slots += 1
+            if not slots:
+                raise QueueFull(f"{self.max_pending} invoices are already being rendered; try again shortly")
+            manifest = run_batch(invoices, output_dir, self.company, workers=self.workers, max_pending=slots,
+                                 bundle=bundle, pool=self._pool)
+        finally:
+            for _ in range(slots):
+                self._pending.release()
+            self._batch.release()
+        for entry in manifest['invoices']:
+            if entry['status'] == 'ok':
+                self.stats.observe_render(entry['render_ms'] / 1000, entry['bytes'])
+        return manifest
+
+    def health(self):
+        return {'status': 'ok' if self._pool is not None else 'stopped', 'workers': self.workers,
+                'max_pending': self.max_pending, 'in_flight': self.stats.in_flight}
+
+
+def parse_batch(body, content_type):
+    """Invoice records of a /batch body: {"invoices": [...]}, a JSON array, or JSONL"""
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get('invoices')
+    if not isinstance(data, list):
+        raise ValueError('Expected {"invoices": [...]}, a JSON array or JSONL')
+    return data
+
+
+class InvoiceRequestHandler(BaseHTTPRequestHandler):
+    """Routes requests to the InvoiceAPI of the server; every response has a Content-Length for keep-alive"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'InvoiceAPI/1.0'
+    timeout = KEEP_ALIVE_TIMEOUT
+    # Headers and body are written separately; with Nagle's algorithm the body
+    # would wait for the client to acknowledge the headers
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self._handle(path, self._health, public=True)
+        elif path == '/metrics':
+            self._handle(path, self._metrics)
+        else:
+            self._handle(path, self._not_found, public=True)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path == '/invoice':
+            self._handle(path, self._render_invoice)
+        elif path == '/batch':
+            self._handle(path, self._render_batch)
+        else:
+            self._handle(path, self._not_found, public=True)
+
+    def _handle(self, endpoint, handler, public=False):
+        api = self.server.api
+        start = time.perf_counter()
+        api.stats.started()
+        status = 500
+        try:
+            if not public and not api.authorized(self.headers.get('Authorization')):
+                raise RequestError(401, "Missing or wrong API token")
+            status = handler()
+        except RequestError as e:
+            status = self._send_error(e.status, str(e))
+        except QueueFull as e:
+            api.stats.reject()
+            status = self._send_error(503, str(e), [('Retry-After', '1')])
+        except ValueError as e:
+            # Invalid JSON or invoice fields
+            status = self._send_error(400, str(e))
+        except Exception as e:
+            print(f"Error handling {self.command} {endpoint}: {e}")
+            status = self._send_error(500, "Internal error")
+        finally:
+            # Unknown paths are counted together, so scanners cannot grow the metrics
+            api.stats.finished(endpoint if status != 404 else 'other', status, time.perf_counter() - start)
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding'):
+            self.close_connection = True
+            raise RequestError(411, "Send the body with a Content-Length, not chunked")
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.close_connection = True
+            raise RequestError(411, "Content-Length is required")
+        if length > MAX_BODY_BYTES:
+            # The body is left unread, so the connection cannot be reused
+            self.close_connection = True
+            raise RequestError(413, f"Request body is larger than {MAX_BODY_BYTES} bytes")
+        return self.rfile.read(length)
+
+    def _send(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def _send_json(self, status, payload, headers=()):
+        return self._send(status, json.dumps(payload).encode('utf-8'), 'application/json', headers)
+
+    def _send_error(self, status, message, headers=()):
+        return self._send_json(status, {'error': message}, headers)
+
+    def _not_found(self):
+        # The body of an unknown request is never needed
+        if self.headers.get('Content-Length', '0') != '0':
+            self.close_connection = True
+        return self._send_error(404, f"No endpoint {urlsplit(self.path).path}")
+
+    def _health(self):
+        return self._send_json(200, self.server.api.health())
+
+    def _metrics(self):
+        return self._send(200, self.server.api.stats.openmetrics().encode('utf-8'), OPENMETRICS_CONTENT_TYPE)
+
+    def _render_invoice(self):
+        invoice, pdf_bytes = self.server.api.render(json.loads(self._read_body()))
+        disposition = f'attachment; filename="{invoice_filename(invoice.invoice_number)}"'
+        return self._send(200, pdf_bytes, 'application/pdf', [('Content-Disposition', disposition)])
+
+    def _render_batch(self):
+        query = parse_qs(urlsplit(self.path).query)
+        bundle = query.get('bundle', ['zip'])[0]
+        if bundle not in BUNDLE_FORMATS:
+            raise ValueError(f"bundle must be one of {', '.join(BUNDLE_FORMATS)}")
+        records = parse_batch(self._read_body(), self.headers.get('Content-Type', ''))
+        with tempfile.TemporaryDirectory(prefix='invoice-batch-') as output_dir:
+            manifest = self.server.api.render_batch(records, bundle, output_dir)
+            summary = manifest['summary']
+            if not summary['rendered']:
+                return self._send_json(422, manifest)
+            path = os.path.join(output_dir, summary['bundle'])
+            content_type = 'application/pdf' if bundle == 'pdf' else 'application/zip'
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(os.path.getsize(path)))
+            self.send_header('Content-Disposition', f'attachment; filename="{summary["bundle"]}"')
+            self.send_header('X-Invoices-Rendered', str(summary['rendered']))
+            self.send_header('X-Invoices-Failed', str(summary['failed']))
+            self.end_headers()
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, self.wfile)
+        return 200
+
+    def log_message(self, format, *args):
+        # Per-request logging would cost more than rendering a small invoice; see /metrics
+        pass
+
+
+class InvoiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many clients may connect at once under load
+    request_queue_size = 128
+
+    def __init__(self, address, api):
+        self.api = api
+        super().__init__(address, InvoiceRequestHandler)
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Serve invoice rendering over HTTP")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: localhost only)")
+    parser.add_argument('--port', type=int, default=int(os.getenv('API_PORT', DEFAULT_PORT)))
+    add_company_arguments(parser)
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help="Invoices rendered or waiting at once before requests get 503 (default: 8 per worker)")
+    parser.add_argument('--token', default=os.getenv('API_TOKEN'),
+                        help="Require this bearer token (default: $API_TOKEN)")
+    args = parser.parse_args(argv)
+
+    catalog = read_catalog_csv(args.catalog) if args.catalog else None
+    api = InvoiceAPI(company_from_args(args), workers=args.workers, max_pending=args.max_pending,
+                     catalog=catalog, token=args.token)
+    start = time.perf_counter()
+    api.start()
+    server = InvoiceServer((args.host, args.port), api)
+    print(f"Started {api.workers} workers in {time.perf_counter() - start:.2f}s; "
+          f"serving on http://{args.host}:{server.server_address[1]}", flush=True)
+    # Stop the worker processes too when the service manager stops the server
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
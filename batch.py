@@ -0,0 +1,429 @@
+"""
+Headless batch invoice generation.
+
+Streams invoice records from a CSV or JSONL file, renders them in parallel with
+a process pool and writes one PDF per invoice plus a manifest.json summary to
+the output directory. With --bundle the invoices are collected into a single
+ZIP archive or merged PDF instead of loose files. With --catalog, line items
+may give just a service code and the description and rate are looked up. With
+--timesheet the input is a raw time-entry export, summed into one invoice per
+client.
+
+Usage:
+    python batch.py invoices.jsonl --company-name "ABC123 INC" --output-dir out/
+    python batch.py invoices.jsonl --company-name "ABC123 INC" --bundle pdf
+    python batch.py invoices.csv --company-name "ABC123 INC" --catalog services.csv
+    python batch.py entries.csv --timesheet --catalog services.csv --company-name "ABC123 INC"
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+
+from bundle import BUNDLE_FORMATS, open_bundle
+from catalog import read_catalog_csv
+from invoice_generator import InvoiceGenerator
+from models import INVOICE_FIELDS, ITEM_FIELDS, Invoice
+from pdf_cache import RenderCache
+from pricing import price_items
+from render_stats import RenderStats
+from timesheets import aggregate_timesheet
+
+# Company settings and generator of the current worker process, set by the pool
+# initializer so the logo is normalized once per worker rather than per invoice
+_worker_company = None
+_worker_generator = None
+
+
+def normalize_record(raw, catalog=None):
+    """
+    Validate one invoice record (JSON object with an 'items' list) into an
+    Invoice, filling items that reference a service code from the catalog
+    """
+    if catalog is not None:
+        raw = catalog.resolve_record(raw)
+    return Invoice.from_dict(raw)
+
+
+class InvalidRecord:
+    """
+    A record of the input that failed validation. Readers yield it in place
+    of the Invoice, so run_batch reports it in the manifest and carries on.
+    """
+
+    __slots__ = ('invoice_number', 'client_name', 'items', 'error')
+
+    def __init__(self, raw, error):
+        raw = raw if isinstance(raw, dict) else {}
+        self.invoice_number = str(raw.get('invoice_number') or '')
+        self.client_name = str(raw.get('client_name') or '')
+        self.items = len(raw['items']) if isinstance(raw.get('items'), list) else 0
+        self.error = error
+
+    def entry(self):
+        """Manifest entry of the record"""
+        return {'invoice_number': self.invoice_number, 'client_name': self.client_name, 'items': self.items,
+                'status': 'error', 'error': self.error}
+
+
+def validate_record(raw, catalog=None, where=None):
+    """normalize_record, returning an InvalidRecord instead of raising for a bad record"""
+    try:
+        return normalize_record(raw, catalog)
+    except Exception as e:
+        return InvalidRecord(raw, f"{where}: {e}" if where else str(e))
+
+
+def read_jsonl(path, catalog=None):
+    """Yield Invoices from a JSONL file, one invoice per line, and InvalidRecords for bad lines"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError as e:
+                yield InvalidRecord(None, f"line {number}: {e}")
+                continue
+            yield validate_record(raw, catalog, f"line {number}")
+
+
+def read_csv(path, catalog=None):
+    """
+    Yield Invoices from a CSV file with one line item per row.
+
+    Consecutive rows sharing an invoice_number form one invoice; invoice level
+    columns are taken from the first row of each group. Only one invoice is held
+    in memory at a time. A code column references a service of the catalog.
+    Invoices that fail validation are yielded as InvalidRecords.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        current = None
+        reader = csv.DictReader(f)
+        for row in reader:
+            if current is None or row.get('invoice_number') != current['invoice_number']:
+                if current is not None:
+                    yield validate_record(current, catalog, f"line {first_line}")
+                current = {field: row.get(field) for field in INVOICE_FIELDS}
+                current['items'] = []
+                first_line = reader.line_num
+            if row.get('description') or row.get('service_item') or row.get('code'):
+                item = {field: row.get(field) for field in ITEM_FIELDS}
+                if row.get('code'):
+                    item['code'] = row['code']
+                current['items'].append(item)
+        if current is not None:
+            yield validate_record(current, catalog, f"line {first_line}")
+
+
+def read_records(path, fmt=None, catalog=None):
+    """
+    Stream Invoices from a CSV or JSONL file (format inferred from the extension).
+    Items may reference a service of catalog (a catalog.ServiceCatalog) by
+    code instead of spelling out its description and rate.
+    """
+    if fmt is None:
+        fmt = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    if fmt == 'csv':
+        return read_csv(path, catalog)
+    if fmt == 'jsonl':
+        return read_jsonl(path, catalog)
+    raise ValueError(f"Unsupported input format: {fmt}")
+
+
+def timesheet_records(totals, number_prefix='INV-', first_number=1, catalog=None):
+    """
+    Yield an Invoice per client of timesheets.TimesheetTotals, or an
+    InvalidRecord for a client whose entries do not validate (with a catalog,
+    a service code missing from it fails only the invoice of that client)
+    """
+    for record in totals.records(number_prefix, first_number):
+        if catalog is not None:
+            try:
+                record['items'] = totals.items(record['client_name'], catalog)
+            except ValueError as e:
+                yield InvalidRecord(record, f"{record['client_name']}: {e}")
+                continue
+        yield validate_record(record, where=record['client_name'])
+
+
+def invoice_filename(invoice_number):
+    """File name used for an invoice PDF, matching the Streamlit download name"""
+    safe_number = re.sub(r'[^A-Za-z0-9._-]+', '_', invoice_number)
+    return f"Invoice_{safe_number}.pdf"
+
+
+def _init_worker(company):
+    global _worker_company, _worker_generator
+    _worker_company = company
+    render_cache = None
+    if company.get('cache_dir'):
+        # Workers share the directory, so re-running a batch only renders changed invoices
+        render_cache = RenderCache(max_bytes=0, cache_dir=company['cache_dir'])
+    stats = RenderStats() if company.get('stats') else None
+    _worker_generator = InvoiceGenerator(company['company_name'], company['company_address'], company['logo'],
+                                         render_cache=render_cache, stats=stats)
+
+
+def render_record(invoice, output_dir, filename=None):
+    """Render a single Invoice to a PDF file (filename defaults to invoice_filename) inside a worker process"""
+    company = _worker_company
+    start = time.perf_counter()
+    entry = {
+        'invoice_number': invoice.invoice_number,
+        'client_name': invoice.client_name,
+        'items': len(invoice.items),
+    }
+    try:
+        arguments = invoice.generate_arguments(company['notes'], company['tax_rate'], company['discount'])
+        filename = filename or invoice_filename(invoice.invoice_number)
+        path = os.path.join(output_dir, filename)
+        # The PDF is streamed into the file; a failed render never leaves a partial PDF behind
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                size = _worker_generator.generate_invoice(
+                    services_heading=company['services_heading'],
+                    column_names=company['column_names'],
+                    output=f,
+                    **arguments
+                )
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        totals = price_items(invoice.items, arguments['tax_rate'], arguments['discount'])
+        entry.update({'status': 'ok', 'file': filename, 'bytes': size, 'total': str(totals.total)})
+        if _worker_generator.last_record is not None:
+            entry['stages'] = {name: stage['ms'] for name, stage in _worker_generator.last_record.stages.items()}
+    except Exception as e:
+        entry.update({'status': 'error', 'error': str(e)})
+    entry['render_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return entry
+
+
+def render_pdf(invoice):
+    """
+    Render a single Invoice to PDF bytes inside a worker process; returns the
+    bytes and the render time in milliseconds
+    """
+    company = _worker_company
+    start = time.perf_counter()
+    arguments = invoice.generate_arguments(company['notes'], company['tax_rate'], company['discount'])
+    pdf_bytes = _worker_generator.generate_invoice(
+        services_heading=company['services_heading'],
+        column_names=company['column_names'],
+        **arguments
+    )
+    return pdf_bytes, round((time.perf_counter() - start) * 1000, 3)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_batch(records, output_dir, company, workers=None, max_pending=None, bundle=None, progress=None, pool=None):
+    """
+    Render every record in a process pool and write manifest.json.
+
+    Parameters:
+    - records: Iterable of Invoices (see read_records); InvalidRecords among them
+      are listed in the manifest as failed without stopping the run
+    - output_dir: Directory receiving the PDFs and the manifest
+    - company: Dictionary with company_name, company_address, logo (bytes or None),
+      notes, tax_rate, discount, services_heading, column_names and optionally
+      cache_dir (render cache directory) and stats (record per-stage timings)
+    - workers: Number of worker processes (defaults to the CPU count)
+    - max_pending: Upper bound on submitted but unfinished invoices, which keeps
+      memory flat while reading very large inputs
+    - bundle: 'zip' or 'pdf' to collect the PDFs into invoices.zip (with the
+      manifest) or into invoices.pdf with a bookmark per invoice. Each PDF is
+      moved into the bundle as soon as it is rendered, so the output directory
+      never holds more than max_pending loose files
+    - progress: Optional callable receiving the number of invoices finished so far
+    - pool: ProcessPoolExecutor whose workers were started with
+      initializer=_init_worker and this company, used instead of starting
+      new worker processes (e.g. the warm pool of the HTTP API)
+
+    Returns:
+    - The manifest dictionary
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    os.makedirs(output_dir, exist_ok=True)
+
+    entries = []
+    archive = open_bundle(bundle, os.path.join(output_dir, f"invoices.{bundle}")) if bundle else None
+    # Input position of every submitted invoice, so a merged PDF keeps the input order
+    positions = {}
+    # File names already given out; records sharing an invoice number get the input position added
+    filenames = set()
+
+    def unique_filename(invoice_number, position):
+        filename = invoice_filename(invoice_number)
+        suffix = position + 1
+        while filename.lower() in filenames:
+            filename = invoice_filename(f"{invoice_number}-{suffix}")
+            suffix += 1
+        filenames.add(filename.lower())
+        return filename
+
+    def collect(future):
+        entry = future.result()
+        entries.append(entry)
+        position = positions.pop(future)
+        if archive is not None and entry['status'] == 'ok':
+            path = os.path.join(output_dir, entry['file'])
+            archive.add(path, entry['file'], title=f"{entry['invoice_number']} - {entry['client_name']}",
+                        order=position)
+            os.remove(path)
+        if progress is not None:
+            progress(len(entries))
+
+    start = time.perf_counter()
+    try:
+        # A shared pool stays open for the next batch
+        executor = (nullcontext(pool) if pool is not None
+                    else ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(company,)))
+        with executor as pool:
+            pending = set()
+            for position, record in enumerate(records):
+                if isinstance(record, InvalidRecord):
+                    entries.append(record.entry())
+                    if progress is not None:
+                        progress(len(entries))
+                    continue
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                filename = unique_filename(record.invoice_number, position)
+                future = pool.submit(render_record, record, output_dir, filename)
+                positions[future] = position
+                pending.add(future)
+            for future in pending:
+                collect(future)
+        if archive is not None:
+            archive.close()
+    except BaseException:
+        if archive is not None:
+            archive.close()
+            os.remove(archive.path)
+        raise
+    wall_time = time.perf_counter() - start
+
+    render_times = [entry['render_ms'] for entry in entries if 'render_ms' in entry]
+    rendered = [entry for entry in entries if entry['status'] == 'ok']
+    summary = {
+        'invoices': len(entries),
+        'rendered': len(rendered),
+        'failed': len(entries) - len(rendered),
+        'workers': workers,
+        'wall_time_s': round(wall_time, 3),
+        'invoices_per_second': round(len(entries) / wall_time, 2) if wall_time > 0 else None,
+        'mean_render_ms': round(statistics.mean(render_times), 3) if render_times else None,
+        'p95_render_ms': _percentile(render_times, 0.95) if render_times else None,
+        'total_bytes': sum(entry['bytes'] for entry in rendered),
+    }
+    if archive is not None:
+        summary['bundle'] = os.path.basename(archive.path)
+        summary['bundle_bytes'] = os.path.getsize(archive.path)
+    staged = [entry['stages'] for entry in rendered if 'stages' in entry]
+    if staged:
+        stage_names = {name for stages in staged for name in stages}
+        summary['mean_stage_ms'] = {name: round(sum(stages.get(name, 0) for stages in staged) / len(staged), 3)
+                                    for name in sorted(stage_names)}
+    entries.sort(key=lambda entry: entry['invoice_number'])
+    manifest = {'summary': summary, 'invoices': entries}
+    with open(os.path.join(output_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    if bundle == 'zip':
+        with zipfile.ZipFile(archive.path, 'a') as f:
+            f.write(os.path.join(output_dir, 'manifest.json'), 'manifest.json')
+    return manifest
+
+
+def add_company_arguments(parser):
+    """Command line options for the company and invoice defaults, shared with the HTTP API"""
+    parser.add_argument('--company-name', required=True)
+    parser.add_argument('--company-address', default='', help="Use \\n to separate address lines")
+    parser.add_argument('--logo', help="Path to a PNG/JPEG logo (default: asset/logo.png)")
+    parser.add_argument('--notes', default=None, help="Default notes when a record has none")
+    parser.add_argument('--tax-rate', type=float, default=6.0)
+    parser.add_argument('--discount', type=float, default=0.0)
+    parser.add_argument('--services-heading', default='Services')
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--cache-dir', default=os.getenv('RENDER_CACHE_DIR'),
+                        help="Reuse PDFs of unchanged invoices from this directory (default: $RENDER_CACHE_DIR)")
+    parser.add_argument('--catalog', help="CSV service catalog (code, description, rate, unit) for items "
+                                          "that give only a service code")
+
+
+def company_from_args(args):
+    """The company dictionary of run_batch for options added by add_company_arguments"""
+    logo = None
+    if args.logo:
+        with open(args.logo, 'rb') as f:
+            logo = f.read()
+    return {
+        'company_name': args.company_name,
+        'company_address': args.company_address.replace('\\n', '\n'),
+        'logo': logo,
+        'notes': args.notes,
+        'tax_rate': args.tax_rate,
+        'discount': args.discount,
+        'services_heading': args.services_heading,
+        'column_names': None,
+        'cache_dir': args.cache_dir,
+        'stats': getattr(args, 'stats', False),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render invoices from a CSV or JSONL file")
+    parser.add_argument('input', help="CSV (one line item per row) or JSONL (one invoice per line) file")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Input format (default: from extension)")
+    parser.add_argument('--output-dir', default='invoices', help="Directory for the PDFs and manifest.json")
+    add_company_arguments(parser)
+    parser.add_argument('--stats', action='store_true', help="Record per-stage render timings in the manifest")
+    parser.add_argument('--bundle', choices=BUNDLE_FORMATS,
+                        help="Collect the PDFs into invoices.zip or one bookmarked invoices.pdf")
+    parser.add_argument('--timesheet', action='store_true',
+                        help="Input is a time-entry CSV export; bill each client's summed hours per service code")
+    parser.add_argument('--number-prefix', default='INV-', help="Invoice number prefix with --timesheet")
+    parser.add_argument('--first-number', type=int, default=1, help="Number of the first invoice with --timesheet")
+    args = parser.parse_args(argv)
+    company = company_from_args(args)
+
+    catalog = read_catalog_csv(args.catalog) if args.catalog else None
+    if args.timesheet:
+        totals = aggregate_timesheet(args.input)
+        print(f"Summed {totals.entries:,} time entries ({totals.skipped:,} skipped) for {len(totals.clients)} clients")
+        records = timesheet_records(totals, args.number_prefix, args.first_number, catalog)
+    else:
+        records = read_records(args.input, args.format, catalog)
+    manifest = run_batch(records, args.output_dir, company, workers=args.workers, bundle=args.bundle)
+    summary = manifest['summary']
+    print(f"Rendered {summary['rendered']} of {summary['invoices']} invoices "
+          f"({summary['failed']} failed) with {summary['workers']} workers "
+          f"in {summary['wall_time_s']:.2f}s")
+    if summary['rendered']:
+        print(f"Throughput: {summary['invoices_per_second']} invoices/s, "
+              f"mean {summary['mean_render_ms']:.1f} ms per invoice (p95 {summary['p95_render_ms']:.1f} ms)")
+    if 'bundle' in summary:
+        print(f"Bundle: {os.path.join(args.output_dir, summary['bundle'])} ({summary['bundle_bytes']:,} bytes)")
+    print(f"Manifest: {os.path.join(args.output_dir, 'manifest.json')}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Load test of the HTTP rendering API.
+
+Starts api.py in a separate process on a free local port (or uses --url), then
+sends invoices from several client threads, each over one keep-alive
+connection, and reports throughput, latency percentiles and failures.
+
+Usage:
+    python benchmarks/api_benchmark.py [--clients 8] [--requests 2000] [--items 3] [--workers 2]
+    python benchmarks/api_benchmark.py --url http://127.0.0.1:8600 [--token TOKEN]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_TIMEOUT = 60
+
+
+def make_invoice(number, item_count):
+    return {
+        'invoice_number': f"API-{number:06d}",
+        'client_name': f"Client {number % 50}",
+        'client_address': "1 Main Street\nSpringfield",
+        'client_email': "billing@example.com",
+        'items': [{'service_item': f"SRV-{i:03d}", 'description': f"Consulting work package {i}",
+                   'hours': 1 + i % 8, 'rate': 150} for i in range(item_count)],
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers):
+    """Start api.py on a free port and wait until it answers; returns (process, url)"""
+    port = _free_port()
+    command = [sys.executable, os.path.join(ROOT, 'api.py'), '--company-name', 'ABC123 INC',
+               '--company-address', '123 Broadway\\nNew York, NY 10004', '--port', str(port)]
+    if workers:
+        command += ['--workers', str(workers)]
+    env = dict(os.environ, API_TOKEN='')
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"api.py exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                connection.close()
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("api.py did not start in time")
+
+
+def run_client(url, bodies, headers, latencies, failures):
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+    for body in bodies:
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/invoice', body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+            ok = response.status == 200 and data[:5] == b'%PDF-'
+        except (OSError, http.client.HTTPException):
+            ok = False
+            connection.close()
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            failures.append(1)
+    connection.close()
+
+
+def load_test(url, clients, requests, items, token=None):
+    """Send requests invoices from clients threads; returns the result dictionary"""
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+    bodies = [json.dumps(make_invoice(number, items)).encode('utf-8') for number in range(requests)]
+    latencies = []
+    failures = []
+    threads = [threading.Thread(target=run_client, args=(url, bodies[i::clients], headers, latencies, failures))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(fraction):
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+
+    result = {'requests': requests, 'clients': clients, 'items': items, 'failed': len(failures),
+              'wall_time_s': round(wall_time, 3), 'invoices_per_second': round(len(latencies) / wall_time, 1)}
+    if latencies:
+        result.update({'mean_ms': round(statistics.mean(latencies) * 1000, 2), 'p50_ms': percentile(0.5),
+                       'p95_ms': percentile(0.95), 'p99_ms': percentile(0.99), 'max_ms': percentile(1.0)})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help="API to test (default: start api.py locally)")
+    parser.add_argument('--token', default=os.getenv('API_TOKEN'), help="Bearer token for --url")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent keep-alive connections")
+    parser.add_argument('--requests', type=int, default=2000, help="Invoices to render in total")
+    parser.add_argument('--items', type=int, default=3, help="Line items per invoice")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes of the local server")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(args.workers)
+    try:
+        # A short warm-up, so connection setup and first renders are not measured
+        load_test(url, args.clients, args.clients * 4, args.items, args.token)
+        result = load_test(url, args.clients, args.requests, args.items, args.token)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    print(json.dumps(result, indent=2))
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
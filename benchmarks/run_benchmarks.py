@@ -0,0 +1,301 @@
+"""
+Benchmark suite for invoice generation.
+
+Measures generate_invoice latency and throughput for 3, 100 and 10,000 items,
+rendering with generated logos of several sizes and formats, the totals math on
+its own, PDF byte size, peak memory and the Streamlit cold start and rerun
+time. Everything runs offline and the results are written as JSON, so runs on
+two commits can be compared with --compare.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--output results.json] [--quick] [--skip-ui]
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from PIL import Image
+
+from invoice_generator import InvoiceGenerator
+from logo_cache import LogoCache
+from pricing import ItemBatch, compute_totals, price_invoices, price_items
+
+COMPANY_NAME = "ABC123 INC"
+COMPANY_ADDRESS = "123 Broadway\nNew York, NY 10004 \ninvoice@abc123inc.com\n(555) 555-5555"
+NOTES = "Payment is due within 30 days. Please make checks payable to ABC123 INC."
+
+# (item count, timed renders) per render benchmark
+RENDER_SIZES = ((3, 200), (100, 30), (10000, 3))
+QUICK_RENDER_SIZES = ((3, 20), (100, 5), (10000, 1))
+
+# (name, edge length in pixels, format, mode) of the generated logos
+LOGOS = (
+    ('png_rgb_256', 256, 'PNG', 'RGB'),
+    ('png_rgba_1024', 1024, 'PNG', 'RGBA'),
+    ('jpeg_1024', 1024, 'JPEG', 'RGB'),
+    ('jpeg_3000', 3000, 'JPEG', 'RGB'),
+)
+
+UI_ITEM_COUNTS = (10, 100, 1000)
+
+# Relative change reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.10
+
+# Result fields describing the workload rather than measuring it
+WORKLOAD_FIELDS = ('runs', 'lines', 'input_bytes')
+
+
+def make_items(count):
+    """Deterministic mix of hourly and fixed amount lines with a few long descriptions"""
+    items = []
+    for i in range(count):
+        description = f"Consulting work package {i}"
+        if i % 10 == 0:
+            description += " covering discovery workshops, architecture review and implementation support"
+        if i % 7 == 0:
+            items.append({"service_item": f"FIX-{i:05d}", "description": description,
+                          "hours": None, "rate": None, "amount": 250 + i % 100})
+        else:
+            items.append({"service_item": f"SRV-{i:05d}", "description": description,
+                          "hours": 1 + (i % 16) / 4, "rate": 150 + i % 50, "amount": None})
+    return items
+
+
+def make_logo(size, fmt, mode):
+    """Generate a photo-like test logo (gradient plus noise) of the given size"""
+    rng = np.random.default_rng(size)
+    y, x = np.mgrid[0:size, 0:size]
+    pixels = np.stack([x * 255 // size, y * 255 // size, (x + y) * 127 // size], axis=-1)
+    pixels = np.clip(pixels + rng.integers(-20, 20, pixels.shape), 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels, 'RGB')
+    if mode == 'RGBA':
+        alpha = Image.fromarray(((x + y) * 255 // (2 * size)).astype(np.uint8), 'L')
+        image.putalpha(alpha)
+    buffer = BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def render(generator, items, number=0):
+    return generator.generate_invoice(
+        invoice_number=f"INV-{number:05d}",
+        client_name="Acme Corporation",
+        client_address="123 Business Ave\nEnterprise City, CA 90210",
+        client_email="billing@acmecorp.com",
+        items=items,
+        notes=NOTES,
+    )
+
+
+def latency_stats(times):
+    ordered = sorted(times)
+    return {
+        'runs': len(times),
+        'mean_ms': round(statistics.mean(times) * 1000, 3),
+        'median_ms': round(statistics.median(times) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))] * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+    }
+
+
+def peak_memory(function):
+    """Peak Python heap allocation in bytes while calling function"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_render(sizes):
+    generator = InvoiceGenerator(COMPANY_NAME, COMPANY_ADDRESS)
+    results = {}
+    for count, runs in sizes:
+        items = make_items(count)
+        pdf_bytes = render(generator, items)  # warm up the compiled template
+        times = []
+        for number in range(runs):
+            start = time.perf_counter()
+            render(generator, items, number)
+            times.append(time.perf_counter() - start)
+        result = latency_stats(times)
+        result['invoices_per_second'] = round(len(times) / sum(times), 2)
+        result['pdf_bytes'] = len(pdf_bytes)
+        result['peak_memory_bytes'] = peak_memory(lambda: render(generator, items))
+        results[f"items_{count}"] = result
+    return results
+
+
+def bench_logos(runs):
+    items = make_items(3)
+    results = {}
+    for name, size, fmt, mode in LOGOS:
+        data = make_logo(size, fmt, mode)
+        # Cold: decode and normalize the upload, as for a new logo
+        start = time.perf_counter()
+        generator = InvoiceGenerator(COMPANY_NAME, COMPANY_ADDRESS, data, logos=LogoCache())
+        cold = time.perf_counter() - start
+        pdf_bytes = render(generator, items)
+        times = []
+        for number in range(runs):
+            start = time.perf_counter()
+            render(generator, items, number)
+            times.append(time.perf_counter() - start)
+        result = latency_stats(times)
+        result.update({
+            'input_bytes': len(data),
+            'normalize_ms': round(cold * 1000, 3),
+            'logo_bytes': generator.logo.embedded_bytes,
+            'pdf_bytes': len(pdf_bytes),
+            'peak_memory_bytes': peak_memory(
+                lambda: render(InvoiceGenerator(COMPANY_NAME, COMPANY_ADDRESS, data, logos=LogoCache()), items)),
+        })
+        results[name] = result
+    return results
+
+
+def bench_totals(lines):
+    items = make_items(lines)
+    results = {}
+
+    start = time.perf_counter()
+    batch = ItemBatch.from_items(items)
+    results['build_batch_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+    start = time.perf_counter()
+    price_items(batch, 6.0, 5.0)
+    elapsed = time.perf_counter() - start
+    results['price_items_ms'] = round(elapsed * 1000, 3)
+    results['lines_per_second'] = round(lines / elapsed)
+
+    invoices = max(1, lines // 10)
+    start = time.perf_counter()
+    price_invoices(batch, np.arange(lines) % invoices, np.full(invoices, 6.0), np.full(invoices, 5.0))
+    results['price_invoices_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+    start = time.perf_counter()
+    for subtotal in range(0, 1000000, 100):
+        compute_totals(subtotal, 6.0, 5.0)
+    results['compute_totals_us'] = round((time.perf_counter() - start) / 10000 * 1e6, 3)
+    results['lines'] = lines
+    return results
+
+
+def bench_ui(item_counts):
+    from ui_rerun_benchmark import measure, measure_startup
+    results = {}
+    try:
+        startup = measure_startup(reruns=5, timeout=300)
+        results['startup'] = {'cold_start_ms': startup['cold_start_ms'], 'rerun_ms': startup['rerun_ms']}
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        results['startup'] = {'error': str(e)}
+    for count in item_counts:
+        try:
+            first, rerun = measure(count, reruns=3, timeout=120)
+        except RuntimeError as e:
+            results[f"items_{count}"] = {'error': str(e)}
+            continue
+        results[f"items_{count}"] = {'first_run_ms': round(first * 1000, 1), 'rerun_ms': round(rerun * 1000, 1)}
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {}
+    for package in ('fpdf', 'numpy', 'PIL', 'streamlit'):
+        try:
+            versions[package] = getattr(__import__(package), '__version__', None)
+        except ImportError:
+            versions[package] = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'versions': versions,
+    }
+
+
+def _flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in WORKLOAD_FIELDS:
+            flat[name] = value
+    return flat
+
+
+def compare(before_path, after_path):
+    """Print every shared metric of two result files with its relative change"""
+    with open(before_path, 'r', encoding='utf-8') as f:
+        before = _flatten(json.load(f)['results'])
+    with open(after_path, 'r', encoding='utf-8') as f:
+        after = _flatten(json.load(f)['results'])
+    regressions = 0
+    for name in sorted(set(before) & set(after)):
+        old, new = before[name], after[name]
+        change = (new - old) / old if old else 0.0
+        # For throughput a drop is the regression, for everything else a rise
+        higher_is_better = name.endswith('per_second')
+        regressed = change < -REGRESSION_THRESHOLD if higher_is_better else change > REGRESSION_THRESHOLD
+        regressions += regressed
+        marker = '  REGRESSION' if regressed else ''
+        print(f"{name:<45} {old:>14,.3f} {new:>14,.3f} {change:>+8.1%}{marker}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file for the results")
+    parser.add_argument('--quick', action='store_true', help="Fewer repetitions, for a smoke test")
+    parser.add_argument('--skip-ui', action='store_true', help="Skip the Streamlit rerun benchmark")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    results = {}
+    print("Rendering invoices...")
+    results['render'] = bench_render(QUICK_RENDER_SIZES if args.quick else RENDER_SIZES)
+    print("Rendering with logos...")
+    results['logos'] = bench_logos(5 if args.quick else 50)
+    print("Pricing totals...")
+    results['totals'] = bench_totals(100000 if args.quick else 1000000)
+    if not args.skip_ui:
+        print("Measuring Streamlit reruns...")
+        results['ui'] = bench_ui(UI_ITEM_COUNTS)
+
+    report = {'environment': environment(), 'results': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    for name, value in _flatten(results).items():
+        print(f"{name:<45} {value:>14,.3f}")
+    print(f"Results: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""
+Load test of the Streamlit app with many concurrent browser sessions.
+
+Starts `streamlit run invoice.py` on a free local port and connects simulated
+users to it over the same websocket protocol the browser uses. Every user logs
+in, saves the company and client info, edits a line item and generates the
+invoice, polling the render progress fragment like the browser does until the
+download link appears. For each session count a fresh server is started, so
+the memory numbers are not mixed up with the sessions of the previous level.
+
+Reported per level:
+- rerun latency percentiles: a widget change until the script run it triggers finishes
+- render latency percentiles: the Generate click until the download link is shown
+- server RSS before and with all sessions connected, and the growth per session
+- failed sessions (timeouts, exceptions or error messages in the page)
+
+streamlit.testing is not used here: it runs one app at a time per process, so
+it cannot simulate concurrent sessions sharing one server.
+
+Usage:
+    python benchmarks/session_load_test.py [--sessions 1 10 25] [--think 0.2] [--ramp-up 1.0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.runtime.state.common import user_key_from_widget_id
+from tornado.httpclient import HTTPClient, HTTPRequest
+from tornado.websocket import websocket_connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, 'invoice.py')
+
+STARTUP_TIMEOUT = 60
+USERNAME = 'loadtest'
+PASSWORD = 'loadtest'
+
+# Script run outcomes that end a rerun; FINISHED_EARLY_FOR_RERUN is followed by another run
+_RUN_DONE = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)
+_ERROR_ALERT = 1  # Alert.Format.ERROR
+
+
+class SessionError(Exception):
+    pass
+
+
+class SimulatedSession:
+    """
+    One browser tab: keeps the widget ids of the last page it was sent and
+    replays widget values by widget key (or label, for widgets without a key),
+    the way the frontend keeps them by id.
+    """
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.connection = None
+        self.page_script_hash = ''
+        self.widgets = {}
+        self.values = {}
+        self.fragments = {}
+        self.elements = set()
+        self.errors = []
+        # Large messages are sent once and referenced by hash afterwards
+        self.cached_messages = {}
+
+    async def connect(self):
+        self.connection = await websocket_connect(
+            self.url, subprotocols=['streamlit'], connect_timeout=self.timeout, max_message_size=256 * 1024 * 1024)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    def set_value(self, kind, name, field, value):
+        self.values[(kind, name)] = (field, value)
+
+    def widget_name(self, kind, prefix):
+        """Name of the first widget of kind on the page whose name starts with prefix"""
+        for widget_kind, name in self.widgets:
+            if widget_kind == kind and name.startswith(prefix):
+                return name
+        raise SessionError(f"No {kind} {prefix!r}... on the page")
+
+    def _widget_states(self, triggers):
+        states = []
+        for (kind, name), (field, value) in self.values.items():
+            if (kind, name) in self.widgets:
+                states.append({'id': self.widgets[(kind, name)], field: value})
+        for kind, name in triggers:
+            if (kind, name) not in self.widgets:
+                raise SessionError(f"No {kind} {name!r} on the page")
+            states.append({'id': self.widgets[(kind, name)], 'trigger_value': True})
+        return states
+
+    async def rerun(self, triggers=(), fragment_id=None):
+        """Send a rerun with the current widget values and wait for it; returns the seconds taken"""
+        msg = BackMsg()
+        client_state = msg.rerun_script
+        client_state.query_string = ''
+        client_state.page_script_hash = self.page_script_hash
+        if fragment_id:
+            client_state.fragment_id = fragment_id
+        for state in self._widget_states(triggers):
+            widget = client_state.widget_states.widgets.add()
+            for field, value in state.items():
+                setattr(widget, field, value)
+        start = time.perf_counter()
+        await self.connection.write_message(msg.SerializeToString(), binary=True)
+        await asyncio.wait_for(self._read_run(fragment_id is not None), self.timeout)
+        return time.perf_counter() - start
+
+    async def _read_run(self, fragment_run):
+        while True:
+            data = await self.connection.read_message()
+            if data is None:
+                raise SessionError("Server closed the connection")
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            if msg.WhichOneof('type') == 'ref_hash':
+                msg = self.cached_messages[msg.ref_hash]
+            elif msg.hash:
+                self.cached_messages[msg.hash] = msg
+            kind = msg.WhichOneof('type')
+            if kind == 'new_session':
+                # A full script run starts: the frontend drops the widgets and timers of the last one
+                self.page_script_hash = msg.new_session.page_script_hash
+                self.widgets = {}
+                self.fragments = {}
+                self.elements = set()
+                fragment_run = False
+            elif kind == 'delta' and msg.delta.WhichOneof('type') == 'new_element':
+                self._add_element(msg.delta.new_element)
+            elif kind == 'auto_rerun':
+                self.fragments[msg.auto_rerun.fragment_id] = msg.auto_rerun.interval
+            elif kind == 'script_finished' and msg.script_finished in _RUN_DONE:
+                if self.errors:
+                    raise SessionError(self.errors[0])
+                if fragment_run or msg.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                    return
+
+    def _add_element(self, element):
+        kind = element.WhichOneof('type')
+        self.elements.add(kind)
+        widget = getattr(element, kind)
+        if kind == 'markdown' and ' download=' in widget.body:
+            # The PDF download link of the Generate tab
+            self.elements.add('pdf_download')
+        if kind == 'exception':
+            self.errors.append(f"{widget.type}: {widget.message}")
+        elif kind == 'alert' and widget.format == _ERROR_ALERT:
+            self.errors.append(widget.body)
+        elif getattr(widget, 'id', ''):
+            name = user_key_from_widget_id(widget.id) or getattr(widget, 'label', '')
+            self.widgets[(kind, name)] = widget.id
+
+
+async def user_flow(url, number, think, timeout, reruns, renders):
+    """Run one user through login, company, client, items and generate; raises on failure"""
+    session = SimulatedSession(url, timeout)
+    await session.connect()
+    try:
+        reruns.append(await session.rerun())
+        await asyncio.sleep(think)
+
+        session.set_value('text_input', 'Username', 'string_value', USERNAME)
+        session.set_value('text_input', 'Password', 'string_value', PASSWORD)
+        reruns.append(await session.rerun(triggers=[('button', 'FormSubmitter:login_form-Login')]))
+        session.values.clear()
+        await asyncio.sleep(think)
+
+        session.set_value('text_input', 'Company Name', 'string_value', f"Load Test {number} Inc")
+        reruns.append(await session.rerun())
+        reruns.append(await session.rerun(triggers=[('button', 'save_company_info')]))
+        await asyncio.sleep(think)
+
+        session.set_value('text_input', 'Invoice Number', 'string_value', f"LOAD-{os.getpid()}-{number:05d}")
+        session.set_value('text_input', 'Client Name', 'string_value', f"Client {number}")
+        session.set_value('text_input', 'Client Email', 'string_value', "billing@example.com")
+        reruns.append(await session.rerun())
+        reruns.append(await session.rerun(triggers=[('button', 'save_client_info')]))
+        await asyncio.sleep(think)
+
+        # Data editor edits are sent once; applying them recreates the editor under a new id
+        edits = {'edited_rows': {'0': {'hours': 10 + number % 5}}, 'added_rows': [], 'deleted_rows': []}
+        editor = session.widget_name('arrow_data_frame', 'items_editor_')
+        session.set_value('arrow_data_frame', editor, 'string_value', json.dumps(edits))
+        reruns.append(await session.rerun())
+        del session.values[('arrow_data_frame', editor)]
+        await asyncio.sleep(think)
+
+        start = time.perf_counter()
+        reruns.append(await session.rerun(triggers=[('button', 'generate_invoice_button')]))
+        while 'pdf_download' not in session.elements:
+            if not session.fragments:
+                raise SessionError("Generate finished without a download link or a render in progress")
+            fragment_id, interval = next(iter(session.fragments.items()))
+            await asyncio.sleep(interval)
+            await session.rerun(fragment_id=fragment_id)
+            if time.perf_counter() - start > timeout:
+                raise SessionError("Render did not finish in time")
+        renders.append(time.perf_counter() - start)
+    except BaseException:
+        session.close()
+        raise
+    return session
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(data_dir):
+    """Start the app headless on a free port and wait for its health check; returns (process, port)"""
+    port = _free_port()
+    command = [sys.executable, '-m', 'streamlit', 'run', APP_PATH, '--server.headless', 'true',
+               '--server.port', str(port), '--server.address', '127.0.0.1', '--server.enableXsrfProtection', 'false',
+               '--browser.gatherUsageStats', 'false']
+    env = dict(os.environ, USERNAME=USERNAME, PASSWORD=PASSWORD,
+               INVOICE_DB=os.path.join(data_dir, f"invoices-{port}.db"))
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    client = HTTPClient()
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    try:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"streamlit exited with code {process.returncode}")
+            try:
+                client.fetch(HTTPRequest(f"http://127.0.0.1:{port}/_stcore/health", request_timeout=5))
+                return process, port
+            except Exception:
+                time.sleep(0.2)
+    finally:
+        client.close()
+    process.kill()
+    raise RuntimeError("streamlit did not start in time")
+
+
+def rss_bytes(pid):
+    """Resident set size of a process, from /proc (Linux only; None elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _percentiles(seconds):
+    seconds = sorted(seconds)
+    if not seconds:
+        return {}
+
+    def percentile(fraction):
+        return round(seconds[min(len(seconds) - 1, int(fraction * len(seconds)))] * 1000, 2)
+
+    return {'mean_ms': round(statistics.mean(seconds) * 1000, 2), 'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95), 'p99_ms': percentile(0.99), 'max_ms': percentile(1.0)}
+
+
+async def _run_level(url, pid, sessions, think, ramp_up, timeout):
+    # One user first, so imports and process-wide caches are not counted per session
+    warm_up = await user_flow(url, 0, 0, timeout, [], [])
+    warm_up.close()
+    await asyncio.sleep(0.5)
+    baseline = rss_bytes(pid)
+
+    reruns = []
+    renders = []
+
+    async def delayed(number):
+        await asyncio.sleep(ramp_up * (number - 1) / sessions)
+        return await user_flow(url, number, think, timeout, reruns, renders)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(delayed(number) for number in range(1, sessions + 1)), return_exceptions=True)
+    wall_time = time.perf_counter() - start
+    # Measured while every session is still connected and holds its state
+    loaded = rss_bytes(pid)
+    failures = [result for result in results if isinstance(result, BaseException)]
+    for result in results:
+        if not isinstance(result, BaseException):
+            result.close()
+
+    result = {'sessions': sessions, 'failed': len(failures), 'failure_rate': round(len(failures) / sessions, 3),
+              'wall_time_s': round(wall_time, 3), 'reruns': len(reruns), 'rerun': _percentiles(reruns),
+              'renders': len(renders), 'render': _percentiles(renders)}
+    if baseline is not None and loaded is not None:
+        result.update({'rss_baseline_mb': round(baseline / 2**20, 1), 'rss_loaded_mb': round(loaded / 2**20, 1),
+                       'rss_per_session_kb': round((loaded - baseline) / sessions / 1024, 1)})
+    if failures:
+        result['errors'] = sorted({f"{type(e).__name__}: {e}" for e in failures})[:5]
+    return result
+
+
+def run_level(sessions, think, ramp_up, timeout, data_dir):
+    """Start a fresh server, run sessions concurrent users against it; returns the result dictionary"""
+    process, port = start_server(data_dir)
+    try:
+        return asyncio.run(_run_level(f"ws://127.0.0.1:{port}/_stcore/stream", process.pid,
+                                      sessions, think, ramp_up, timeout))
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 25],
+                        help="Concurrent sessions of each level")
+    parser.add_argument('--think', type=float, default=0.2, help="Seconds a user waits between steps")
+    parser.add_argument('--ramp-up', type=float, default=1.0, help="Seconds over which the sessions of a level connect")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds a rerun or render may take")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for sessions in args.sessions:
+            results.append(run_level(sessions, args.think, args.ramp_up, args.timeout, data_dir))
+            print(json.dumps(results[-1]), file=sys.stderr)
+    print(json.dumps(results, indent=2))
+    return 1 if any(result['failed'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Compare per-invoice render cost with and without reusing the compiled template.
+
+Usage:
+    python benchmarks/template_benchmark.py [--invoices 500] [--logo logo.png]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invoice_generator import InvoiceGenerator
+
+COMPANY_NAME = "ABC123 INC"
+COMPANY_ADDRESS = "123 Broadway\nNew York, NY 10004 \ninvoice@abc123inc.com\n(555) 555-5555"
+ITEMS = [
+    {"service_item": "AI-001", "description": "AI Workflow Development", "hours": 12, "rate": 150, "amount": None},
+    {"service_item": "LLM-001", "description": "LLM Systems Integration", "hours": 8, "rate": 175, "amount": None},
+    {"service_item": "CONS-001", "description": "Implementation Consulting", "hours": 8, "rate": 175, "amount": None}
+]
+
+
+def render(generator, number):
+    return generator.generate_invoice(
+        invoice_number=f"INV-{number:05d}",
+        client_name="Acme Corporation",
+        client_address="123 Business Ave\nEnterprise City, CA 90210",
+        client_email="billing@acmecorp.com",
+        items=ITEMS,
+        notes="Payment is due within 30 days. Please make checks payable to ABC123 INC.",
+    )
+
+
+def run(count, logo):
+    # Without reuse every invoice compiles its own template, as a per-call rebuild would
+    start = time.perf_counter()
+    for number in range(count):
+        render(InvoiceGenerator(COMPANY_NAME, COMPANY_ADDRESS, logo), number)
+    uncompiled = (time.perf_counter() - start) / count
+
+    generator = InvoiceGenerator(COMPANY_NAME, COMPANY_ADDRESS, logo)
+    render(generator, 0)  # compile the template outside the timed loop
+    start = time.perf_counter()
+    for number in range(count):
+        render(generator, number)
+    compiled = (time.perf_counter() - start) / count
+    return uncompiled, compiled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=500)
+    parser.add_argument('--logo', help="Logo image to embed (default: asset/logo.png)")
+    args = parser.parse_args()
+
+    logo = None
+    if args.logo:
+        with open(args.logo, 'rb') as f:
+            logo = f.read()
+
+    uncompiled, compiled = run(args.invoices, logo)
+    print(f"Invoices rendered:         {args.invoices}")
+    print(f"Template per invoice:      {uncompiled * 1000:.3f} ms/invoice")
+    print(f"Compiled template reused:  {compiled * 1000:.3f} ms/invoice")
+    print(f"Per-invoice cost drop:     {(1 - compiled / uncompiled) * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Measure Streamlit rerun time of the app for invoices with many line items.
+
+The app is driven headlessly with streamlit.testing, so the numbers cover the
+script run (widget construction, pricing, layout) but not browser rendering.
+With --startup the cold start is measured instead: the first run of the app in
+a fresh interpreter (imports included), the reruns after it, and which of the
+rendering modules the first run loaded.
+
+Usage:
+    python benchmarks/ui_rerun_benchmark.py [--items 10 100 1000] [--reruns 3]
+    python benchmarks/ui_rerun_benchmark.py --startup [--reruns 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest
+
+from models import LineItem
+
+APP_PATH = os.path.join(ROOT, 'invoice.py')
+
+# Modules only needed to render a PDF, which the app should not import before the first render
+RENDER_MODULES = ('fpdf', 'invoice_generator', 'batch')
+
+
+def make_items(count):
+    return [LineItem(f"SRV-{i:04d}", f"Consulting work package {i}", hours=1 + i % 8, rate=150)
+            for i in range(count)]
+
+
+def measure(count, reruns, timeout=600):
+    """Return (first run, median rerun) in seconds for an invoice with count items"""
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.session_state['authenticated'] = True
+    at.session_state['items'] = make_items(count)
+    start = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+    return first, statistics.median(times)
+
+
+def _startup_child(reruns):
+    # Runs in a fresh interpreter, so the first run pays for every import of the app
+    start = time.perf_counter()
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    at.session_state['authenticated'] = True
+    at.run()
+    first = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    loaded = [name for name in RENDER_MODULES if name in sys.modules]
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+    print(json.dumps({'cold_start_ms': round(first * 1000, 1),
+                      'rerun_ms': round(statistics.median(times) * 1000, 1),
+                      'render_modules_loaded': loaded}))
+
+
+def measure_startup(reruns=10, timeout=600):
+    """
+    Return {'cold_start_ms', 'rerun_ms', 'render_modules_loaded'} for the
+    default invoice, measured in a new Python process. The cold start excludes
+    starting Python and importing Streamlit's test harness.
+    """
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--startup-child', '--reruns', str(reruns)],
+                            capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'startup run failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--reruns', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds allowed per script run")
+    parser.add_argument('--startup', action='store_true', help="Measure the cold start in a fresh process")
+    parser.add_argument('--startup-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_child:
+        _startup_child(args.reruns)
+        return
+    if args.startup:
+        try:
+            startup = measure_startup(max(args.reruns, 1), args.timeout)
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"Startup measurement failed: {e}")
+            return
+        print(f"cold start {startup['cold_start_ms']:.1f}ms, rerun {startup['rerun_ms']:.1f}ms")
+        print(f"rendering modules loaded by the first run: {', '.join(startup['render_modules_loaded']) or 'none'}")
+        return
+
+    print(f"{'items':>8} {'first run':>12} {'rerun':>12}")
+    for count in args.items:
+        try:
+            first, rerun = measure(count, args.reruns, args.timeout)
+        except RuntimeError as e:
+            print(f"{count:>8} {'failed':>12} ({e})")
+            continue
+        print(f"{count:>8} {first * 1000:>10.1f}ms {rerun * 1000:>10.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import hashlib
+import re
+import zipfile
+
+BUNDLE_FORMATS = ('zip', 'pdf')
+
+_OBJECT_HEADER = re.compile(rb'(\d+) 0 obj\s*')
+_REFERENCE = re.compile(rb'(\d+) 0 R')
+_PARENT = re.compile(rb'/Parent \d+ 0 R\s*')
+_CONTENTS = re.compile(rb'/Contents (\d+) 0 R')
+_MEDIA_BOX = re.compile(rb'/MediaBox \[[^\]]*\]')
+_KIDS = re.compile(rb'/Kids \[([^\]]*)\]')
+_LENGTH = re.compile(rb'/Length (\d+)')
+_STARTXREF = re.compile(rb'startxref\s+(\d+)\s+%%EOF\s*$')
+_XREF = re.compile(rb'xref\s+0 (\d+)\s+')
+_XREF_ENTRY = re.compile(rb'(\d{10}) \d{5} ([nf])')
+
+
+def _read_objects(data):
+    """
+    Return the objects of a PDF written by invoice_generator.StreamPDF as
+    {number: (dictionary bytes, stream bytes or None)} and the trailer bytes.
+    Only uncompressed cross-reference tables with direct stream lengths are
+    supported, which is what FPDF writes.
+    """
+    start = int(_STARTXREF.search(data).group(1))
+    xref = _XREF.match(data, start)
+    if xref is None:
+        raise ValueError("PDF has no cross-reference table")
+    objects = {}
+    entries = _XREF_ENTRY.finditer(data, xref.end())
+    for number in range(int(xref.group(1))):
+        offset, kind = next(entries).groups()
+        if kind != b'n':
+            continue
+        header = _OBJECT_HEADER.match(data, int(offset))
+        body = header.end()
+        stream_at = data.find(b'\nstream\n', body)
+        end_at = data.find(b'\nendobj', body)
+        if stream_at != -1 and stream_at < end_at:
+            dictionary = data[body:stream_at]
+            stream_start = stream_at + len(b'\nstream\n')
+            length = int(_LENGTH.search(dictionary).group(1))
+            objects[number] = (dictionary, data[stream_start:stream_start + length])
+        else:
+            objects[number] = (data[body:end_at], None)
+    return objects, data[xref.end():]
+
+
+def _text_string(text):
+    """PDF text string literal for a bookmark title"""
+    try:
+        encoded = text.encode('latin-1')
+    except UnicodeEncodeError:
+        encoded = b'\xfe\xff' + text.encode('utf-16-be')
+    encoded = encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)').replace(b'\r', b'\\r')
+    return b'(' + encoded + b')'
+
+
+class ZipBundle:
+    """ZIP archive of invoice PDFs, written one file at a time"""
+
+    extension = 'zip'
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def add(self, path, name, title=None, order=None):
+        """Copy the PDF at path into the archive as name (copied in chunks, never read whole)"""
+        self._zip.write(path, name)
+        self.count += 1
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PDFBundle:
+    """
+    One PDF holding many invoices, with a bookmark per invoice.
+
+    Every added PDF is read, its pages and resources are renumbered and written
+    out at once, so only one invoice is in memory at a time. Resources that are
+    identical in every invoice (fonts, the logo) are written once and shared.
+    The page tree, bookmarks and cross-reference table are written by close();
+    pages are ordered by the order passed to add(), so invoices may be added as
+    they finish rendering.
+    """
+
+    extension = 'pdf'
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'wb')
+        self._position = 0
+        # Object offsets by number; 1 (page tree) and 2 (bookmarks) are written last
+        self._offsets = [0, 0, 0]
+        # Object numbers of shared resources by content digest
+        self._shared = {}
+        # (order, title, page object numbers) per invoice
+        self._invoices = []
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self._file.write(data)
+        self._position += len(data)
+
+    def _write_object(self, dictionary, stream=None, number=None):
+        if number is None:
+            number = len(self._offsets)
+            self._offsets.append(self._position)
+        else:
+            self._offsets[number] = self._position
+        self._write(b'%d 0 obj\n' % number)
+        self._write(dictionary)
+        self._write(b'\n')
+        if stream is not None:
+            self._write(b'stream\n')
+            self._write(stream)
+            self._write(b'\nendstream\n')
+        self._write(b'endobj\n')
+        return number
+
+    def _copy(self, objects, number, numbers, share):
+        """Write an object and everything it references, returning its new number"""
+        if number in numbers:
+            return numbers[number]
+        dictionary, stream = objects[number]
+        for reference in _REFERENCE.findall(dictionary):
+            self._copy(objects, int(reference), numbers, share)
+        dictionary = _REFERENCE.sub(lambda m: b'%d 0 R' % numbers[int(m.group(1))], dictionary)
+        if share:
+            digest = hashlib.sha1(dictionary + b'\0' + (stream or b'')).digest()
+            new_number = self._shared.get(digest)
+            if new_number is None:
+                new_number = self._shared[digest] = self._write_object(dictionary, stream)
+        else:
+            new_number = self._write_object(dictionary, stream)
+        numbers[number] = new_number
+        return new_number
+
+    def _copy_page(self, objects, number, media_box, numbers):
+        dictionary, _ = objects[number]
+        dictionary = _PARENT.sub(b'', dictionary)
+        contents = {int(reference) for reference in _CONTENTS.findall(dictionary)}
+        for reference in _REFERENCE.findall(dictionary):
+            reference = int(reference)
+            self._copy(objects, reference, numbers, share=reference not in contents)
+        dictionary = _REFERENCE.sub(lambda m: b'%d 0 R' % numbers[int(m.group(1))], dictionary)
+        # Pages inherit their size from the page tree of the source document
+        if media_box and not _MEDIA_BOX.search(dictionary):
+            dictionary = dictionary[:2] + media_box + b'\n' + dictionary[2:]
+        dictionary = dictionary[:2] + b'/Parent 1 0 R\n' + dictionary[2:]
+        return self._write_object(dictionary)
+
+    def add(self, path, name=None, title=None, order=None):
+        """Append the pages of the PDF at path, bookmarked as title (defaults to name)"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        objects, trailer = _read_objects(data)
+        del data
+        root = int(re.search(rb'/Root (\d+) 0 R', trailer).group(1))
+        pages = int(re.search(rb'/Pages (\d+) 0 R', objects[root][0]).group(1))
+        page_tree = objects[pages][0]
+        media_box = _MEDIA_BOX.search(page_tree)
+        media_box = media_box.group(0) if media_box else None
+        numbers = {}
+        page_numbers = [self._copy_page(objects, int(kid), media_box, numbers)
+                        for kid in _REFERENCE.findall(_KIDS.search(page_tree).group(1))]
+        self._invoices.append((self.count if order is None else order, title or name or path, page_numbers))
+        self.count += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._invoices.sort(key=lambda invoice: invoice[0])
+        kids = [page for _, _, page_numbers in self._invoices for page in page_numbers]
+        self._write_object(b'<</Type /Pages\n/Kids [%s]\n/Count %d>>' % (
+            b' '.join(b'%d 0 R' % page for page in kids), len(kids)), number=1)
+
+        # Bookmarks get consecutive numbers, so each knows its neighbours in advance
+        first = len(self._offsets)
+        bookmarks = [(title, page_numbers) for _, title, page_numbers in self._invoices if page_numbers]
+        for i, (title, page_numbers) in enumerate(bookmarks):
+            dictionary = b'<</Title %s\n/Parent 2 0 R\n/Dest [%d 0 R /XYZ null null null]' % (
+                _text_string(title), page_numbers[0])
+            if i > 0:
+                dictionary += b'\n/Prev %d 0 R' % (first + i - 1)
+            if i < len(bookmarks) - 1:
+                dictionary += b'\n/Next %d 0 R' % (first + i + 1)
+            self._write_object(dictionary + b'>>')
+        if bookmarks:
+            self._write_object(b'<</Type /Outlines\n/First %d 0 R\n/Last %d 0 R\n/Count %d>>' % (
+                first, first + len(bookmarks) - 1, len(bookmarks)), number=2)
+        else:
+            self._write_object(b'<</Type /Outlines\n/Count 0>>', number=2)
+        catalog = self._write_object(b'<</Type /Catalog\n/Pages 1 0 R\n/Outlines 2 0 R\n/PageMode /UseOutlines>>')
+
+        xref = self._position
+        self._write(b'xref\n0 %d\n0000000000 65535 f \n' % len(self._offsets))
+        for offset in self._offsets[1:]:
+            self._write(b'%010d 00000 n \n' % offset)
+        self._write(b'trailer\n<</Size %d\n/Root %d 0 R>>\nstartxref\n%d\n%%%%EOF\n' % (
+            len(self._offsets), catalog, xref))
+        self._file.close()
+        self._invoices = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_bundle(fmt, path):
+    """Open a ZipBundle ('zip') or PDFBundle ('pdf') writing to path"""
+    if fmt == 'zip':
+        return ZipBundle(path)
+    if fmt == 'pdf':
+        return PDFBundle(path)
+    raise ValueError(f"Unsupported bundle format: {fmt}")
@@ -0,0 +1,140 @@
+import csv
+
+from models import LineItem, parse_number
+
+# Service fields, in CSV column order
+SERVICE_FIELDS = ('code', 'description', 'rate', 'unit')
+
+# Billing units: 'hour' lines bill hours x rate, 'fixed' lines bill the rate as a fixed amount
+UNITS = ('hour', 'fixed')
+DEFAULT_UNIT = 'hour'
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and value.strip() == '')
+
+
+class Service:
+    """One entry of the service catalog: a code with its description, default rate and unit"""
+
+    __slots__ = SERVICE_FIELDS
+
+    def __init__(self, code, description='', rate=None, unit=DEFAULT_UNIT):
+        if _blank(code):
+            raise ValueError("Service is missing 'code'")
+        self.code = str(code).strip()
+        self.description = description or ''
+        self.rate = parse_number(rate, 'rate')
+        self.unit = (unit or DEFAULT_UNIT).strip().lower()
+        if self.unit not in UNITS:
+            raise ValueError(f"'unit' of service {self.code} must be one of {', '.join(UNITS)}, got {unit!r}")
+
+    @property
+    def is_fixed(self):
+        return self.unit == 'fixed'
+
+    def __repr__(self):
+        return f"Service({self.code!r}, {self.description!r}, {self.rate!r}, {self.unit!r})"
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in SERVICE_FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('code'), data.get('description'), data.get('rate'), data.get('unit'))
+
+    def fill(self, item, replace=False):
+        """
+        Item dictionary with this service's code, and its description and rate
+        (or fixed amount) where the item leaves them blank, or always with
+        replace=True. Hours are kept.
+        """
+        filled = {key: value for key, value in item.items() if key != 'code'}
+        filled['service_item'] = self.code
+        if replace or _blank(filled.get('description')):
+            filled['description'] = self.description
+        if replace or (_blank(filled.get('rate')) and _blank(filled.get('amount'))):
+            if self.is_fixed:
+                filled['amount'] = self.rate
+                filled['hours'] = filled['rate'] = None
+            else:
+                filled['rate'] = self.rate
+                filled['amount'] = None
+        return filled
+
+    def line_item(self, hours=1.0):
+        """New LineItem billing this service"""
+        if self.is_fixed:
+            return LineItem(self.code, self.description, amount=self.rate or 0.0)
+        return LineItem(self.code, self.description, hours=hours, rate=self.rate)
+
+
+class ServiceCatalog:
+    """
+    Services indexed by code, so resolving a line costs one dictionary lookup.
+
+    Codes are matched ignoring case and surrounding spaces. Adding a service
+    with a code already in the catalog replaces it.
+    """
+
+    def __init__(self, services=()):
+        self._services = {}
+        for service in services:
+            self.add(service)
+
+    @staticmethod
+    def _key(code):
+        return str(code).strip().casefold()
+
+    def add(self, service):
+        self._services[self._key(service.code)] = service
+
+    def get(self, code):
+        """The Service with code, or None"""
+        if _blank(code):
+            return None
+        return self._services.get(self._key(code))
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __len__(self):
+        return len(self._services)
+
+    def __iter__(self):
+        return iter(self._services.values())
+
+    def resolve(self, item):
+        """
+        Fill the blanks of an item dictionary from the service named by its
+        'code', or by its 'service_item' when that is a catalog code. Other
+        items, and LineItems, are returned unchanged.
+
+        Raises ValueError for a 'code' that is not in the catalog.
+        """
+        if isinstance(item, LineItem):
+            return item
+        code = item.get('code')
+        if _blank(code):
+            service = self.get(item.get('service_item'))
+            return service.fill(item) if service is not None else item
+        service = self.get(code)
+        if service is None:
+            raise ValueError(f"Unknown service code {str(code).strip()!r}")
+        return service.fill(item)
+
+    def resolve_record(self, record):
+        """Copy of an invoice record dictionary with every item resolved"""
+        resolved = dict(record)
+        resolved['items'] = [self.resolve(item) for item in record.get('items') or ()]
+        return resolved
+
+
+def read_catalog_csv(path):
+    """Load a ServiceCatalog from a CSV file with code, description, rate and unit columns"""
+    catalog = ServiceCatalog()
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            if not _blank(row.get('code')):
+                catalog.add(Service.from_dict(row))
+    return catalog
@@ -0,0 +1,159 @@
+import bisect
+import csv
+import heapq
+import threading
+from array import array
+from collections import defaultdict
+
+# Accepted CSV column names for each client field, in order of preference
+CSV_COLUMNS = {
+    'name': ('client_name', 'name'),
+    'address': ('client_address', 'address'),
+    'email': ('client_email', 'email'),
+}
+
+
+class Client:
+    """Name, address and email of one client of the directory"""
+
+    __slots__ = ('name', 'address', 'email')
+
+    def __init__(self, name, address='', email=''):
+        self.name = name
+        self.address = address or ''
+        self.email = email or ''
+
+    def __repr__(self):
+        return f"Client({self.name!r}, {self.address!r}, {self.email!r})"
+
+    def to_dict(self):
+        return {'client_name': self.name, 'client_address': self.address, 'client_email': self.email}
+
+
+def _column(row, field):
+    for column in CSV_COLUMNS[field]:
+        value = row.get(column)
+        if value:
+            return value.strip()
+    return ''
+
+
+def read_clients_csv(path):
+    """Yield Clients from a CSV file with client_name (or name), client_address and client_email columns"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            name = _column(row, 'name')
+            if name:
+                yield Client(name, _column(row, 'address'), _column(row, 'email'))
+
+
+def _trigrams(key):
+    """Distinct three-character substrings of a casefolded name"""
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+class ClientDirectory:
+    """
+    Searchable list of clients for autocompletion.
+
+    The clients come from sources, callables returning an iterable of Clients
+    (e.g. read_clients_csv or InvoiceStore.clients); they are read and indexed
+    on the first search, not when the directory is created. Names are kept
+    sorted for prefix lookups by bisection, and every three-character piece of
+    a name points to the clients containing it, so a search for a word in the
+    middle of a name only looks at the few clients sharing all its pieces.
+    Matching ignores case.
+    """
+
+    def __init__(self, sources=()):
+        self._sources = list(sources)
+        self._clients = None
+        self._lock = threading.Lock()
+
+    def _ensure_index(self):
+        if self._clients is not None:
+            return
+        with self._lock:
+            if self._clients is not None:
+                return
+            self._clients = []
+            self._folded = []
+            self._positions = {}
+            self._keys = []
+            self._ids = []
+            self._trigram_ids = defaultdict(lambda: array('I'))
+            for source in self._sources:
+                try:
+                    for client in source():
+                        self._add(client)
+                except Exception as e:
+                    print(f"Error loading clients: {e}")
+            # Sorted once here; clients added later are inserted in place
+            order = sorted(range(len(self._clients)), key=self._folded.__getitem__)
+            self._keys = [self._folded[i] for i in order]
+            self._ids = order
+
+    def _add(self, client, keep_sorted=False):
+        # Caller holds the lock (or is building the index)
+        identity = (client.name.casefold(), client.email.casefold())
+        position = self._positions.get(identity)
+        if position is not None:
+            # Later sources (and later saves) update the address of a known client
+            self._clients[position] = client
+            return
+        position = self._positions[identity] = len(self._clients)
+        self._clients.append(client)
+        key = identity[0]
+        self._folded.append(key)
+        if keep_sorted:
+            index = bisect.bisect_right(self._keys, key)
+            self._keys.insert(index, key)
+            self._ids.insert(index, position)
+        for trigram in _trigrams(key):
+            self._trigram_ids[trigram].append(position)
+
+    def add(self, name, address='', email=''):
+        """Add or update a client, e.g. after an invoice for a new client was saved"""
+        if not name:
+            return
+        with self._lock:
+            # Before the first search the client is picked up from the sources instead
+            if self._clients is not None:
+                self._add(Client(name, address, email), keep_sorted=True)
+
+    def __len__(self):
+        self._ensure_index()
+        return len(self._clients)
+
+    def search(self, query, limit=10):
+        """
+        Up to limit Clients matching query, best first: names starting with
+        query in alphabetical order, then names containing it elsewhere.
+        """
+        self._ensure_index()
+        key = (query or '').strip().casefold()
+        if not key:
+            return []
+        with self._lock:
+            matches = []
+            index = bisect.bisect_left(self._keys, key)
+            while index < len(self._keys) and len(matches) < limit and self._keys[index].startswith(key):
+                matches.append(self._ids[index])
+                index += 1
+
+            if len(matches) < limit and len(key) >= 3:
+                # Clients whose name has every trigram of the query, checked for the whole query
+                postings = sorted((self._trigram_ids.get(trigram, ()) for trigram in _trigrams(key)), key=len)
+                candidates = postings[0]
+                if len(postings) > 1 and len(candidates) > limit:
+                    candidates = set(candidates)
+                    for posting in postings[1:]:
+                        if not candidates:
+                            break
+                        candidates.intersection_update(posting)
+                # Every name starting with the query is already in matches
+                folded = self._folded
+                contained = ((folded[position].find(key), folded[position], position) for position in candidates)
+                best = heapq.nsmallest(limit - len(matches), (match for match in contained if match[0] > 0))
+                matches.extend(position for _, _, position in best)
+            return [self._clients[position] for position in matches]
@@ -0,0 +1,294 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+import warnings
+import zlib
+from collections import OrderedDict
+
+from fpdf.ttfonts import TTFontFile
+
+# Built-in PDF font, limited to latin-1 text
+CORE_FAMILY = 'helvetica'
+# Family name the TrueType fonts are registered under
+TRUETYPE_FAMILY = 'invoicesans'
+
+# Environment variables naming the TrueType files for regular, bold and italic text
+FONT_ENV = {'': 'INVOICE_FONT', 'B': 'INVOICE_FONT_BOLD', 'I': 'INVOICE_FONT_ITALIC'}
+
+# Fonts looked for when INVOICE_FONT is not set; they are only used for
+# invoices with text that Helvetica cannot show
+DEFAULT_FONT_FILES = {'': 'DejaVuSans.ttf', 'B': 'DejaVuSans-Bold.ttf', 'I': 'DejaVuSans-Oblique.ttf'}
+FONT_DIRS = (
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'asset', 'fonts'),
+    '/usr/share/fonts/truetype/dejavu',
+    '/usr/share/fonts/dejavu',
+    '/usr/share/fonts/TTF',
+)
+
+# Maps the CIDs written by FPDF (UTF-16 code units) back to Unicode for text extraction
+TO_UNICODE_CMAP = (
+    "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+    "/CIDSystemInfo\n<</Registry (Adobe)\n/Ordering (UCS)\n/Supplement 0\n>> def\n"
+    "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+    "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+    "1 beginbfrange\n<0000> <FFFF> <0000>\nendbfrange\n"
+    "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend"
+)
+
+# Punctuation commonly pasted from word processors, mapped to latin-1
+_LATIN1_REPLACEMENTS = str.maketrans({
+    '\u2018': "'", '\u2019': "'", '\u201a': "'", '\u201b': "'",
+    '\u201c': '"', '\u201d': '"', '\u201e': '"', '\u201f': '"',
+    '\u2013': '-', '\u2014': '-', '\u2212': '-', '\u2022': '*',
+    '\u2026': '...', '\u20ac': 'EUR', '\u2122': '(TM)', '\u202f': ' ',
+})
+
+
+def needs_unicode(text):
+    """Whether text has characters outside latin-1, which the core fonts cannot show"""
+    if not text or text.isascii():
+        return False
+    try:
+        text.encode('latin-1')
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+def latin1_text(text):
+    """
+    Make text printable with the core fonts: smart quotes and dashes become
+    their ASCII forms, accents are kept where latin-1 has the letter or dropped
+    otherwise, and anything else becomes '?'.
+    """
+    if not needs_unicode(text):
+        return text
+    characters = []
+    for character in text.translate(_LATIN1_REPLACEMENTS):
+        if ord(character) < 256:
+            characters.append(character)
+            continue
+        decomposed = unicodedata.normalize('NFKD', character)
+        base = ''.join(c for c in decomposed if ord(c) < 256 and not unicodedata.combining(c))
+        characters.append(base or '?')
+    return ''.join(characters)
+
+
+def bmp_text(text):
+    """Replace characters outside the Basic Multilingual Plane (emoji), which FPDF cannot encode"""
+    if text.isascii() or max(text) <= '\uffff':
+        return text
+    return ''.join(c if c <= '\uffff' else '\ufffd' for c in text)
+
+
+class TrueTypeFont:
+    """
+    Metrics of one TrueType file, parsed once per process.
+
+    subset() builds the font program holding only the given characters and
+    keeps the most recent results, so invoices using the same characters (the
+    usual case in a batch) share one subset instead of each re-reading the
+    font file.
+    """
+
+    SUBSET_CACHE_SIZE = 64
+
+    def __init__(self, path):
+        ttf = TTFontFile()
+        with warnings.catch_warnings():
+            # FPDF warns about cmap entries it skips, which common fonts such as DejaVu have
+            warnings.simplefilter('ignore', UserWarning)
+            ttf.getMetrics(path)
+        self.path = path
+        self.name = re.sub('[ ()]', '', ttf.fullName)
+        self.desc = {
+            'Ascent': int(round(ttf.ascent)),
+            'Descent': int(round(ttf.descent)),
+            'CapHeight': int(round(ttf.capHeight)),
+            'Flags': (ttf.flags | 4) & ~32,
+            'FontBBox': "[%d %d %d %d]" % tuple(int(round(value)) for value in ttf.bbox),
+            'ItalicAngle': int(ttf.italicAngle),
+            'StemV': int(round(ttf.stemV)),
+            'MissingWidth': int(round(ttf.defaultWidth)),
+        }
+        self.up = round(ttf.underlinePosition)
+        self.ut = round(ttf.underlineThickness)
+        self.cw = ttf.charWidths
+        self._subsets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fpdf_font(self, number):
+        """Entry for FPDF.fonts; the characters drawn are collected in its 'subset'"""
+        return {
+            'i': number, 'type': 'TTF', 'name': self.name, 'desc': self.desc,
+            'up': self.up, 'ut': self.ut, 'cw': self.cw, 'ttffile': self.path,
+            'subset': GlyphSet(), 'unifilename': None, 'truetype': self,
+        }
+
+    def subset(self, codes):
+        """
+        Return (subset font name, compressed font program, its uncompressed
+        length, compressed CIDToGIDMap, /W widths array) for the given code points.
+        """
+        key = frozenset(code for code in codes if 0 < code <= 0xFFFF)
+        with self._lock:
+            subset = self._subsets.get(key)
+            if subset is not None:
+                self._subsets.move_to_end(key)
+                return subset
+
+        ttf = TTFontFile()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            program = ttf.makeSubset(self.path, sorted(key))
+        cid_to_gid = bytearray(256 * 256 * 2)
+        for code, glyph in ttf.codeToGlyph.items():
+            cid_to_gid[code * 2] = glyph >> 8
+            cid_to_gid[code * 2 + 1] = glyph & 0xFF
+        # Subsets of the same font get distinct tags, as viewers may merge equally named fonts
+        tag = ''.join(chr(65 + byte % 26) for byte in hashlib.md5(program).digest()[:6])
+        subset = (f"{tag}+{self.name}", zlib.compress(program), len(program),
+                  zlib.compress(bytes(cid_to_gid)), self._widths(key))
+
+        with self._lock:
+            self._subsets[key] = subset
+            while len(self._subsets) > self.SUBSET_CACHE_SIZE:
+                self._subsets.popitem(last=False)
+        return subset
+
+    def _widths(self, codes):
+        # Runs of consecutive characters share one entry: start [w1 w2 ...]
+        runs = []
+        for code in sorted(codes):
+            width = self.cw[code] if code < len(self.cw) else 0
+            if not width or width == 65535:
+                continue
+            if runs and runs[-1][0] + len(runs[-1][1]) == code:
+                runs[-1][1].append(width)
+            else:
+                runs.append((code, [width]))
+        return '[' + ' '.join('%d [%s]' % (start, ' '.join(map(str, widths))) for start, widths in runs) + ']'
+
+
+class GlyphSet(set):
+    """Characters used with a TrueType font; FPDF appends every character it draws"""
+
+    append = set.add
+
+
+_fonts = None
+_fonts_lock = threading.Lock()
+
+
+def _find_font_file(style):
+    path = os.getenv(FONT_ENV[style])
+    if path:
+        return path
+    if os.getenv(FONT_ENV['']):
+        return None
+    for directory in FONT_DIRS:
+        path = os.path.join(directory, DEFAULT_FONT_FILES[style])
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def truetype_fonts():
+    """
+    Return the TrueType fonts as {style: TrueTypeFont}, or {} when no font file
+    is available. Styles without their own file use the regular font. Fonts are
+    loaded on first use and shared by the whole process.
+    """
+    global _fonts
+    if _fonts is not None:
+        return _fonts
+    with _fonts_lock:
+        if _fonts is None:
+            fonts = {}
+            regular = _find_font_file('')
+            if regular:
+                try:
+                    loaded = {}
+                    for style in FONT_ENV:
+                        path = _find_font_file(style) or regular
+                        if path not in loaded:
+                            loaded[path] = TrueTypeFont(path)
+                        fonts[style] = loaded[path]
+                except Exception as e:
+                    print(f"Error loading TrueType font: {e}")
+                    fonts = {}
+            _fonts = fonts
+    return _fonts
+
+
+def truetype_always():
+    """Whether the TrueType font is used for every invoice (INVOICE_FONT is set)"""
+    return bool(os.getenv(FONT_ENV['']))
+
+
+def fonts_key():
+    """Identity of the font configuration, for render cache keys"""
+    fonts = truetype_fonts()
+    files = sorted((style, font.path, os.path.getsize(font.path)) for style, font in fonts.items())
+    return [truetype_always(), files]
+
+
+def choose_family(texts, unknown=False):
+    """
+    Font family for the given texts: the TrueType font when INVOICE_FONT is set
+    or when a text needs it and a font is available, otherwise Helvetica. Pass
+    unknown=True when part of the text cannot be checked in advance.
+    """
+    if not truetype_fonts():
+        return CORE_FAMILY
+    if truetype_always() or unknown or any(needs_unicode(text) for text in texts if text):
+        return TRUETYPE_FAMILY
+    return CORE_FAMILY
+
+
+def register_fonts(pdf, styles):
+    """Register the core font and, when available, the TrueType font in the given styles with pdf"""
+    for style in styles:
+        pdf.set_font(CORE_FAMILY, style, 10)
+    for style, font in sorted(truetype_fonts().items()):
+        if style in styles:
+            pdf.fonts[TRUETYPE_FAMILY + style] = font.fpdf_font(len(pdf.fonts) + 1)
+
+
+def put_truetype_font(pdf, font):
+    """Write a TrueType font entry of pdf.fonts as a subset Type0 font (the objects FPDF would write)"""
+    name, program, length, cid_to_gid, widths = font['truetype'].subset(font['subset'])
+    first = pdf.n + 1
+    font['n'] = first
+    pdf._newobj()
+    pdf._out('<</Type /Font /Subtype /Type0 /BaseFont /%s /Encoding /Identity-H '
+             '/DescendantFonts [%d 0 R] /ToUnicode %d 0 R>>' % (name, first + 1, first + 2))
+    pdf._out('endobj')
+    pdf._newobj()
+    default_width = font['desc']['MissingWidth']
+    pdf._out('<</Type /Font /Subtype /CIDFontType2 /BaseFont /%s /CIDSystemInfo %d 0 R /FontDescriptor %d 0 R%s '
+             '/W %s /CIDToGIDMap %d 0 R>>' % (name, first + 3, first + 4,
+                                               ' /DW %d' % default_width if default_width else '',
+                                               widths, first + 5))
+    pdf._out('endobj')
+    pdf._newobj()
+    pdf._out('<</Length %d>>' % len(TO_UNICODE_CMAP))
+    pdf._putstream(TO_UNICODE_CMAP)
+    pdf._out('endobj')
+    pdf._newobj()
+    pdf._out('<</Registry (Adobe) /Ordering (UCS) /Supplement 0>>')
+    pdf._out('endobj')
+    pdf._newobj()
+    pdf._out('<</Type /FontDescriptor /FontName /%s %s /FontFile2 %d 0 R>>' % (
+        name, ' '.join('/%s %s' % item for item in font['desc'].items()), first + 6))
+    pdf._out('endobj')
+    pdf._newobj()
+    pdf._out('<</Length %d /Filter /FlateDecode>>' % len(cid_to_gid))
+    pdf._putstream(cid_to_gid)
+    pdf._out('endobj')
+    pdf._newobj()
+    pdf._out('<</Length %d /Filter /FlateDecode /Length1 %d>>' % (len(program), length))
+    pdf._putstream(program)
+    pdf._out('endobj')
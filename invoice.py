@@ -1,920 +1,1212 @@
-import streamlit as st
-import streamlit.components.v1 as components
-from fpdf import FPDF
-import os
-import tempfile
-import webbrowser
-from datetime import datetime, timedelta
-import urllib.request
-import uuid
-import base64
-from io import BytesIO
-import requests
-from PIL import Image
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-def check_authentication():
-    """Check if user is authenticated"""
-    if 'authenticated' not in st.session_state:
-        st.session_state.authenticated = False
-    
-    if not st.session_state.authenticated:
-        # Add home button in upper left corner
-        col1, col2, col3 = st.columns([1, 1, 1])
-        with col1:
-            st.markdown("""
-            <div style='text-align: left; margin-bottom: 20px;'>
-                <a href='https://jmartin.consulting/' target='_blank' style='text-decoration: none;'>
-                    <button style='background-color: #000000; color: white; border: none; padding: 8px 16px; border-radius: 4px; cursor: pointer; font-size: 14px;'>
-                        Home
-                    </button>
-                </a>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        st.title("Invoice Generator Login")
-        
-        # Create login form at the top
-        # Create columns to control width and alignment
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col1:
-            with st.form("login_form"):
-                username = st.text_input("Username")
-                password = st.text_input("Password", type="password")
-                submit_button = st.form_submit_button("Login")
-            
-            if submit_button:
-                # Prevent double-clicking by checking if already processing
-                if 'login_processing' not in st.session_state:
-                    st.session_state.login_processing = True
-                    
-                    correct_username = os.getenv('USERNAME')
-                    correct_password = os.getenv('PASSWORD')
-                    if username == correct_username and password == correct_password:
-                        st.session_state.authenticated = True
-                        st.success("Login successful! Redirecting...")
-                        # Clear processing flag and rerun
-                        del st.session_state.login_processing
-                        st.rerun()
-                    else:
-                        st.error("Invalid username or password. Please try again.")
-                        # Clear processing flag
-                        del st.session_state.login_processing
-        
-        # Add HubSpot form below the login form
-        st.markdown("---")
-        st.markdown("### Get Access Credentials")
-        st.markdown("Enter your contact information below to receive your username and password for accessing the Invoice Generator:")
-        
-        # HubSpot form - using components.html for better JavaScript support
-        components.html("""
-        <div style="width: 80%; max-width: 360px; margin: 0; padding: 30px; border: 2px solid #ddd; border-radius: 12px; background-color: #FFFFFF;">
-            <script src="https://js-na2.hsforms.net/forms/embed/242871477.js" defer></script>
-            <div class="hs-form-frame" data-region="na2" data-form-id="22ac7aab-b257-4485-a306-965a060bcc27" data-portal-id="242871477"></div>
-        </div>
-        """, height=600)
-        
-        st.markdown("---")
-        
-        # App information section
-        st.markdown("""
-            ### About Invoice Generator
-            **Invoice Generator** is a Streamlit web application that allows users to easily create professional PDF invoices for clients.
-            
-            ### Features
-            - Create customized invoices with your company information
-            - Add client details and multiple service items
-            - Customize tax rates and discounts
-            - Add custom notes to invoices
-            - Upload your company logo or use the default
-            - Preview and download generated invoices as PDF
-            
-            ### How to Use
-            Once logged in, follow these steps to create an invoice:
-            1. **Company Info tab**: Enter your company details and upload a logo if needed
-            2. **Client Info tab**: Add client information and invoice number
-            3. **Invoice Items tab**: Add service items with descriptions, hours, and rates
-            4. **Notes & Options tab**: Customize invoice notes, tax rate, and discount
-            5. **Generate Invoice tab**: Generate the invoice, preview it, and download as PDF
-            
-            ### Project Information
-            - **Repository**: [GitHub - Jules04711/invoice-generator](https://github.com/Jules04711/invoice-generator)
-            - **License**: MIT License - Open source and available for personal and commercial use
-            - **Requirements**: Python 3.7+, Streamlit, FPDF, Pillow, Requests
-            
-            ---
-            """)
-        
-        # Legal disclaimer footer
-        st.markdown("---")
-        st.markdown("""
-        <div style='text-align: center; font-size: 12px; color: #666; margin-top: 20px;'>
-            <p><strong>Legal Disclaimer:</strong> This application is provided for general informational purposes only. 
-            All information is provided in good faith; however, we make no representation or warranty of any kind regarding 
-            the accuracy, adequacy, validity, reliability, availability, or completeness of any information presented. 
-            Your use of this application is solely at your own risk. 
-            <a href='https://jmartin.consulting/disclaimer/' target='_blank'><br>View full legal disclaimer</a></p>
-            <p style='margin-top: 10px;'>© 2025 J. Martin Consulting LLC. All rights reserved.</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.stop()
-    
-    return True
-
-class InvoiceGenerator:
-    def __init__(self, company_name, company_address, logo=None):
-        self.company_name = company_name
-        self.company_address = company_address
-        self.logo_path = None
-        
-        # Create a temporary file for the logo
-        temp_dir = tempfile.gettempdir()
-        self.logo_path = os.path.join(temp_dir, f"logo_{uuid.uuid4()}.png")
-        
-        # If custom logo is provided, use it
-        if logo is not None:
-            try:
-                # Convert the uploaded image to PNG format
-                image = Image.open(BytesIO(logo.getvalue()))
-                # Convert to RGB if needed (handling RGBA or other formats)
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                # Save as PNG explicitly with proper format
-                image_bytes = BytesIO()
-                image.save(image_bytes, format='PNG')
-                # Save the processed image to the temporary file
-                with open(self.logo_path, "wb") as f:
-                    f.write(image_bytes.getvalue())
-            except Exception as e:
-                print(f"Error processing logo: {e}")
-                self.logo_path = None
-        else:
-            # Use default logo from the asset folder
-            try:
-                # Save default logo to the temporary file
-                with open(self.logo_path, "wb") as f:
-                    with open('asset/logo.png', 'rb') as default_logo:
-                        f.write(default_logo.read())
-            except Exception as e:
-                # If default logo file doesn't exist, use a fallback method
-                print(f"Error loading default logo: {e}")
-                self.logo_path = None
-    
-    def generate_invoice(self, invoice_number, client_name, client_address, client_email, 
-                         items, notes=None, tax_rate=6.0, discount=0.0, invoice_date=None, due_date=None,
-                         services_heading="Services", column_names=None):
-        """
-        Generate a PDF invoice
-        
-        Parameters:
-        - invoice_number: Invoice identifier
-        - client_name: Name of the client
-        - client_address: Address of the client
-        - client_email: Email of the client
-        - items: List of dictionaries with keys 'service_item', 'description', 'hours', 'rate'
-        - notes: Additional notes to include on the invoice
-        - tax_rate: Tax rate percentage
-        - discount: Discount percentage
-        - invoice_date: Invoice date (datetime.date object)
-        - due_date: Due date (datetime.date object)
-        - services_heading: Custom heading for the services section
-        - column_names: Dictionary of custom column names {'service_item', 'description', 'hours', 'rate', 'amount'}
-        
-        Returns:
-        - PDF bytes
-        """
-        # Create PDF object
-        pdf = FPDF(orientation='P', unit='mm', format='A4')
-        pdf.add_page()
-        
-        # Set default column names if not provided
-        if column_names is None:
-            column_names = {
-                'service_item': 'Service Item',
-                'description': 'Description',
-                'hours': 'Hours',
-                'rate': 'Rate ($)',
-                'amount': 'Amount ($)'
-            }
-        
-        # Set font
-        pdf.set_font('helvetica', '', 10)
-        
-        # Colors
-        teal_color = (0, 156, 166)
-        dark_blue = (0, 51, 102)
-        light_gray = (240, 240, 240)
-        
-        # Add logo if available
-        if self.logo_path:
-            pdf.image(self.logo_path, x=10, y=10, w=30)
-        
-        # Company information - positioned to the right of the logo
-        pdf.set_xy(45, 10)  # Set position after the logo
-        pdf.set_font('helvetica', 'B', 16)
-        pdf.set_text_color(*dark_blue)
-        pdf.cell(0, 10, self.company_name, ln=True)
-        
-        pdf.set_x(45)  # Keep the x position for address lines
-        pdf.set_font('helvetica', '', 10)
-        pdf.set_text_color(80, 80, 80)
-        for line in self.company_address.split('\n'):
-            pdf.set_x(45)  # Reset x position before each line
-            pdf.cell(0, 5, line, ln=True)
-        
-        # Invoice title and details
-        pdf.ln(10)
-        pdf.set_fill_color(*teal_color)
-        pdf.set_text_color(255, 255, 255)
-        pdf.set_font('helvetica', 'B', 14)
-        pdf.cell(0, 10, 'INVOICE', ln=True, fill=True)
-        
-        # Invoice details
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_font('helvetica', 'B', 10)
-        
-        # Current date and due date (30 days from now)
-        if invoice_date:
-            current_date = invoice_date.strftime('%Y-%m-%d')
-        else:
-            current_date = datetime.now().strftime('%Y-%m-%d')
-        
-        if due_date:
-            due_date_str = due_date.strftime('%Y-%m-%d')
-        else:
-            due_date_str = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
-        
-        pdf.ln(5)
-        pdf.cell(30, 7, 'Invoice #:', 0)
-        pdf.set_font('helvetica', '', 10)
-        pdf.cell(0, 7, invoice_number, ln=True)
-        
-        pdf.set_font('helvetica', 'B', 10)
-        pdf.cell(30, 7, 'Date:', 0)
-        pdf.set_font('helvetica', '', 10)
-        pdf.cell(0, 7, current_date, ln=True)
-        
-        pdf.set_font('helvetica', 'B', 10)
-        pdf.cell(30, 7, 'Due Date:', 0)
-        pdf.set_font('helvetica', '', 10)
-        pdf.cell(0, 7, due_date_str, ln=True)
-        
-        # Client information
-        pdf.ln(10)
-        pdf.set_font('helvetica', 'B', 12)
-        pdf.cell(0, 7, 'Bill To:', ln=True)
-        
-        pdf.set_font('helvetica', 'B', 10)
-        pdf.cell(0, 7, client_name, ln=True)
-        
-        pdf.set_font('helvetica', '', 10)
-        for line in client_address.split('\n'):
-            pdf.cell(0, 5, line, ln=True)
-        
-        pdf.cell(0, 5, client_email, ln=True)
-        
-        # Services table
-        pdf.ln(10)
-        pdf.set_font('helvetica', 'B', 12)
-        pdf.cell(0, 7, services_heading, ln=True)
-        
-        # Table header
-        pdf.set_fill_color(*light_gray)
-        pdf.set_font('helvetica', 'B', 10)
-        pdf.cell(25, 7, column_names['service_item'], 1, 0, 'L', True)
-        pdf.cell(65, 7, column_names['description'], 1, 0, 'L', True)
-        pdf.cell(30, 7, column_names['hours'], 1, 0, 'R', True)
-        pdf.cell(30, 7, column_names['rate'], 1, 0, 'R', True)
-        pdf.cell(40, 7, column_names['amount'], 1, 1, 'R', True)
-        
-        # Table content
-        pdf.set_font('helvetica', '', 10)
-        subtotal = 0.0
-        
-        for item in items:
-            service_item = item.get('service_item', '')
-            description = item['description']
-            
-            # Check if it's a fixed amount item or hours/rate calculation
-            if item.get('amount') is not None:
-                amount = float(item['amount'])
-                hours_display = 'N/A'
-                rate_display = 'N/A'
-            else:
-                hours = float(item['hours'])
-                rate = float(item['rate'])
-                amount = hours * rate
-                hours_display = f"{hours:.2f}"
-                rate_display = f"{rate:.2f}"
-                
-            subtotal += amount
-            
-            pdf.cell(25, 7, service_item, 1)
-            pdf.cell(65, 7, description, 1)
-            pdf.cell(30, 7, hours_display, 1, 0, 'R')
-            pdf.cell(30, 7, rate_display, 1, 0, 'R')
-            pdf.cell(40, 7, f"{amount:,.2f}", 1, 1, 'R')
-        
-        # Calculate tax and total
-        tax_rate = float(tax_rate)
-        discount_rate = float(discount)
-        discount_amount = subtotal * (discount_rate / 100)
-        discounted_subtotal = subtotal - discount_amount
-        tax = discounted_subtotal * (tax_rate / 100)
-        total = discounted_subtotal + tax
-        
-        # Totals
-        pdf.ln(5)
-        pdf.set_x(120)  # Position closer to the right margin
-        pdf.set_font('helvetica', 'B', 10)
-        pdf.cell(30, 7, 'Subtotal:', 0, 0, 'R')
-        pdf.set_font('helvetica', '', 10)
-        pdf.cell(40, 7, f"${subtotal:,.2f}", 0, 1, 'R')
-        
-        if discount_rate > 0:
-            pdf.set_x(120)  # Position closer to the right margin
-            pdf.set_font('helvetica', 'B', 10)
-            pdf.cell(30, 7, f'Discount ({discount_rate}%):', 0, 0, 'R')
-            pdf.set_font('helvetica', '', 10)
-            pdf.cell(40, 7, f"-${discount_amount:,.2f}", 0, 1, 'R')
-            
-            pdf.set_x(120)  # Position closer to the right margin
-            pdf.set_font('helvetica', 'B', 10)
-            pdf.cell(30, 7, 'Subtotal after discount:', 0, 0, 'R')
-            pdf.set_font('helvetica', '', 10)
-            pdf.cell(40, 7, f"${discounted_subtotal:,.2f}", 0, 1, 'R')
-        
-        pdf.set_x(120)  # Position closer to the right margin
-        pdf.set_font('helvetica', 'B', 10)
-        pdf.cell(30, 7, f'Tax ({tax_rate}%):', 0, 0, 'R')
-        pdf.set_font('helvetica', '', 10)
-        pdf.cell(40, 7, f"${tax:,.2f}", 0, 1, 'R')
-        
-        pdf.set_draw_color(200, 200, 200)
-        pdf.line(120, pdf.get_y(), 190, pdf.get_y())
-        
-        pdf.set_x(120)  # Position closer to the right margin
-        pdf.set_font('helvetica', 'B', 12)
-        pdf.cell(30, 10, 'Total:', 0, 0, 'R')
-        pdf.cell(40, 10, f"${total:,.2f}", 0, 1, 'R')
-        
-        # Notes
-        if notes:
-            pdf.ln(10)
-            pdf.set_font('helvetica', 'B', 10)
-            pdf.cell(0, 7, 'Notes:', ln=True)
-            pdf.set_font('helvetica', '', 10)
-            pdf.multi_cell(0, 5, notes)
-        
-        # Footer
-        pdf.ln(15)
-        pdf.set_font('helvetica', 'I', 8)
-        pdf.set_text_color(128, 128, 128)
-        pdf.cell(0, 5, 'Thank you for your business!', 0, 1, 'C')
-        pdf.cell(0, 5, self.company_name, 0, 1, 'C')
-        
-        # Get the PDF as bytes
-        pdf_bytes = pdf.output(dest='S').encode('latin1')
-        
-        # Clean up the logo file
-        if self.logo_path and os.path.exists(self.logo_path):
-            try:
-                os.remove(self.logo_path)
-            except:
-                pass
-        
-        return pdf_bytes
-
-def create_download_link(pdf_bytes, filename="invoice.pdf"):
-    """Generate a link to download the PDF file"""
-    b64 = base64.b64encode(pdf_bytes).decode("latin1")
-    href = f'<a href="data:application/pdf;base64,{b64}" download="{filename}">Download Invoice PDF</a>'
-    return href
-
-# Set page config with mobile-friendly settings
-st.set_page_config(
-    page_title="Invoice Generator", 
-    layout="wide",
-    initial_sidebar_state="collapsed"
-)
-
-# Add mobile-friendly CSS
-st.markdown("""
-<style>
-    /* Mobile-friendly button styling */
-    .stButton > button {
-        min-height: 44px; /* iOS minimum touch target */
-        padding: 12px 24px;
-        font-size: 16px;
-        border-radius: 8px;
-        border: 2px solid #4CAF50;
-        background-color: #4CAF50;
-        color: white;
-        cursor: pointer;
-        transition: all 0.3s ease;
-        -webkit-tap-highlight-color: transparent;
-    }
-    
-    .stButton > button:hover {
-        background-color: #45a049;
-        transform: translateY(-1px);
-        box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-    }
-    
-    .stButton > button:active {
-        transform: translateY(0);
-        box-shadow: 0 2px 4px rgba(0,0,0,0.2);
-    }
-    
-    /* Mobile-friendly form inputs */
-    .stTextInput > div > div > input {
-        min-height: 44px;
-        font-size: 16px;
-        padding: 12px;
-    }
-    
-    .stNumberInput > div > div > input {
-        min-height: 44px;
-        font-size: 16px;
-        padding: 12px;
-    }
-    
-    /* Mobile-friendly file uploader */
-    .stFileUploader > div {
-        min-height: 44px;
-    }
-    
-    /* Prevent double-tap zoom on mobile */
-    * {
-        touch-action: manipulation;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# Check authentication first
-check_authentication()
-
-# Create a header with title and logout button
-col1, col2, col3 = st.columns([2, 1, 1])
-with col1:
-    st.title("Invoice Generator")
-with col3:
-    st.write("")  # Add some spacing
-    if st.button("Logout", key="logout_button"):
-        # Prevent double-clicking by checking if already processing
-        if 'logout_processing' not in st.session_state:
-            st.session_state.logout_processing = True
-            st.session_state.authenticated = False
-            st.success("Logged out successfully!")
-            # Clear processing flag and rerun
-            del st.session_state.logout_processing
-            st.rerun()
-
-st.write("Create an Invoice for your Clients:")
-
-# Initialize session state for all parameters
-if 'company_name' not in st.session_state:
-    st.session_state.company_name = "ABC123 INC"
-if 'company_address' not in st.session_state:
-    st.session_state.company_address = "123 Broadway\nNew York, NY 10004 \ninvoice@abc123inc.com\n(555) 555-5555"
-if 'uploaded_logo' not in st.session_state:
-    st.session_state.uploaded_logo = None
-if 'invoice_number' not in st.session_state:
-    st.session_state.invoice_number = "INV-001"
-if 'client_name' not in st.session_state:
-    st.session_state.client_name = "Acme Corporation"
-if 'client_address' not in st.session_state:
-    st.session_state.client_address = "123 Business Ave\nEnterprise City, CA 90210"
-if 'client_email' not in st.session_state:
-    st.session_state.client_email = "billing@acmecorp.com"
-if 'items' not in st.session_state:
-    st.session_state['items'] = [
-        {"service_item": "AI-001", "description": "AI Workflow Development", "hours": 12, "rate": 150, "amount": None},
-        {"service_item": "LLM-001", "description": "LLM Systems Integration", "hours": 8, "rate": 175, "amount": None},
-        {"service_item": "CONS-001", "description": "Implementation Consulting", "hours": 8, "rate": 175, "amount": None}
-    ]
-if 'notes' not in st.session_state:
-    st.session_state.notes = "Payment is due within 30 days. Please make checks payable to ABC123 INC."
-if 'tax_rate' not in st.session_state:
-    st.session_state.tax_rate = 6.0
-if 'discount' not in st.session_state:
-    st.session_state.discount = 0.0
-if 'service_item_col' not in st.session_state:
-    st.session_state.service_item_col = "Service Item"
-if 'description_col' not in st.session_state:
-    st.session_state.description_col = "Description"
-if 'hours_col' not in st.session_state:
-    st.session_state.hours_col = "Hours"
-if 'rate_col' not in st.session_state:
-    st.session_state.rate_col = "Rate ($)"
-if 'amount_col' not in st.session_state:
-    st.session_state.amount_col = "Amount ($)"
-if 'services_heading' not in st.session_state:
-    st.session_state.services_heading = "Services"
-
-# Function to update column name in session state
-def update_service_heading():
-    st.session_state.services_heading = st.session_state.services_heading_input
-
-def update_service_item_col():
-    st.session_state.service_item_col = st.session_state.service_item_col_input
-
-def update_description_col():
-    st.session_state.description_col = st.session_state.description_col_input
-    
-def update_hours_col():
-    st.session_state.hours_col = st.session_state.hours_col_input
-    
-def update_rate_col():
-    st.session_state.rate_col = st.session_state.rate_col_input
-    
-def update_amount_col():
-    st.session_state.amount_col = st.session_state.amount_col_input
-
-# Create tabs for company info, client info, items, and preview
-tabs = st.tabs(["Company Info", "Client Info", "Options and Notes", "Invoice Items", "Generate Invoice"])
-
-# Company Info Tab
-with tabs[0]:
-    st.header("Company Information")
-    
-    company_name = st.text_input("Company Name", value=st.session_state.company_name)
-    company_address = st.text_area("Company Address", value=st.session_state.company_address, height=100)
-    
-    # Display the default logo image
-    st.write("Default Logo:")
-    try:
-        st.image('asset/logo.png', width=150)
-    except Exception as e:
-        st.write(f"Default logo image not found. Error: {e}")
-    
-    company_logo = st.file_uploader("Upload Custom Logo (optional)", type=["png", "jpg", "jpeg"], key="company_logo_uploader")
-    if company_logo:
-        st.image(company_logo, width=150, caption="Custom Logo Preview")
-        # Store the uploaded file in session state for persistence across tabs
-        st.session_state['uploaded_logo'] = company_logo
-    elif st.session_state.get('uploaded_logo') is not None:
-        # Show previously uploaded logo if current uploader is empty
-        st.image(st.session_state['uploaded_logo'], width=150, caption="Previously Uploaded Logo")
-    
-    # Save to session state
-    if st.button("Save Company Info", key="save_company_info"):
-        # Prevent double-clicking by checking if already processing
-        if 'save_company_processing' not in st.session_state:
-            st.session_state.save_company_processing = True
-            
-            st.session_state.company_name = company_name
-            st.session_state.company_address = company_address
-            
-            # Update notes with the new company name
-            current_notes = st.session_state.notes
-            # Replace the old company name with the new one in the notes
-            if "Please make checks payable to" in current_notes:
-                # Extract the part before "Please make checks payable to"
-                before_part = current_notes.split("Please make checks payable to")[0]
-                # Create new notes with updated company name
-                st.session_state.notes = f"{before_part}Please make checks payable to {company_name}."
-            
-            st.success("Company information saved!")
-            # Clear processing flag
-            del st.session_state.save_company_processing
-
-# Client Info Tab
-with tabs[1]:
-    st.header("Client Information")
-    
-    invoice_number = st.text_input("Invoice Number", value=st.session_state.invoice_number)
-    client_name = st.text_input("Client Name", value=st.session_state.client_name)
-    client_address = st.text_area("Client Address", value=st.session_state.client_address, height=100)
-    client_email = st.text_input("Client Email", value=st.session_state.client_email)
-    
-    # Save to session state
-    if st.button("Save Client Info", key="save_client_info"):
-        # Prevent double-clicking by checking if already processing
-        if 'save_client_processing' not in st.session_state:
-            st.session_state.save_client_processing = True
-            
-            st.session_state.invoice_number = invoice_number
-            st.session_state.client_name = client_name
-            st.session_state.client_address = client_address
-            st.session_state.client_email = client_email
-            st.success("Client information saved!")
-            # Clear processing flag
-            del st.session_state.save_client_processing
-
-# Invoice Items Tab
-with tabs[3]:
-    st.header("Invoice Items")
-    
-    # Reset items if it's not a list
-    if not isinstance(st.session_state.get('items'), list):
-        st.session_state['items'] = [
-            {"service_item": "AI-001", "description": "AI Workflow Development", "hours": 12, "rate": 150, "amount": None},
-            {"service_item": "LLM-001", "description": "LLM Systems Integration", "hours": 8, "rate": 175, "amount": None},
-            {"service_item": "CONS-001", "description": "Implementation Consulting", "hours": 8, "rate": 175, "amount": None}
-        ]
-    
-    # Get items from session state
-    items = st.session_state['items']
-    
-    # Get custom column names from session state
-    service_item_label = st.session_state.get('service_item_col', 'Service Item')
-    description_label = st.session_state.get('description_col', 'Description')
-    hours_label = st.session_state.get('hours_col', 'Hours')
-    rate_label = st.session_state.get('rate_col', 'Rate ($)')
-    amount_label = st.session_state.get('amount_col', 'Amount ($)')
-    
-    # Display existing items
-    for i, item in enumerate(items):
-        st.write(f"**Item #{i+1}**")
-        
-        # Add a select box to choose between hours/rate or fixed amount - moved above fields
-        calc_method = "hours_rate"
-        if item.get("amount") is not None and (item.get("hours") is None or item.get("rate") is None):
-            calc_method = "fixed_amount"
-        
-        calc_method = st.radio(f"Calculation method for item #{i+1}", 
-                               ["Hours & Rate", "Fixed Amount"], 
-                               index=0 if calc_method == "hours_rate" else 1,
-                               horizontal=True, key=f"calc_method_{i}")
-        
-        cols = st.columns([1, 3, 1, 1, 1])
-        with cols[0]:
-            st.text_input(f"{service_item_label} #{i+1}", value=item.get("service_item", ""), key=f"service_{i}")
-        with cols[1]:
-            st.text_input(f"{description_label} #{i+1}", value=item["description"], key=f"desc_{i}")
-        
-        # Display fields based on calculation method
-        if calc_method == "Hours & Rate":
-            with cols[2]:
-                st.number_input(f"{hours_label} #{i+1}", value=float(item.get("hours", 0)), step=0.5, format="%.2f", key=f"hours_{i}")
-            with cols[3]:
-                st.number_input(f"{rate_label} #{i+1}", value=float(item.get("rate", 0)), step=10.0, format="%.2f", key=f"rate_{i}")
-            with cols[4]:
-                # Display calculated amount (read-only)
-                hours = float(st.session_state.get(f"hours_{i}", 0))
-                rate = float(st.session_state.get(f"rate_{i}", 0))
-                calculated_amount = hours * rate
-                st.text_input(f"{amount_label} #{i+1}", value=f"${calculated_amount:,.2f}", disabled=True, key=f"calc_amount_{i}")
-        else:
-            # For fixed amount, disable hours and rate, but show amount field
-            with cols[2]:
-                st.text_input(f"{hours_label} #{i+1}", value="N/A", disabled=True, key=f"disabled_hours_{i}")
-            with cols[3]:
-                st.text_input(f"{rate_label} #{i+1}", value="N/A", disabled=True, key=f"disabled_rate_{i}")
-            with cols[4]:
-                # Fix the error by ensuring we have a valid default value
-                amount_value = 0.0
-                if item.get("amount") is not None:
-                    amount_value = float(item.get("amount"))
-                st.number_input(f"{amount_label} #{i+1}", value=amount_value, step=10.0, format="%.2f", key=f"amount_{i}")
-        
-        # Remove button with some spacing
-        if st.button("Remove Item", key=f"remove_{i}"):
-            # Prevent double-clicking by checking if already processing
-            if f'remove_processing_{i}' not in st.session_state:
-                st.session_state[f'remove_processing_{i}'] = True
-                
-                items_copy = list(items)  # Create a copy
-                items_copy.pop(i)
-                st.session_state['items'] = items_copy
-                
-                # Clear processing flag and rerun
-                del st.session_state[f'remove_processing_{i}']
-                st.rerun()
-        st.markdown("---")  # Add a separator between items
-    
-    # Add new item button
-    if st.button("Add New Item", key="add_new_item"):
-        # Prevent double-clicking by checking if already processing
-        if 'add_item_processing' not in st.session_state:
-            st.session_state.add_item_processing = True
-            
-            items_copy = list(items)  # Create a copy
-            items_copy.append({"service_item": "", "description": "", "hours": 1, "rate": 100, "amount": None})
-            st.session_state['items'] = items_copy
-            
-            # Clear processing flag and rerun
-            del st.session_state.add_item_processing
-            st.rerun()
-    
-    # Save items
-    if st.button("Save Items", key="save_items_button"):
-        # Prevent double-clicking by checking if already processing
-        if 'save_items_processing' not in st.session_state:
-            st.session_state.save_items_processing = True
-            
-            updated_items = []
-            for i in range(len(items)):
-                calc_method = st.session_state.get(f"calc_method_{i}")
-                if calc_method == "Hours & Rate":
-                    updated_items.append({
-                        "service_item": st.session_state[f"service_{i}"],
-                        "description": st.session_state[f"desc_{i}"],
-                        "hours": float(st.session_state[f"hours_{i}"]),
-                        "rate": float(st.session_state[f"rate_{i}"]),
-                        "amount": None
-                    })
-                else:
-                    updated_items.append({
-                        "service_item": st.session_state[f"service_{i}"],
-                        "description": st.session_state[f"desc_{i}"],
-                        "hours": None,
-                        "rate": None,
-                        "amount": float(st.session_state[f"amount_{i}"])
-                    })
-            st.session_state['items'] = updated_items
-            st.success("Invoice items saved!")
-            # Clear processing flag
-            del st.session_state.save_items_processing
-
-# Options & Notes Tab
-with tabs[2]:
-    st.header("Options and Notes")
-    
-    # Add column for custom headings and column names
-    st.subheader("Custom Invoice Table Labels")
-    
-    # Use a smaller column width for the section heading
-    col1, _ = st.columns([2, 6])  # Use 2/8 = 25% of the width
-    with col1:
-        services_heading = st.text_input("Section Heading", 
-                                       value=st.session_state.services_heading, 
-                                       key="services_heading_input",
-                                       on_change=update_service_heading)
-    
-    st.markdown("**Custom Column Names:**")
-    cols = st.columns(5)  # Create 5 equal columns for each input field
-    
-    with cols[0]:
-        service_item_col = st.text_input("Service Item", 
-                                       value=st.session_state.service_item_col,
-                                       key="service_item_col_input",
-                                       on_change=update_service_item_col)
-    with cols[1]:
-        description_col = st.text_input("Description", 
-                                      value=st.session_state.description_col,
-                                      key="description_col_input",
-                                      on_change=update_description_col)
-    with cols[2]:
-        hours_col = st.text_input("Hours", 
-                                value=st.session_state.hours_col,
-                                key="hours_col_input",
-                                on_change=update_hours_col)
-    with cols[3]:
-        rate_col = st.text_input("Rate", 
-                               value=st.session_state.rate_col,
-                               key="rate_col_input",
-                               on_change=update_rate_col)
-    with cols[4]:
-        amount_col = st.text_input("Amount", 
-                                 value=st.session_state.amount_col,
-                                 key="amount_col_input",
-                                 on_change=update_amount_col)
-    
-    st.markdown("---")
-    st.subheader("Invoice Notes and Settings")
-    
-    # Create dynamic default text with company name
-    company_name_for_notes = st.session_state.get('company_name', 'Your Company')
-    dynamic_default = f"Payment is due within 30 days. Please make checks payable to {company_name_for_notes}."
-    
-    # Use the dynamic default if notes are empty or contain the old placeholder
-    current_notes = st.session_state.notes
-    
-    # If the current notes contain the old placeholder, update to the new dynamic version
-    if '[Company Name]' in current_notes:
-        current_notes = current_notes.replace('[Company Name]', company_name_for_notes)
-        st.session_state.notes = current_notes
-    
-    notes = st.text_area("Notes", value=current_notes, height=100, 
-                        placeholder=dynamic_default,
-                        help=f"Default note includes your company name: {company_name_for_notes}")
-    tax_rate = st.number_input("Tax Rate (%)", value=st.session_state.tax_rate, min_value=0.0, step=0.1)
-    discount = st.number_input("Discount (%)", value=st.session_state.discount, min_value=0.0, max_value=100.0, step=0.1)
-    
-    # Add date fields
-    if 'invoice_date' not in st.session_state:
-        st.session_state.invoice_date = datetime.now().date()
-    if 'due_date' not in st.session_state:
-        st.session_state.due_date = (datetime.now() + timedelta(days=30)).date()
-        
-    invoice_date = st.date_input("Invoice Date", value=st.session_state.invoice_date)
-    due_date = st.date_input("Due Date", value=st.session_state.due_date)
-    
-    # Save to session state
-    if st.button("Save Options & Notes", key="save_options_notes"):
-        # Prevent double-clicking by checking if already processing
-        if 'save_options_processing' not in st.session_state:
-            st.session_state.save_options_processing = True
-            
-            st.session_state.notes = notes
-            st.session_state.tax_rate = tax_rate
-            st.session_state.discount = discount
-            st.session_state.invoice_date = invoice_date
-            st.session_state.due_date = due_date
-            # Save custom headings and column names
-            st.session_state.services_heading = services_heading
-            st.session_state.service_item_col = service_item_col
-            st.session_state.description_col = description_col
-            st.session_state.hours_col = hours_col
-            st.session_state.rate_col = rate_col
-            st.session_state.amount_col = amount_col
-            st.success("Options and notes saved!")
-            # Clear processing flag
-            del st.session_state.save_options_processing
-
-# Preview Tab
-with tabs[4]:
-    st.header("Invoice Generation")
-    
-    if st.button("Generate and Download Invoice", key="generate_invoice_button"):
-        # Prevent double-clicking by checking if already processing
-        if 'generate_invoice_processing' not in st.session_state:
-            st.session_state.generate_invoice_processing = True
-            
-            try:
-                # Update items with the latest values
-                updated_items = []
-                items = st.session_state['items']
-                for i in range(len(items)):
-                    calc_method = st.session_state.get(f"calc_method_{i}")
-                    if calc_method == "Hours & Rate":
-                        updated_items.append({
-                            "service_item": st.session_state[f"service_{i}"],
-                            "description": st.session_state[f"desc_{i}"],
-                            "hours": float(st.session_state[f"hours_{i}"]),
-                            "rate": float(st.session_state[f"rate_{i}"]),
-                            "amount": None
-                        })
-                    else:
-                        updated_items.append({
-                            "service_item": st.session_state[f"service_{i}"],
-                            "description": st.session_state[f"desc_{i}"],
-                            "hours": None,
-                            "rate": None,
-                            "amount": float(st.session_state[f"amount_{i}"])
-                        })
-                
-                # Create custom column names dictionary
-                column_names = {
-                    'service_item': st.session_state.get('service_item_col', 'Service Item'),
-                    'description': st.session_state.get('description_col', 'Description'),
-                    'hours': st.session_state.get('hours_col', 'Hours'),
-                    'rate': st.session_state.get('rate_col', 'Rate ($)'),
-                    'amount': st.session_state.get('amount_col', 'Amount ($)')
-                }
-                
-                # Get the uploaded logo from session state
-                uploaded_logo = st.session_state.get('uploaded_logo', None)
-                
-                generator = InvoiceGenerator(
-                    st.session_state.company_name,
-                    st.session_state.company_address,
-                    uploaded_logo
-                )
-                
-                pdf_bytes = generator.generate_invoice(
-                    invoice_number=st.session_state.invoice_number,
-                    client_name=st.session_state.client_name,
-                    client_address=st.session_state.client_address,
-                    client_email=st.session_state.client_email,
-                    items=updated_items,  # Pass the updated items explicitly
-                    notes=st.session_state.notes,
-                    tax_rate=float(st.session_state.tax_rate),
-                    discount=float(st.session_state.discount),
-                    invoice_date=st.session_state.invoice_date,
-                    due_date=st.session_state.due_date,
-                    services_heading=st.session_state.get('services_heading', 'Services'),
-                    column_names=column_names
-                )
-                
-                # Create download link
-                download_link = create_download_link(pdf_bytes, filename=f"Invoice_{st.session_state.invoice_number}.pdf")
-                st.markdown(download_link, unsafe_allow_html=True)
-                
-                # Display the PDF using a download button
-                st.download_button(
-                    label="Download Invoice PDF",
-                    data=pdf_bytes,
-                    file_name=f"Invoice_{st.session_state.invoice_number}.pdf",
-                    mime="application/pdf"
-                )
-                    
-                # Display PDF inline
-                try:
-                    base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-                    pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="800" type="application/pdf"></iframe>'
-                    st.markdown(pdf_display, unsafe_allow_html=True)
-                except Exception as e:
-                    st.error(f"Could not display preview: {e}")
-                
-            except Exception as e:
-                st.error(f"Error generating invoice: {str(e)}")
-            
-            # Clear processing flag
-            del st.session_state.generate_invoice_processing 
+import streamlit as st
+import streamlit.components.v1 as components
+import html
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+import pandas as pd
+from dotenv import load_dotenv
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from bundle import BUNDLE_FORMATS
+from catalog import DEFAULT_UNIT, SERVICE_FIELDS, UNITS, Service, ServiceCatalog, read_catalog_csv
+from clients import Client, ClientDirectory, read_clients_csv
+from logo_cache import LogoStore, load_default_logo
+from models import ITEM_FIELDS, Invoice, LineItem
+from pdf_cache import RenderCache
+from pricing import ItemBatch, format_money
+from render_queue import DONE, FAILED, QUEUED, QueueFull, RenderQueue
+from render_stats import RenderStats
+from session_memory import session_memory_report, trim_session_state
+from store import DuplicateInvoiceNumber, InvoiceStore
+from timesheets import aggregate_timesheet
+
+# FPDF and the invoice renderer (invoice_generator, batch) are imported where an
+# invoice is rendered, so starting a session does not load them
+
+@st.cache_resource
+def load_environment():
+    """Read .env once per process instead of on every rerun; returns the login credentials"""
+    load_dotenv()
+    return os.getenv('USERNAME'), os.getenv('PASSWORD')
+
+# Batch bundles are written below ./static, which Streamlit serves straight from
+# disk when server.enableStaticServing is set (see .streamlit/config.toml)
+BUNDLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'bundles')
+BUNDLE_URL = 'app/static/bundles'
+BUNDLE_MAX_AGE_SECONDS = 3600
+
+# SQLite file holding saved companies, clients and invoices (INVOICE_DB overrides it)
+DEFAULT_INVOICE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices.db')
+# Rows shown by the History tab
+HISTORY_LIMIT = 100
+
+def check_authentication():
+    """Check if user is authenticated"""
+    if 'authenticated' not in st.session_state:
+        st.session_state.authenticated = False
+    
+    if not st.session_state.authenticated:
+        # Add home button in upper left corner
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            st.markdown("""
+            <div style='text-align: left; margin-bottom: 20px;'>
+                <a href='https://jmartin.consulting/' target='_blank' style='text-decoration: none;'>
+                    <button style='background-color: #000000; color: white; border: none; padding: 8px 16px; border-radius: 4px; cursor: pointer; font-size: 14px;'>
+                        Home
+                    </button>
+                </a>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        st.title("Invoice Generator Login")
+        
+        # Create login form at the top
+        # Create columns to control width and alignment
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            with st.form("login_form"):
+                username = st.text_input("Username")
+                password = st.text_input("Password", type="password")
+                submit_button = st.form_submit_button("Login")
+            
+            if submit_button:
+                # Prevent double-clicking by checking if already processing
+                if 'login_processing' not in st.session_state:
+                    st.session_state.login_processing = True
+                    
+                    correct_username, correct_password = load_environment()
+                    if username == correct_username and password == correct_password:
+                        st.session_state.authenticated = True
+                        st.success("Login successful! Redirecting...")
+                        # Clear processing flag and rerun
+                        del st.session_state.login_processing
+                        st.rerun()
+                    else:
+                        st.error("Invalid username or password. Please try again.")
+                        # Clear processing flag
+                        del st.session_state.login_processing
+        
+        # Add HubSpot form below the login form
+        st.markdown("---")
+        st.markdown("### Get Access Credentials")
+        st.markdown("Enter your contact information below to receive your username and password for accessing the Invoice Generator:")
+        
+        # HubSpot form - using components.html for better JavaScript support
+        components.html("""
+        <div style="width: 80%; max-width: 360px; margin: 0; padding: 30px; border: 2px solid #ddd; border-radius: 12px; background-color: #FFFFFF;">
+            <script src="https://js-na2.hsforms.net/forms/embed/242871477.js" defer></script>
+            <div class="hs-form-frame" data-region="na2" data-form-id="22ac7aab-b257-4485-a306-965a060bcc27" data-portal-id="242871477"></div>
+        </div>
+        """, height=600)
+        
+        st.markdown("---")
+        
+        # App information section
+        st.markdown("""
+            ### About Invoice Generator
+            **Invoice Generator** is a Streamlit web application that allows users to easily create professional PDF invoices for clients.
+            
+            ### Features
+            - Create customized invoices with your company information
+            - Add client details and multiple service items
+            - Customize tax rates and discounts
+            - Add custom notes to invoices
+            - Upload your company logo or use the default
+            - Preview and download generated invoices as PDF
+            
+            ### How to Use
+            Once logged in, follow these steps to create an invoice:
+            1. **Company Info tab**: Enter your company details and upload a logo if needed
+            2. **Client Info tab**: Add client information and invoice number
+            3. **Invoice Items tab**: Edit service items in a spreadsheet-style table (paste rows from Excel or Google Sheets, bill hours x rate or a fixed amount)
+            4. **Notes & Options tab**: Customize invoice notes, tax rate, and discount
+            5. **Generate Invoice tab**: Generate the invoice, preview it, and download as PDF
+            
+            ### Project Information
+            - **Repository**: [GitHub - Jules04711/invoice-generator](https://github.com/Jules04711/invoice-generator)
+            - **License**: MIT License - Open source and available for personal and commercial use
+            - **Requirements**: Python 3.7+, Streamlit, FPDF, Pillow, Requests
+            
+            ---
+            """)
+        
+        # Legal disclaimer footer
+        st.markdown("---")
+        st.markdown("""
+        <div style='text-align: center; font-size: 12px; color: #666; margin-top: 20px;'>
+            <p><strong>Legal Disclaimer:</strong> This application is provided for general informational purposes only. 
+            All information is provided in good faith; however, we make no representation or warranty of any kind regarding 
+            the accuracy, adequacy, validity, reliability, availability, or completeness of any information presented. 
+            Your use of this application is solely at your own risk. 
+            <a href='https://jmartin.consulting/disclaimer/' target='_blank'><br>View full legal disclaimer</a></p>
+            <p style='margin-top: 10px;'>© 2025 J. Martin Consulting LLC. All rights reserved.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        st.stop()
+    
+    return True
+
+@st.cache_resource
+def get_render_cache():
+    """Rendered PDFs shared by all sessions; set RENDER_CACHE_DIR to keep them on disk"""
+    return RenderCache(cache_dir=os.getenv('RENDER_CACHE_DIR'))
+
+@st.cache_resource
+def get_render_stats():
+    """
+    Per-stage render timings shared by all sessions. Set RENDER_METRICS_FILE to
+    write OpenMetrics text after every render, or RENDER_METRICS_PORT to serve
+    it on http://127.0.0.1:<port>/metrics.
+    """
+    stats = RenderStats(trace_memory=True, metrics_file=os.getenv('RENDER_METRICS_FILE'))
+    if os.getenv('RENDER_METRICS_PORT'):
+        stats.serve(int(os.getenv('RENDER_METRICS_PORT')))
+    return stats
+
+@st.cache_resource
+def get_render_queue():
+    """
+    Background renderer shared by all sessions. RENDER_WORKERS sets the number
+    of invoices rendered at once and RENDER_QUEUE_LIMIT how many may be waiting
+    or rendering before new requests are turned away.
+    """
+    return RenderQueue(
+        max_workers=int(os.getenv('RENDER_WORKERS', '2')),
+        max_pending=int(os.getenv('RENDER_QUEUE_LIMIT', '32')),
+        render_cache=get_render_cache()
+    )
+
+@st.cache_resource
+def get_invoice_store():
+    """Saved companies, clients and invoices shared by all sessions; set INVOICE_DB to choose the SQLite file"""
+    return InvoiceStore(os.getenv('INVOICE_DB', DEFAULT_INVOICE_DB))
+
+@st.cache_resource
+def get_logo_store():
+    """
+    Uploaded logos shared by all sessions, stored once per distinct image;
+    sessions keep only the key. Set LOGO_CACHE_DIR to also keep them on disk.
+    """
+    return LogoStore(store_dir=os.getenv('LOGO_CACHE_DIR'))
+
+def release_upload(uploaded_file):
+    """Drop Streamlit's per-session copy of an uploaded file once its content has been stored elsewhere"""
+    ctx = get_script_run_ctx()
+    if runtime.exists() and ctx is not None:
+        runtime.get_instance().uploaded_file_mgr.remove_file(ctx.session_id, uploaded_file.file_id)
+
+# Session state entries that only cache something; they are dropped first when a session is over its limit
+DISPOSABLE_SESSION_KEYS = ('timesheet_totals', 'render_record')
+# Largest session state entries listed in the session memory report
+SESSION_REPORT_ROWS = 15
+
+def session_state_limit():
+    """Bytes of session state allowed per session (SESSION_STATE_LIMIT_MB), or None when unlimited"""
+    limit = os.getenv('SESSION_STATE_LIMIT_MB')
+    return float(limit) * 1024 * 1024 if limit else None
+
+def enforce_session_limit():
+    """Drop cached entries of a session over SESSION_STATE_LIMIT_MB, and warn if it is still over"""
+    limit = session_state_limit()
+    if limit is None:
+        return
+    report, removed = trim_session_state(st.session_state, limit, DISPOSABLE_SESSION_KEYS)
+    if removed:
+        print(f"Session over {limit / 1024 / 1024:,.1f} MB of state, dropped {', '.join(removed)}")
+    if report['total_bytes'] > limit:
+        st.warning(f"This session holds about {report['total_bytes'] / 1024 / 1024:,.1f} MB on the server, more "
+                   f"than the {limit / 1024 / 1024:,.1f} MB allowed. Remove line items or uploads you no longer need.")
+
+def pdf_media_url(pdf_bytes, coordinates="invoice_preview", file_name=None):
+    """
+    Register the PDF with Streamlit's media file manager and return its URL.
+    
+    The file is held once on the server for the current session and released
+    when it is no longer displayed, so the browser fetches it by URL instead of
+    receiving it inline over the websocket. It is served inline, so the same
+    URL can be shown in an iframe and downloaded from a link.
+    """
+    if not runtime.exists():
+        return None
+    return runtime.get_instance().media_file_mgr.add(pdf_bytes, "application/pdf", coordinates,
+                                                     file_name=file_name)
+
+# Set page config with mobile-friendly settings
+st.set_page_config(
+    page_title="Invoice Generator", 
+    layout="wide",
+    initial_sidebar_state="collapsed"
+)
+
+# Load environment variables
+load_environment()
+
+# Add mobile-friendly CSS
+st.markdown("""
+<style>
+    /* Mobile-friendly button styling */
+    .stButton > button {
+        min-height: 44px; /* iOS minimum touch target */
+        padding: 12px 24px;
+        font-size: 16px;
+        border-radius: 8px;
+        border: 2px solid #4CAF50;
+        background-color: #4CAF50;
+        color: white;
+        cursor: pointer;
+        transition: all 0.3s ease;
+        -webkit-tap-highlight-color: transparent;
+    }
+    
+    .stButton > button:hover {
+        background-color: #45a049;
+        transform: translateY(-1px);
+        box-shadow: 0 4px 8px rgba(0,0,0,0.2);
+    }
+    
+    .stButton > button:active {
+        transform: translateY(0);
+        box-shadow: 0 2px 4px rgba(0,0,0,0.2);
+    }
+    
+    /* Mobile-friendly form inputs */
+    .stTextInput > div > div > input {
+        min-height: 44px;
+        font-size: 16px;
+        padding: 12px;
+    }
+    
+    .stNumberInput > div > div > input {
+        min-height: 44px;
+        font-size: 16px;
+        padding: 12px;
+    }
+    
+    /* Mobile-friendly file uploader */
+    .stFileUploader > div {
+        min-height: 44px;
+    }
+    
+    /* Prevent double-tap zoom on mobile */
+    * {
+        touch-action: manipulation;
+    }
+</style>
+""", unsafe_allow_html=True)
+
+# Check authentication first
+check_authentication()
+
+# Create a header with title and logout button
+col1, col2, col3 = st.columns([2, 1, 1])
+with col1:
+    st.title("Invoice Generator")
+with col3:
+    st.write("")  # Add some spacing
+    if st.button("Logout", key="logout_button"):
+        # Prevent double-clicking by checking if already processing
+        if 'logout_processing' not in st.session_state:
+            st.session_state.logout_processing = True
+            st.session_state.authenticated = False
+            st.success("Logged out successfully!")
+            # Clear processing flag and rerun
+            del st.session_state.logout_processing
+            st.rerun()
+
+st.write("Create an Invoice for your Clients:")
+
+@st.cache_resource
+def get_client_directory(company_id):
+    """
+    Clients of a company for the client search, shared by all sessions: those
+    saved in the invoice store plus, when CLIENTS_FILE names a CSV file, the
+    clients listed there. The index is built on the first search.
+    """
+    store = get_invoice_store()
+    sources = []
+    if os.getenv('CLIENTS_FILE'):
+        sources.append(lambda: read_clients_csv(os.getenv('CLIENTS_FILE')))
+    sources.append(lambda: (Client(row["name"], row["address"], row["email"]) for row in store.clients(company_id)))
+    return ClientDirectory(sources)
+
+@st.cache_resource
+def get_service_catalog(company_id):
+    """
+    Service catalog of a company shared by all sessions: the services saved on
+    the Invoice Items tab, on top of those in SERVICE_CATALOG (a CSV file) when
+    it is set. Cleared when the catalog is saved.
+    """
+    catalog = read_catalog_csv(os.getenv('SERVICE_CATALOG')) if os.getenv('SERVICE_CATALOG') else ServiceCatalog()
+    for row in get_invoice_store().services(company_id):
+        catalog.add(Service.from_dict(row))
+    return catalog
+
+def current_company_id():
+    """Id of this session's company in the invoice store"""
+    return get_invoice_store().company_id(st.session_state.company_name, st.session_state.company_address)
+
+def suggested_invoice_number():
+    """Next unused invoice number, falling back to INV-001 when the invoice store is unavailable"""
+    try:
+        return get_invoice_store().next_invoice_number(current_company_id())
+    except Exception as e:
+        print(f"Error reading invoice numbers: {e}")
+        return "INV-001"
+
+def service_catalog():
+    """Service catalog of this session's company (empty when the invoice store is unavailable)"""
+    try:
+        return get_service_catalog(current_company_id())
+    except Exception as e:
+        print(f"Error loading service catalog: {e}")
+        return ServiceCatalog()
+
+# New sessions start from the most recently saved company profile
+if 'company_name' not in st.session_state:
+    try:
+        profile = get_invoice_store().latest_company()
+    except Exception as e:
+        print(f"Error loading company profile: {e}")
+        profile = None
+    if profile:
+        st.session_state.company_name = profile["name"]
+        st.session_state.company_address = profile["address"]
+        if profile["notes"] is not None:
+            st.session_state.notes = profile["notes"]
+        if profile["tax_rate"] is not None:
+            st.session_state.tax_rate = profile["tax_rate"]
+        if profile["discount"] is not None:
+            st.session_state.discount = profile["discount"]
+
+# Initialize session state for all parameters
+if 'company_name' not in st.session_state:
+    st.session_state.company_name = "ABC123 INC"
+if 'company_address' not in st.session_state:
+    st.session_state.company_address = "123 Broadway\nNew York, NY 10004 \ninvoice@abc123inc.com\n(555) 555-5555"
+if 'logo_key' not in st.session_state:
+    # Key of the custom logo in the shared logo store; the image itself is not kept per session
+    st.session_state.logo_key = None
+if 'invoice_number' not in st.session_state:
+    # Only a suggestion; "Next free number" reserves a number for this session
+    st.session_state.invoice_number = suggested_invoice_number()
+if 'client_name' not in st.session_state:
+    st.session_state.client_name = "Acme Corporation"
+if 'client_address' not in st.session_state:
+    st.session_state.client_address = "123 Business Ave\nEnterprise City, CA 90210"
+if 'client_email' not in st.session_state:
+    st.session_state.client_email = "billing@acmecorp.com"
+if 'items' not in st.session_state:
+    st.session_state['items'] = [
+        LineItem("AI-001", "AI Workflow Development", hours=12, rate=150),
+        LineItem("LLM-001", "LLM Systems Integration", hours=8, rate=175),
+        LineItem("CONS-001", "Implementation Consulting", hours=8, rate=175)
+    ]
+if 'notes' not in st.session_state:
+    st.session_state.notes = "Payment is due within 30 days. Please make checks payable to ABC123 INC."
+if 'tax_rate' not in st.session_state:
+    st.session_state.tax_rate = 6.0
+if 'discount' not in st.session_state:
+    st.session_state.discount = 0.0
+if 'service_item_col' not in st.session_state:
+    st.session_state.service_item_col = "Service Item"
+if 'description_col' not in st.session_state:
+    st.session_state.description_col = "Description"
+if 'hours_col' not in st.session_state:
+    st.session_state.hours_col = "Hours"
+if 'rate_col' not in st.session_state:
+    st.session_state.rate_col = "Rate ($)"
+if 'amount_col' not in st.session_state:
+    st.session_state.amount_col = "Amount ($)"
+if 'services_heading' not in st.session_state:
+    st.session_state.services_heading = "Services"
+
+# Function to update column name in session state
+def update_service_heading():
+    st.session_state.services_heading = st.session_state.services_heading_input
+
+def update_service_item_col():
+    st.session_state.service_item_col = st.session_state.service_item_col_input
+
+def update_description_col():
+    st.session_state.description_col = st.session_state.description_col_input
+    
+def update_hours_col():
+    st.session_state.hours_col = st.session_state.hours_col_input
+    
+def update_rate_col():
+    st.session_state.rate_col = st.session_state.rate_col_input
+    
+def update_amount_col():
+    st.session_state.amount_col = st.session_state.amount_col_input
+
+def custom_column_names():
+    """Column names of the services table set on the Options and Notes tab"""
+    return {
+        'service_item': st.session_state.get('service_item_col', 'Service Item'),
+        'description': st.session_state.get('description_col', 'Description'),
+        'hours': st.session_state.get('hours_col', 'Hours'),
+        'rate': st.session_state.get('rate_col', 'Rate ($)'),
+        'amount': st.session_state.get('amount_col', 'Amount ($)')
+    }
+
+def collect_invoice_inputs():
+    """Gather the generate_invoice arguments from the current session state"""
+    arguments = Invoice.from_session_state(st.session_state).generate_arguments()
+    arguments["services_heading"] = st.session_state.get('services_heading', 'Services')
+    arguments["column_names"] = custom_column_names()
+    return arguments
+
+def uploaded_logo():
+    """Bytes of the custom logo of this session, or None; raises ValueError if it is no longer stored"""
+    logo_key = st.session_state.get('logo_key')
+    if logo_key is None:
+        return None
+    logo = get_logo_store().get(logo_key)
+    if logo is None:
+        raise ValueError("The custom logo is no longer stored on the server; upload it again on the Company Info tab")
+    return logo
+
+def company_settings():
+    """Company name, address and logo bytes of this session, as taken by the render queue"""
+    return {
+        "company_name": st.session_state.company_name,
+        "company_address": st.session_state.company_address,
+        "logo": uploaded_logo()
+    }
+
+def prune_bundles(max_age=BUNDLE_MAX_AGE_SECONDS):
+    """Delete exported bundles older than max_age seconds"""
+    if not os.path.isdir(BUNDLE_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(BUNDLE_DIR):
+        path = os.path.join(BUNDLE_DIR, name)
+        if os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+def export_bundle(uploaded_file, fmt, progress=None):
+    """
+    Render an uploaded CSV or JSONL batch into a ZIP or merged PDF bundle on disk.
+    
+    Returns the batch manifest and the URL the bundle is served from. Every
+    export gets a directory with a random name, so a bundle can only be
+    downloaded by whoever knows its URL.
+    """
+    prune_bundles()
+    token = uuid.uuid4().hex
+    output_dir = os.path.join(BUNDLE_DIR, token)
+    fmt_in = 'csv' if uploaded_file.name.lower().endswith('.csv') else 'jsonl'
+    company = company_settings()
+    company.update({
+        "notes": st.session_state.notes,
+        "tax_rate": st.session_state.tax_rate,
+        "discount": st.session_state.discount,
+        "services_heading": st.session_state.get('services_heading', 'Services'),
+        "column_names": custom_column_names(),
+        "cache_dir": os.getenv('RENDER_CACHE_DIR'),
+        "stats": False
+    })
+    # The records are read from disk by the batch reader; keep the input out of the served directory
+    with tempfile.NamedTemporaryFile(suffix=f".{fmt_in}", delete=False) as f:
+        f.write(uploaded_file.getvalue())
+    from batch import read_records, run_batch
+    try:
+        manifest = run_batch(read_records(f.name, fmt_in, service_catalog()), output_dir, company,
+                             workers=int(os.getenv('RENDER_WORKERS', '2')), bundle=fmt, progress=progress)
+    except Exception:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+    finally:
+        os.remove(f.name)
+    return manifest, f"{BUNDLE_URL}/{token}/{manifest['summary']['bundle']}"
+
+def save_invoice():
+    """Save the invoice being edited, updating the saved copy when it was opened from the history"""
+    company_id = current_company_id()
+    invoice = Invoice.from_session_state(st.session_state)
+    st.session_state.invoice_id = get_invoice_store().save_invoice(company_id, invoice, st.session_state.get('invoice_id'))
+    get_client_directory(company_id).add(invoice.client_name, invoice.client_address, invoice.client_email)
+
+def fill_client():
+    """Copy the client picked in the client search into the client fields"""
+    client = st.session_state.get('client_match')
+    if client is not None:
+        st.session_state.client_name = client.name
+        st.session_state.client_address = client.address
+        st.session_state.client_email = client.email
+
+def open_invoice(invoice, invoice_id=None):
+    """Load a saved invoice (or an unsaved copy when invoice_id is None) into the editor"""
+    st.session_state.invoice_number = invoice.invoice_number
+    st.session_state.client_name = invoice.client_name
+    st.session_state.client_address = invoice.client_address
+    st.session_state.client_email = invoice.client_email
+    if invoice.notes is not None:
+        st.session_state.notes = invoice.notes
+    if invoice.tax_rate is not None:
+        st.session_state.tax_rate = invoice.tax_rate
+    if invoice.discount is not None:
+        st.session_state.discount = invoice.discount
+    st.session_state.invoice_date = invoice.invoice_date or datetime.now().date()
+    st.session_state.due_date = invoice.due_date or (datetime.now() + timedelta(days=30)).date()
+    set_items(invoice.items)
+    st.session_state.invoice_id = invoice_id
+    # The last PDF belongs to the previous invoice
+    st.session_state.rendered_pdf = None
+    st.session_state.render_record = None
+
+def invoice_generator(stats=None):
+    """Generator for the company settings and uploaded logo of this session"""
+    from invoice_generator import InvoiceGenerator
+    return InvoiceGenerator(
+        st.session_state.company_name,
+        st.session_state.company_address,
+        uploaded_logo(),
+        render_cache=get_render_cache(),
+        stats=stats
+    )
+
+# Columns of the items editor: the item fields followed by the computed line total
+ITEM_EDITOR_COLUMNS = ITEM_FIELDS + ("total",)
+
+def items_table(items, line_amounts):
+    """Table shown by the items editor, one row per line item"""
+    return pd.DataFrame({
+        "service_item": pd.Series([item.service_item for item in items], dtype=object),
+        "description": pd.Series([item.description for item in items], dtype=object),
+        "hours": pd.Series([item.hours for item in items], dtype="float64"),
+        "rate": pd.Series([item.rate for item in items], dtype="float64"),
+        "amount": pd.Series([item.amount for item in items], dtype="float64"),
+        "total": pd.Series([format_money(amount) for amount in line_amounts], dtype=object)
+    })
+
+def set_items(items):
+    """Replace the line items and restart the items editor on them"""
+    st.session_state['items'] = list(items)
+    st.session_state.items_editor_version = st.session_state.get('items_editor_version', 0) + 1
+
+def timesheet_totals(uploaded_file):
+    """Hours of an uploaded time-entry export, summed once per upload"""
+    cached = st.session_state.get('timesheet_totals')
+    if cached is None or cached[0] != uploaded_file.file_id:
+        uploaded_file.seek(0)
+        cached = (uploaded_file.file_id, aggregate_timesheet(uploaded_file))
+        st.session_state.timesheet_totals = cached
+    return cached[1]
+
+def apply_item_edits():
+    """Fold the pending edits of the items editor into the stored line items"""
+    changes = st.session_state[f"items_editor_{st.session_state.get('items_editor_version', 0)}"]
+    items = list(st.session_state['items'])
+    catalog = service_catalog()
+    for row, values in changes["edited_rows"].items():
+        updated = items[int(row)].to_dict()
+        service = catalog.get(values.get("service_item"))
+        if service is not None:
+            # Typing a catalog code fills in its description and rate
+            updated = service.fill(updated, replace=True)
+        updated.update((field, value) for field, value in values.items()
+                       if field in ITEM_FIELDS and not (service is not None and field == "service_item"))
+        # Typing hours or a rate turns a fixed amount line back into hours x rate
+        if "amount" not in values and ("hours" in values or "rate" in values):
+            updated["amount"] = None
+        items[int(row)] = LineItem.from_dict(updated)
+    for row in sorted(changes["deleted_rows"], reverse=True):
+        del items[row]
+    for values in changes["added_rows"]:
+        items.append(LineItem.from_dict(catalog.resolve(values)))
+    # The editor is recreated on the updated items so line totals refresh in the grid
+    set_items(items)
+
+def live_preview():
+    """
+    Draft of the first page, re-rendered in the run that follows an edit.
+    
+    Nothing polls on a timer: every fragment run releases the media files of
+    the rest of the page (the generated PDF, its download and the logos). The
+    render cache is keyed on everything that affects the PDF, so runs that do
+    not change the invoice serve the same draft without rendering it again.
+    """
+    try:
+        data = invoice_generator().generate_invoice(max_pages=1, **collect_invoice_inputs())
+        st.caption("Draft of the first page. Generate the invoice below for the full PDF.")
+        preview_url = pdf_media_url(data, "invoice_live_preview")
+        if preview_url:
+            pdf_display = f'<iframe src="{preview_url}" width="100%" height="500" type="application/pdf"></iframe>'
+            st.markdown(pdf_display, unsafe_allow_html=True)
+    except Exception as e:
+        st.error(f"Could not update preview: {e}")
+
+@st.experimental_fragment(run_every=0.5)
+def render_job_progress():
+    """Poll the render job of this session and pick up the PDF when it is ready"""
+    queue = get_render_queue()
+    try:
+        job = queue.job(st.session_state.render_job)
+    except KeyError:
+        st.session_state.render_job = None
+        return
+    
+    if not job.finished:
+        if job.status == QUEUED:
+            st.progress(0.0, text="Waiting for a free renderer...")
+        else:
+            st.progress(job.progress, text=f"Rendering invoice {job.invoice_number}...")
+        return
+    
+    st.session_state.render_job = None
+    queue.discard(job.id)
+    if job.status == DONE:
+        # Keep only a reference to the latest PDF, which stays in the shared render cache;
+        # it is shown until the next one is generated
+        st.session_state.rendered_pdf = {
+            "key": job.cache_key,
+            "file_name": f"Invoice_{job.invoice_number}.pdf"
+        }
+        st.session_state.render_record = job.record
+        # Rerun the whole page so the preview and download button appear
+        st.rerun()
+    elif job.status == FAILED:
+        st.error(f"Error generating invoice: {job.error}")
+
+# Create tabs for company info, client info, items, and preview
+tabs = st.tabs(["Company Info", "Client Info", "Options and Notes", "Invoice Items", "Generate Invoice", "Batch Export",
+                "History"])
+
+# Company Info Tab
+with tabs[0]:
+    st.header("Company Information")
+    
+    company_name = st.text_input("Company Name", value=st.session_state.company_name)
+    company_address = st.text_area("Company Address", value=st.session_state.company_address, height=100)
+    
+    # Display the default logo image
+    st.write("Default Logo:")
+    # Read from disk once per process, not on every rerun
+    default_logo = load_default_logo()
+    if default_logo is not None:
+        st.image(default_logo, width=150)
+    else:
+        st.write("Default logo image not found.")
+    
+    company_logo = st.file_uploader("Upload Custom Logo (optional)", type=["png", "jpg", "jpeg"],
+                                    key=f"company_logo_uploader_{st.session_state.get('logo_uploader_version', 0)}")
+    if company_logo:
+        # Sessions uploading the same image share one copy; this session only keeps its key
+        st.session_state.logo_key = get_logo_store().put(company_logo.getvalue())
+        # Release the upload and restart the uploader empty, so the file is not held twice
+        release_upload(company_logo)
+        st.session_state.logo_uploader_version = st.session_state.get('logo_uploader_version', 0) + 1
+        st.rerun()
+    try:
+        custom_logo = uploaded_logo()
+    except ValueError as e:
+        st.warning(str(e))
+        st.session_state.logo_key = None
+        custom_logo = None
+    if custom_logo is not None:
+        st.image(custom_logo, width=150, caption="Custom Logo")
+        if st.button("Remove Custom Logo", key="remove_custom_logo"):
+            st.session_state.logo_key = None
+            st.rerun()
+    
+    # Save to session state
+    if st.button("Save Company Info", key="save_company_info"):
+        # Prevent double-clicking by checking if already processing
+        if 'save_company_processing' not in st.session_state:
+            st.session_state.save_company_processing = True
+            
+            st.session_state.company_name = company_name
+            st.session_state.company_address = company_address
+            
+            # Update notes with the new company name
+            current_notes = st.session_state.notes
+            # Replace the old company name with the new one in the notes
+            if "Please make checks payable to" in current_notes:
+                # Extract the part before "Please make checks payable to"
+                before_part = current_notes.split("Please make checks payable to")[0]
+                # Create new notes with updated company name
+                st.session_state.notes = f"{before_part}Please make checks payable to {company_name}."
+            
+            try:
+                get_invoice_store().save_company(company_name, company_address, notes=st.session_state.notes)
+            except Exception as e:
+                print(f"Error saving company profile: {e}")
+            st.success("Company information saved!")
+            # Clear processing flag
+            del st.session_state.save_company_processing
+
+# Client Info Tab
+with tabs[1]:
+    st.header("Client Information")
+    
+    client_query = st.text_input("Find Client", key="client_search",
+                                 placeholder="Type part of a client name and press Enter to fill in their details")
+    if client_query:
+        try:
+            matches = get_client_directory(current_company_id()).search(client_query)
+        except Exception as e:
+            st.error(f"Could not search clients: {str(e)}")
+            matches = []
+        if matches:
+            st.selectbox("Matching Clients", matches, index=None, key="client_match", on_change=fill_client,
+                         placeholder=f"{len(matches)} matching clients", format_func=lambda client: (
+                             f"{client.name} <{client.email}>" if client.email else client.name))
+        else:
+            st.caption("No saved client matches.")
+    
+    invoice_number = st.text_input("Invoice Number", value=st.session_state.invoice_number)
+    client_name = st.text_input("Client Name", value=st.session_state.client_name)
+    client_address = st.text_area("Client Address", value=st.session_state.client_address, height=100)
+    client_email = st.text_input("Client Email", value=st.session_state.client_email)
+    
+    if st.session_state.get('invoice_id'):
+        st.caption("Editing a saved invoice; generating it again updates the saved copy.")
+    if st.button("Next free number", key="next_invoice_number",
+                 help="Reserve the next unused invoice number and start a new invoice with it"):
+        try:
+            st.session_state.invoice_number = get_invoice_store().allocate_invoice_number(current_company_id())
+            st.session_state.invoice_id = None
+            st.rerun()
+        except Exception as e:
+            st.error(f"Could not allocate an invoice number: {str(e)}")
+    
+    # Save to session state
+    if st.button("Save Client Info", key="save_client_info"):
+        # Prevent double-clicking by checking if already processing
+        if 'save_client_processing' not in st.session_state:
+            st.session_state.save_client_processing = True
+            
+            st.session_state.invoice_number = invoice_number
+            st.session_state.client_name = client_name
+            st.session_state.client_address = client_address
+            st.session_state.client_email = client_email
+            if client_name:
+                try:
+                    company_id = current_company_id()
+                    get_invoice_store().save_client(company_id, client_name, client_address, client_email)
+                    get_client_directory(company_id).add(client_name, client_address, client_email)
+                except Exception as e:
+                    print(f"Error saving client: {e}")
+            st.success("Client information saved!")
+            # Clear processing flag
+            del st.session_state.save_client_processing
+
+# Invoice Items Tab
+with tabs[3]:
+    st.header("Invoice Items")
+    
+    # Reset items if it's not a list
+    if not isinstance(st.session_state.get('items'), list):
+        st.session_state['items'] = [
+            LineItem("AI-001", "AI Workflow Development", hours=12, rate=150),
+            LineItem("LLM-001", "LLM Systems Integration", hours=8, rate=175),
+            LineItem("CONS-001", "Implementation Consulting", hours=8, rate=175)
+        ]
+    
+    # Get items from session state
+    items = st.session_state['items']
+    
+    # Get custom column names from session state
+    service_item_label = st.session_state.get('service_item_col', 'Service Item')
+    description_label = st.session_state.get('description_col', 'Description')
+    hours_label = st.session_state.get('hours_col', 'Hours')
+    rate_label = st.session_state.get('rate_col', 'Rate ($)')
+    amount_label = st.session_state.get('amount_col', 'Amount ($)')
+    
+    st.caption("Edit cells directly, add rows at the bottom of the table, select rows to delete them, "
+               "or paste rows copied from a spreadsheet. Leave the fixed amount empty to bill hours x rate.")
+    
+    # Price all rows in one pass
+    line_amounts = ItemBatch.from_items(items).line_amounts()
+    
+    # A single grid for every item; edits are folded into the stored items by apply_item_edits
+    st.data_editor(
+        items_table(items, line_amounts),
+        key=f"items_editor_{st.session_state.get('items_editor_version', 0)}",
+        on_change=apply_item_edits,
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_order=ITEM_EDITOR_COLUMNS,
+        column_config={
+            "service_item": st.column_config.TextColumn(service_item_label),
+            "description": st.column_config.TextColumn(description_label, width="large"),
+            "hours": st.column_config.NumberColumn(hours_label, format="%.2f", step=0.01),
+            "rate": st.column_config.NumberColumn(rate_label, format="%.2f", step=0.01),
+            "amount": st.column_config.NumberColumn("Fixed Amount ($)", format="%.2f", step=0.01,
+                                                    help="Bill a fixed amount instead of hours x rate"),
+            "total": st.column_config.TextColumn(amount_label, disabled=True)
+        }
+    )
+    
+    st.write(f"**Items subtotal: ${format_money(line_amounts.sum())}**")
+    
+    catalog = service_catalog()
+    if len(catalog):
+        service_col, add_col = st.columns([3, 1])
+        service = service_col.selectbox(
+            "Add from Catalog", list(catalog), index=None, key="catalog_service",
+            placeholder="Pick a service to add it as a new line",
+            format_func=lambda service: f"{service.code} - {service.description}"
+        )
+        add_col.write("")  # Align the button with the select box
+        if add_col.button("Add Line", key="add_catalog_line", disabled=service is None):
+            set_items(items + [service.line_item()])
+            st.rerun()
+    
+    with st.expander("Import Timesheet"):
+        st.caption("Upload the time entries exported from your tracker (CSV with client, code and hours columns) "
+                   "to bill a client's hours summed per service code. Catalog codes get their description and rate.")
+        timesheet_file = st.file_uploader("Time entries", type=["csv"], key="timesheet_file")
+        if timesheet_file is None:
+            # The totals of a removed upload are not needed any more
+            st.session_state.pop('timesheet_totals', None)
+        else:
+            try:
+                totals = timesheet_totals(timesheet_file)
+            except Exception as e:
+                st.error(f"Could not read the time entries: {str(e)}")
+                totals = None
+            if totals is not None and totals.clients:
+                timesheet_clients = list(totals.clients)
+                current_client = st.session_state.client_name.casefold()
+                timesheet_client = st.selectbox(
+                    "Client", timesheet_clients, key="timesheet_client",
+                    index=next((i for i, name in enumerate(timesheet_clients) if name.casefold() == current_client), 0)
+                )
+                period = f" from {totals.first_date} to {totals.last_date}" if totals.first_date else ""
+                st.write(f"{totals.entries:,} billable entries{period} ({totals.skipped:,} skipped); "
+                         f"{totals.hours(timesheet_client):,.2f} hours for {timesheet_client}.")
+                if st.button("Replace Items with These Hours", key="use_timesheet"):
+                    set_items(LineItem.from_dict(catalog.resolve(item)) for item in totals.items(timesheet_client))
+                    st.session_state.client_name = timesheet_client
+                    st.rerun()
+            elif totals is not None:
+                st.info("The file has no billable time entries.")
+    
+    with st.expander("Service Catalog"):
+        st.caption("Type a catalog code in the items table, or pick a service above, to fill in its description "
+                   "and default rate. Batch files may reference services by code alone. Fixed unit services are "
+                   "billed at their rate as a fixed amount.")
+        services = list(catalog)
+        edited_catalog = st.data_editor(
+            pd.DataFrame({
+                "code": pd.Series([service.code for service in services], dtype=object),
+                "description": pd.Series([service.description for service in services], dtype=object),
+                "rate": pd.Series([service.rate for service in services], dtype="float64"),
+                "unit": pd.Series([service.unit for service in services], dtype=object)
+            }),
+            key="service_catalog_editor",
+            num_rows="dynamic",
+            hide_index=True,
+            use_container_width=True,
+            column_order=SERVICE_FIELDS,
+            column_config={
+                "code": st.column_config.TextColumn("Code", required=True),
+                "description": st.column_config.TextColumn("Description", width="large"),
+                "rate": st.column_config.NumberColumn("Default Rate ($)", format="%.2f", step=0.01),
+                "unit": st.column_config.SelectboxColumn("Unit", options=UNITS, default=DEFAULT_UNIT)
+            }
+        )
+        if st.button("Save Catalog", key="save_catalog"):
+            try:
+                rows = edited_catalog.astype(object).where(edited_catalog.notna(), None).to_dict("records")
+                saved = [Service.from_dict(row) for row in rows if row.get("code")]
+                get_invoice_store().save_services(current_company_id(), saved)
+                get_service_catalog.clear()
+                st.success(f"Service catalog saved ({len(saved)} services).")
+            except Exception as e:
+                st.error(f"Could not save the service catalog: {str(e)}")
+
+# Options & Notes Tab
+with tabs[2]:
+    st.header("Options and Notes")
+    
+    # Add column for custom headings and column names
+    st.subheader("Custom Invoice Table Labels")
+    
+    # Use a smaller column width for the section heading
+    col1, _ = st.columns([2, 6])  # Use 2/8 = 25% of the width
+    with col1:
+        services_heading = st.text_input("Section Heading", 
+                                       value=st.session_state.services_heading, 
+                                       key="services_heading_input",
+                                       on_change=update_service_heading)
+    
+    st.markdown("**Custom Column Names:**")
+    cols = st.columns(5)  # Create 5 equal columns for each input field
+    
+    with cols[0]:
+        service_item_col = st.text_input("Service Item", 
+                                       value=st.session_state.service_item_col,
+                                       key="service_item_col_input",
+                                       on_change=update_service_item_col)
+    with cols[1]:
+        description_col = st.text_input("Description", 
+                                      value=st.session_state.description_col,
+                                      key="description_col_input",
+                                      on_change=update_description_col)
+    with cols[2]:
+        hours_col = st.text_input("Hours", 
+                                value=st.session_state.hours_col,
+                                key="hours_col_input",
+                                on_change=update_hours_col)
+    with cols[3]:
+        rate_col = st.text_input("Rate", 
+                               value=st.session_state.rate_col,
+                               key="rate_col_input",
+                               on_change=update_rate_col)
+    with cols[4]:
+        amount_col = st.text_input("Amount", 
+                                 value=st.session_state.amount_col,
+                                 key="amount_col_input",
+                                 on_change=update_amount_col)
+    
+    st.markdown("---")
+    st.subheader("Invoice Notes and Settings")
+    
+    # Create dynamic default text with company name
+    company_name_for_notes = st.session_state.get('company_name', 'Your Company')
+    dynamic_default = f"Payment is due within 30 days. Please make checks payable to {company_name_for_notes}."
+    
+    # Use the dynamic default if notes are empty or contain the old placeholder
+    current_notes = st.session_state.notes
+    
+    # If the current notes contain the old placeholder, update to the new dynamic version
+    if '[Company Name]' in current_notes:
+        current_notes = current_notes.replace('[Company Name]', company_name_for_notes)
+        st.session_state.notes = current_notes
+    
+    notes = st.text_area("Notes", value=current_notes, height=100, 
+                        placeholder=dynamic_default,
+                        help=f"Default note includes your company name: {company_name_for_notes}")
+    tax_rate = st.number_input("Tax Rate (%)", value=st.session_state.tax_rate, min_value=0.0, step=0.1)
+    discount = st.number_input("Discount (%)", value=st.session_state.discount, min_value=0.0, max_value=100.0, step=0.1)
+    
+    # Add date fields
+    if 'invoice_date' not in st.session_state:
+        st.session_state.invoice_date = datetime.now().date()
+    if 'due_date' not in st.session_state:
+        st.session_state.due_date = (datetime.now() + timedelta(days=30)).date()
+        
+    invoice_date = st.date_input("Invoice Date", value=st.session_state.invoice_date)
+    due_date = st.date_input("Due Date", value=st.session_state.due_date)
+    
+    # Save to session state
+    if st.button("Save Options & Notes", key="save_options_notes"):
+        # Prevent double-clicking by checking if already processing
+        if 'save_options_processing' not in st.session_state:
+            st.session_state.save_options_processing = True
+            
+            st.session_state.notes = notes
+            st.session_state.tax_rate = tax_rate
+            st.session_state.discount = discount
+            st.session_state.invoice_date = invoice_date
+            st.session_state.due_date = due_date
+            # Save custom headings and column names
+            st.session_state.services_heading = services_heading
+            st.session_state.service_item_col = service_item_col
+            st.session_state.description_col = description_col
+            st.session_state.hours_col = hours_col
+            st.session_state.rate_col = rate_col
+            st.session_state.amount_col = amount_col
+            try:
+                get_invoice_store().save_company(st.session_state.company_name, st.session_state.company_address,
+                                                 notes=notes, tax_rate=tax_rate, discount=discount)
+            except Exception as e:
+                print(f"Error saving company profile: {e}")
+            st.success("Options and notes saved!")
+            # Clear processing flag
+            del st.session_state.save_options_processing
+
+# Preview Tab
+with tabs[4]:
+    st.header("Invoice Generation")
+    
+    if st.toggle("Live preview", key="live_preview_enabled", help="Show a draft of the first page that updates as you edit"):
+        live_preview()
+    
+    record_stats = st.checkbox("Record render stats", key="render_stats_enabled",
+                               help="Measure the time and memory of every rendering stage")
+    
+    if st.button("Generate and Download Invoice", key="generate_invoice_button",
+                 disabled=bool(st.session_state.get('render_job'))):
+        # Prevent double-clicking by checking if already processing
+        if 'generate_invoice_processing' not in st.session_state:
+            st.session_state.generate_invoice_processing = True
+            
+            try:
+                # Keep a copy in the invoice store so it can be reopened from the History tab
+                save_invoice()
+                # Rendering happens on the shared render queue; this run only hands the invoice over
+                st.session_state.render_job = get_render_queue().submit(
+                    company_settings(),
+                    collect_invoice_inputs(),
+                    stats=get_render_stats() if record_stats else None
+                )
+            except DuplicateInvoiceNumber as e:
+                st.error(f"{e}. Change it or use \"Next free number\" on the Client Info tab.")
+            except QueueFull as e:
+                st.warning(f"The server is busy rendering other invoices. {e}")
+            except Exception as e:
+                st.error(f"Error generating invoice: {str(e)}")
+            
+            # Clear processing flag
+            del st.session_state.generate_invoice_processing 
+    
+    if st.session_state.get('render_job'):
+        render_job_progress()
+    
+    # The progress fragment polls on a timer, and each of its runs releases the media files of the page;
+    # the previous PDF is not offered while the next one is rendered
+    rendered_pdf = None if st.session_state.get('render_job') else st.session_state.get('rendered_pdf')
+    pdf_data = get_render_cache().get(rendered_pdf["key"]) if rendered_pdf and rendered_pdf["key"] else None
+    if rendered_pdf and pdf_data is None:
+        st.info("The generated PDF is no longer cached on the server. Generate the invoice again to download it.")
+        st.session_state.rendered_pdf = None
+    if pdf_data is not None:
+        # The PDF is registered once; the download link and the preview fetch the same server-side file
+        try:
+            pdf_url = pdf_media_url(pdf_data, file_name=rendered_pdf["file_name"])
+            if pdf_url:
+                file_name = html.escape(rendered_pdf["file_name"], quote=True)
+                st.markdown(f'<a href="{pdf_url}" download="{file_name}">Download Invoice PDF</a>', unsafe_allow_html=True)
+                pdf_display = f'<iframe src="{pdf_url}" width="100%" height="800" type="application/pdf"></iframe>'
+                st.markdown(pdf_display, unsafe_allow_html=True)
+        except Exception as e:
+            st.error(f"Could not display preview: {e}")
+    
+    render_record = st.session_state.get('render_record')
+    if record_stats and render_record:
+        with st.expander("Render stats"):
+            summary = f"{render_record.total_ms:.1f} ms in total, {render_record.output_bytes:,} bytes"
+            if render_record.pages:
+                summary += f", {render_record.pages} pages"
+            if render_record.cached:
+                summary += " (served from the render cache)"
+            st.write(summary)
+            st.table([
+                {
+                    "Stage": name,
+                    "Time (ms)": f"{stage['ms']:.2f}",
+                    "Allocated (KB)": f"{stage.get('alloc_bytes', 0) / 1024:,.1f}",
+                    "Peak (KB)": f"{stage.get('peak_bytes', 0) / 1024:,.1f}"
+                }
+                for name, stage in render_record.stages.items()
+            ])
+    
+    if st.checkbox("Show session memory", key="session_memory_enabled",
+                   help="Estimate the memory this session holds on the server"):
+        with st.expander("Session memory", expanded=True):
+            report = session_memory_report(st.session_state)
+            limit = session_state_limit()
+            summary = f"About {report['total_bytes'] / 1024:,.1f} KB of session state"
+            if limit is not None:
+                summary += f" (limit {limit / 1024:,.0f} KB)"
+            st.write(summary)
+            st.table([
+                {"Key": key, "Size (KB)": f"{size / 1024:,.1f}"}
+                for key, size in report['entries'][:SESSION_REPORT_ROWS]
+            ])
+            logos = get_logo_store().stats()
+            renders = get_render_cache().stats()
+            st.caption(f"Shared by all sessions: {logos['logos']} uploaded logos ({logos['bytes'] / 1024:,.1f} KB) "
+                       f"and {renders['entries']} cached PDFs ({renders['bytes'] / 1024:,.1f} KB).")
+
+
+# Batch Export Tab
+with tabs[5]:
+    st.header("Batch Export")
+    st.write("Render many invoices at once from a CSV (one line item per row) or JSONL (one invoice per line) "
+             "file, using the company and options set in the other tabs.")
+    
+    batch_file = st.file_uploader("Invoices file", type=["csv", "jsonl"], key="batch_file")
+    bundle_format = st.radio("Bundle", BUNDLE_FORMATS, horizontal=True, key="bundle_format",
+                             format_func=lambda fmt: "ZIP of PDFs" if fmt == 'zip' else "One PDF with bookmarks")
+    
+    if st.button("Render Bundle", key="render_bundle_button", disabled=batch_file is None):
+        status = st.empty()
+        try:
+            manifest, url = export_bundle(
+                batch_file, bundle_format,
+                progress=lambda done: status.caption(f"{done} invoices rendered...")
+            )
+            st.session_state.batch_export = {"url": url, "summary": manifest['summary']}
+        except Exception as e:
+            st.error(f"Error rendering bundle: {str(e)}")
+        status.empty()
+    
+    batch_export = st.session_state.get('batch_export')
+    if batch_export:
+        summary = batch_export["summary"]
+        st.write(f"Rendered {summary['rendered']} of {summary['invoices']} invoices "
+                 f"({summary['failed']} failed) in {summary['wall_time_s']:.1f}s, "
+                 f"{summary['bundle_bytes'] / 1024 / 1024:,.1f} MB.")
+        # A plain link: the browser downloads the file from disk instead of through the session
+        st.markdown(f'<a href="{batch_export["url"]}" download="{summary["bundle"]}">Download {summary["bundle"]}</a>',
+                    unsafe_allow_html=True)
+
+# History Tab
+with tabs[6]:
+    st.header("Invoice History")
+    
+    search_col, from_col, to_col = st.columns([2, 1, 1])
+    search_text = search_col.text_input("Search", key="history_search",
+                                        placeholder="Start of an invoice number or client name")
+    date_from = from_col.date_input("From", value=None, key="history_date_from")
+    date_to = to_col.date_input("To", value=None, key="history_date_to")
+    
+    try:
+        store = get_invoice_store()
+        company_id = current_company_id()
+        results = store.search_invoices(company_id, search_text, date_from=date_from, date_to=date_to,
+                                        limit=HISTORY_LIMIT)
+        st.caption(f"Saved invoices of {st.session_state.company_name}: {store.invoice_count(company_id):,}. "
+                   "Invoices are saved when they are generated.")
+    except Exception as e:
+        st.error(f"Could not search saved invoices: {str(e)}")
+        results = []
+    
+    if results:
+        st.dataframe(
+            pd.DataFrame({
+                "Invoice": [row["invoice_number"] for row in results],
+                "Client": [row["client_name"] for row in results],
+                "Date": [row["invoice_date"] for row in results],
+                "Due": [row["due_date"] for row in results],
+                "Total ($)": [format_money(row["total_cents"]) for row in results]
+            }),
+            hide_index=True,
+            use_container_width=True
+        )
+        
+        selected = st.selectbox(
+            "Saved invoice", results, key="history_selected",
+            format_func=lambda row: f"{row['invoice_number']} - {row['client_name']} ({row['invoice_date'] or 'no date'})"
+        )
+        open_col, duplicate_col = st.columns(2)
+        if open_col.button("Open", key="history_open", help="Edit this invoice; generating it again updates it"):
+            try:
+                open_invoice(store.load_invoice(selected["id"]), selected["id"])
+                st.rerun()
+            except Exception as e:
+                st.error(f"Could not open invoice: {str(e)}")
+        if duplicate_col.button("Duplicate", key="history_duplicate",
+                                help="Start a new invoice with the same client and items under the next free number"):
+            try:
+                open_invoice(store.duplicate_invoice(selected["id"]))
+                st.rerun()
+            except Exception as e:
+                st.error(f"Could not duplicate invoice: {str(e)}")
+    elif search_text or date_from or date_to:
+        st.info("No saved invoices match the search.")
+
+# Bound the state a long-lived session holds; only checked when SESSION_STATE_LIMIT_MB is set
+enforce_session_limit()
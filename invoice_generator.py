@@ -0,0 +1,691 @@
+from fpdf import FPDF
+import io
+import time
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from fonts import CORE_FAMILY, GlyphSet, bmp_text, choose_family, fonts_key, latin1_text, put_truetype_font
+from fonts import register_fonts
+from logo_cache import LOGO_WIDTH_MM, load_default_logo, logo_cache
+from pdf_cache import invoice_cache_key
+from pricing import ItemBatch, compute_totals, format_money
+from render_stats import NULL_TIMER, RenderRecord
+
+# Colors
+TEAL_COLOR = (0, 156, 166)
+DARK_BLUE = (0, 51, 102)
+LIGHT_GRAY = (240, 240, 240)
+
+# Default column names of the services table
+DEFAULT_COLUMN_NAMES = {
+    'service_item': 'Service Item',
+    'description': 'Description',
+    'hours': 'Hours',
+    'rate': 'Rate ($)',
+    'amount': 'Amount ($)'
+}
+
+# Widths in mm of the service item, description, hours, rate and amount columns
+COLUMN_WIDTHS = (25, 65, 30, 30, 40)
+
+# Row height of single-line item rows and line height of wrapped descriptions
+ROW_HEIGHT = 7
+LINE_HEIGHT = 5
+
+# Number of items priced together while streaming the item table
+PRICING_CHUNK = 512
+
+# Font styles used anywhere on the invoice, registered in this order in every document
+FONT_STYLES = ('', 'B', 'I')
+
+def _format_dates(invoice_date, due_date):
+    """Return the invoice and due dates as text; by default today and 30 days from now"""
+    if invoice_date:
+        current_date = invoice_date.strftime('%Y-%m-%d')
+    else:
+        current_date = datetime.now().strftime('%Y-%m-%d')
+    
+    if due_date:
+        due_date_str = due_date.strftime('%Y-%m-%d')
+    else:
+        due_date_str = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
+    return current_date, due_date_str
+
+
+class _ByteCounter:
+    """Binary stream wrapper counting the bytes written, standing in for FPDF.buffer"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.written = 0
+    
+    def write(self, data):
+        self.stream.write(data)
+        self.written += len(data)
+    
+    def __len__(self):
+        # FPDF records object offsets as len(self.buffer)
+        return self.written
+
+
+class StreamPDF(FPDF):
+    """
+    FPDF writing the finished document straight into a binary stream.
+    
+    FPDF 1.7 assembles the document in a str, one concatenation per line and
+    with every compressed page and image decoded to latin-1 first, and output()
+    then copies it again into bytes. Here the document objects are encoded
+    once and written to the stream as they are produced; page contents are
+    still collected by FPDF until the document is closed.
+    
+    Text is made printable with the selected font instead of failing on output,
+    and TrueType fonts (see fonts.py) are embedded from cached subsets.
+    """
+    
+    # Font family of the invoice body, set by InvoiceTemplate.new_document
+    family = CORE_FAMILY
+    
+    def normalize_text(self, txt):
+        if not isinstance(txt, str):
+            return txt
+        return bmp_text(txt) if self.unifontsubset else latin1_text(txt)
+    
+    def _putfonts(self):
+        # FPDF writes the core fonts; TrueType fonts the document never used are left out
+        truetype = {key: font for key, font in self.fonts.items() if 'truetype' in font}
+        for key in truetype:
+            del self.fonts[key]
+        FPDF._putfonts(self)
+        for key, font in sorted(truetype.items(), key=lambda entry: entry[1]['i']):
+            if font['subset']:
+                self.fonts[key] = font
+                put_truetype_font(self, font)
+    
+    def _out(self, s):
+        if self.state == 2 or not isinstance(self.buffer, _ByteCounter):
+            FPDF._out(self, s)
+            return
+        if not isinstance(s, bytes):
+            s = str(s).encode('latin1')
+        self.buffer.write(s)
+        self.buffer.write(b"\n")
+    
+    def output_to(self, stream):
+        """Close the document, write it to a binary stream and return the number of bytes written"""
+        self.buffer = _ByteCounter(stream)
+        if self.state < 3:
+            self.close()
+        return self.buffer.written
+
+
+class InvoiceTemplate:
+    """
+    Company-level part of an invoice, compiled once and reused for every invoice.
+
+    The logo, company block, teal "INVOICE" bar, services table header and footer
+    only change with the company settings. They are drawn once into a scratch
+    document and the resulting PDF content streams are replayed into each new
+    invoice together with the already registered font and logo resources, so
+    per invoice only the client, items and totals are laid out.
+    """
+
+    def __init__(self, company_name, company_address, logo=None, column_names=None):
+        self.company_name = company_name
+        self.column_names = column_names or DEFAULT_COLUMN_NAMES
+        
+        # Company details and column names decide the font of the parts compiled here
+        self.family = choose_family(chain([company_name, company_address], self.column_names.values()))
+        
+        pdf = StreamPDF(orientation='P', unit='mm', format='A4')
+        pdf.add_page()
+        # Register the fonts up front so their numbers are the same in every invoice
+        register_fonts(pdf, FONT_STYLES)
+        self.k = pdf.k
+        
+        # Header is recorded at its final position on the first page
+        self.header_stream = self._record(pdf, lambda: self._draw_header(pdf, company_address, logo))
+        self.header_bottom = pdf.get_y()
+        
+        # Table header and footer are recorded at y=0 and translated when replayed
+        pdf.set_xy(pdf.l_margin, 0)
+        self.table_header_stream = self._record(pdf, lambda: self._draw_table_header(pdf))
+        self.table_header_height = pdf.get_y()
+        
+        pdf.set_xy(pdf.l_margin, 0)
+        self.footer_stream = self._record(pdf, lambda: self._draw_footer(pdf))
+        self.footer_height = pdf.get_y()
+        
+        self.fonts = pdf.fonts
+        self.images = pdf.images
+    
+    @staticmethod
+    def _record(pdf, draw):
+        """Run draw() and return the content stream it appended to the current page"""
+        start = len(pdf.pages[pdf.page])
+        # Make every recorded stream self-contained: select its own font and colors
+        pdf.font_family = ''
+        pdf.set_draw_color(0, 0, 0)
+        pdf.set_fill_color(0, 0, 0)
+        pdf.set_text_color(0, 0, 0)
+        draw()
+        return pdf.pages[pdf.page][start:]
+    
+    def _draw_header(self, pdf, company_address, logo):
+        # Add logo if available
+        if logo:
+            logo.embed(pdf, x=10, y=10, w=LOGO_WIDTH_MM)
+        
+        # Company information - positioned to the right of the logo
+        pdf.set_xy(45, 10)  # Set position after the logo
+        pdf.set_font(self.family, 'B', 16)
+        pdf.set_text_color(*DARK_BLUE)
+        pdf.cell(0, 10, self.company_name, ln=True)
+        
+        pdf.set_x(45)  # Keep the x position for address lines
+        pdf.set_font(self.family, '', 10)
+        pdf.set_text_color(80, 80, 80)
+        for line in company_address.split('\n'):
+            pdf.set_x(45)  # Reset x position before each line
+            pdf.cell(0, 5, line, ln=True)
+        
+        # Invoice title
+        pdf.ln(10)
+        pdf.set_fill_color(*TEAL_COLOR)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font(self.family, 'B', 14)
+        pdf.cell(0, 10, 'INVOICE', ln=True, fill=True)
+    
+    def _draw_table_header(self, pdf):
+        column_names = self.column_names
+        pdf.set_fill_color(*LIGHT_GRAY)
+        pdf.set_font(self.family, 'B', 10)
+        widths = COLUMN_WIDTHS
+        pdf.cell(widths[0], ROW_HEIGHT, column_names['service_item'], 1, 0, 'L', True)
+        pdf.cell(widths[1], ROW_HEIGHT, column_names['description'], 1, 0, 'L', True)
+        pdf.cell(widths[2], ROW_HEIGHT, column_names['hours'], 1, 0, 'R', True)
+        pdf.cell(widths[3], ROW_HEIGHT, column_names['rate'], 1, 0, 'R', True)
+        pdf.cell(widths[4], ROW_HEIGHT, column_names['amount'], 1, 1, 'R', True)
+    
+    def _draw_footer(self, pdf):
+        pdf.set_font(self.family, 'I', 8)
+        pdf.set_text_color(128, 128, 128)
+        pdf.cell(0, 5, 'Thank you for your business!', 0, 1, 'C')
+        pdf.cell(0, 5, self.company_name, 0, 1, 'C')
+    
+    def _replay(self, pdf, stream, y):
+        """Append a recorded stream to the current page, shifted down to y"""
+        # q/Q keep the fonts and colors selected by the stream out of the invoice's state
+        pdf._out('q 1 0 0 1 0 %.2f cm' % (-y * self.k))
+        pdf._out(stream)
+        pdf._out('Q')
+    
+    def new_document(self, family=CORE_FAMILY):
+        """Create a PDF with the resources and header already in place, writing its body in family"""
+        pdf = StreamPDF(orientation='P', unit='mm', format='A4')
+        pdf.family = family
+        # FPDF updates and trims these dictionaries while writing, so copy them
+        pdf.fonts = {key: dict(font) for key, font in self.fonts.items()}
+        for font in pdf.fonts.values():
+            if 'truetype' in font:
+                # Characters of the compiled header are already part of the subset
+                font['subset'] = GlyphSet(font['subset'])
+        pdf.images = {name: dict(info) for name, info in self.images.items()}
+        pdf.add_page()
+        self._replay(pdf, self.header_stream, 0)
+        pdf.set_y(self.header_bottom)
+        return pdf
+    
+    def draw_table_header(self, pdf):
+        """Draw the services table header at the current position"""
+        if pdf.get_y() + self.table_header_height > pdf.page_break_trigger:
+            pdf.add_page()
+        self._replay(pdf, self.table_header_stream, pdf.get_y())
+        pdf.set_y(pdf.get_y() + self.table_header_height)
+    
+    def draw_items(self, pdf, items, progress=None, max_pages=None):
+        """
+        Draw the item rows of the services table and return the subtotal in cents.
+        
+        items may be any iterable (including a generator); rows are consumed in
+        chunks of PRICING_CHUNK, each priced in one vectorized pass, so memory
+        stays flat for very long invoices. Long descriptions wrap inside their
+        cell. When a page fills up, the page subtotal and the running total are
+        printed, and the next page starts with the table header again followed
+        by the amount brought forward. progress, if given, is called with the
+        number of rows drawn after every chunk.
+        
+        With max_pages, layout stops when the table would continue past that
+        page: the last page closes with its subtotals and None is returned.
+        """
+        widths = COLUMN_WIDTHS
+        # Keep room at the bottom of each page for the two carried-forward rows
+        bottom = pdf.page_break_trigger - 2 * ROW_HEIGHT
+        description_width = widths[1] - 2 * pdf.c_margin
+        
+        pdf.set_font(pdf.family, '', 10)
+        subtotal = 0
+        page_subtotal = 0
+        rows_on_page = 0
+        rows_drawn = 0
+        
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, PRICING_CHUNK))
+            if not chunk:
+                break
+            # Price the whole chunk in one pass; amounts are exact integer cents
+            amounts = ItemBatch.from_items(chunk).line_amounts().tolist()
+            for item, amount in zip(chunk, amounts):
+                service_item = item.get('service_item', '')
+                description = item['description']
+                
+                # Check if it's a fixed amount item or hours/rate calculation
+                if item.get('amount') is not None:
+                    hours_display = 'N/A'
+                    rate_display = 'N/A'
+                else:
+                    hours_display = f"{float(item['hours']):.2f}"
+                    rate_display = f"{float(item['rate']):.2f}"
+                
+                # Most descriptions fit on one line; only measure line breaks for the rest
+                if '\n' in description or pdf.get_string_width(description) > description_width:
+                    lines = pdf.multi_cell(widths[1], LINE_HEIGHT, description, split_only=True)
+                else:
+                    lines = None
+                
+                if lines is None:
+                    # Every row is checked, the first one on a page included
+                    if pdf.get_y() + ROW_HEIGHT > bottom:
+                        if max_pages and pdf.page >= max_pages:
+                            self._draw_carried_forward(pdf, page_subtotal, subtotal)
+                            return None
+                        self._break_page(pdf, page_subtotal, subtotal)
+                        page_subtotal = 0
+                        rows_on_page = 0
+                    subtotal += amount
+                    page_subtotal += amount
+                    rows_on_page += 1
+                    pdf.cell(widths[0], ROW_HEIGHT, service_item, 1)
+                    pdf.cell(widths[1], ROW_HEIGHT, description, 1)
+                    pdf.cell(widths[2], ROW_HEIGHT, hours_display, 1, 0, 'R')
+                    pdf.cell(widths[3], ROW_HEIGHT, rate_display, 1, 0, 'R')
+                    pdf.cell(widths[4], ROW_HEIGHT, format_money(amount), 1, 1, 'R')
+                    continue
+                
+                # A wrapped row that does not fit moves to the next page whole when it
+                # fits there; otherwise (taller than a page, or alone on its page) it is
+                # split between pages, with the amount printed on its first part
+                first_part = True
+                while lines:
+                    row_height = max(ROW_HEIGHT, len(lines) * LINE_HEIGHT + 2)
+                    space = bottom - pdf.get_y()
+                    if row_height <= space:
+                        part = lines
+                    elif first_part and rows_on_page and row_height <= bottom - self._continued_top(pdf):
+                        part = []
+                    else:
+                        part = lines[:max(0, int((space - 2) // LINE_HEIGHT))]
+                    if part:
+                        if first_part:
+                            subtotal += amount
+                            page_subtotal += amount
+                            self._draw_wrapped_row(pdf, service_item, part, hours_display, rate_display,
+                                                   format_money(amount))
+                            first_part = False
+                        else:
+                            self._draw_wrapped_row(pdf, '', part, '', '', '')
+                        rows_on_page += 1
+                        lines = lines[len(part):]
+                    if lines:
+                        if max_pages and pdf.page >= max_pages:
+                            self._draw_carried_forward(pdf, page_subtotal, subtotal)
+                            return None
+                        self._break_page(pdf, page_subtotal, subtotal)
+                        page_subtotal = 0
+                        rows_on_page = 0
+            
+            rows_drawn += len(chunk)
+            if progress is not None:
+                progress(rows_drawn)
+        
+        return subtotal
+    
+    def _continued_top(self, pdf):
+        """Position of the first item row on a page that continues the services table"""
+        return pdf.t_margin + self.table_header_height + ROW_HEIGHT
+    
+    def _break_page(self, pdf, page_subtotal, subtotal):
+        """Close the page with its subtotals and continue the table on a new page"""
+        self._draw_carried_forward(pdf, page_subtotal, subtotal)
+        pdf.add_page()
+        self.draw_table_header(pdf)
+        self._draw_total_row(pdf, 'Brought forward', subtotal)
+        pdf.set_font(pdf.family, '', 10)
+    
+    def _draw_wrapped_row(self, pdf, service_item, lines, hours_display, rate_display, amount_display):
+        """Draw a row whose description wraps over lines, top-aligning the text"""
+        widths = COLUMN_WIDTHS
+        row_height = max(ROW_HEIGHT, len(lines) * LINE_HEIGHT + 2)
+        x = pdf.get_x()
+        y = pdf.get_y()
+        pdf.cell(widths[0], row_height, '', 1)
+        pdf.cell(widths[1], row_height, '', 1)
+        pdf.cell(widths[2], row_height, hours_display, 1, 0, 'R')
+        pdf.cell(widths[3], row_height, rate_display, 1, 0, 'R')
+        pdf.cell(widths[4], row_height, amount_display, 1, 0, 'R')
+        pdf.set_xy(x, y + 1)
+        pdf.cell(widths[0], LINE_HEIGHT, service_item)
+        for line in lines:
+            pdf.set_xy(x + widths[0], pdf.get_y())
+            pdf.cell(widths[1], LINE_HEIGHT, line, ln=2)
+        pdf.set_xy(x, y + row_height)
+    
+    def _draw_carried_forward(self, pdf, page_subtotal, subtotal):
+        self._draw_total_row(pdf, f'Page {pdf.page_no()} subtotal', page_subtotal)
+        self._draw_total_row(pdf, 'Carried forward', subtotal)
+    
+    def _draw_total_row(self, pdf, label, amount):
+        """Draw a table row with a label spanning the first four columns"""
+        widths = COLUMN_WIDTHS
+        pdf.set_font(pdf.family, 'B', 10)
+        pdf.cell(sum(widths[:4]), ROW_HEIGHT, f'{label}:', 1, 0, 'R')
+        pdf.cell(widths[4], ROW_HEIGHT, format_money(amount), 1, 1, 'R')
+    
+    def draw_footer(self, pdf):
+        """Draw the thank-you footer at the current position"""
+        if pdf.get_y() + self.footer_height > pdf.page_break_trigger:
+            pdf.add_page()
+        self._replay(pdf, self.footer_stream, pdf.get_y())
+        pdf.set_y(pdf.get_y() + self.footer_height)
+
+
+class InvoiceGenerator:
+    # Number of compiled templates (one per set of column names) kept per generator
+    MAX_TEMPLATES = 8
+    
+    def __init__(self, company_name, company_address, logo=None, logos=None, render_cache=None, stats=None):
+        self.company_name = company_name
+        self.company_address = company_address
+        self.logo = None
+        self._templates = {}
+        # Optional pdf_cache.RenderCache returning PDFs of previously rendered invoices
+        self.render_cache = render_cache
+        # Optional render_stats.RenderStats; last_record holds the stats of the latest render
+        self.stats = stats
+        self.last_record = None
+        # Render cache key of the latest generate_invoice call (None when it was not cached)
+        self.last_cache_key = None
+        start = time.perf_counter()
+        
+        # Logos are normalized once and shared by every invoice rendered with this generator
+        cache = logos if logos is not None else logo_cache
+        
+        # If custom logo is provided, use it
+        if logo is not None:
+            try:
+                # Accept raw bytes (batch mode) as well as uploaded file objects
+                logo_bytes = logo if isinstance(logo, bytes) else logo.getvalue()
+                self.logo = cache.get(logo_bytes)
+            except Exception as e:
+                print(f"Error processing logo: {e}")
+        else:
+            # Use default logo from the asset folder
+            default_logo = load_default_logo()
+            if default_logo is not None:
+                try:
+                    self.logo = cache.get(default_logo)
+                except Exception as e:
+                    print(f"Error loading default logo: {e}")
+        
+        if stats is not None:
+            stats.observe_stage('logo', time.perf_counter() - start)
+    
+    def template(self, column_names=None):
+        """Return the compiled InvoiceTemplate for the given column names"""
+        column_names = column_names or DEFAULT_COLUMN_NAMES
+        key = tuple(column_names[name] for name in DEFAULT_COLUMN_NAMES)
+        template = self._templates.get(key)
+        if template is None:
+            if len(self._templates) >= self.MAX_TEMPLATES:
+                self._templates.clear()
+            template = InvoiceTemplate(self.company_name, self.company_address, self.logo, column_names)
+            self._templates[key] = template
+        return template
+    
+    def cache_key(self, invoice_number, client_name, client_address, client_email,
+                  items, notes=None, tax_rate=6.0, discount=0.0, invoice_date=None, due_date=None,
+                  services_heading="Services", column_names=None, max_pages=None):
+        """
+        Return the content hash of an invoice, taking the same arguments as
+        generate_invoice. Two calls return the same key exactly when they would
+        produce the same PDF.
+        """
+        current_date, due_date_str = _format_dates(invoice_date, due_date)
+        return invoice_cache_key({
+            'company_name': self.company_name,
+            'company_address': self.company_address,
+            'logo': self.logo.digest if self.logo else None,
+            'invoice_number': invoice_number,
+            'client_name': client_name,
+            'client_address': client_address,
+            'client_email': client_email,
+            'items': items,
+            'notes': notes,
+            'tax_rate': tax_rate,
+            'discount': discount,
+            'invoice_date': current_date,
+            'due_date': due_date_str,
+            'services_heading': services_heading,
+            'column_names': column_names or DEFAULT_COLUMN_NAMES,
+            'max_pages': max_pages,
+            'fonts': fonts_key(),
+        })
+    
+    def generate_invoice(self, invoice_number, client_name, client_address, client_email, 
+                         items, notes=None, tax_rate=6.0, discount=0.0, invoice_date=None, due_date=None,
+                         services_heading="Services", column_names=None, max_pages=None, progress=None,
+                         output=None):
+        """
+        Generate a PDF invoice
+        
+        Parameters:
+        - invoice_number: Invoice identifier
+        - client_name: Name of the client
+        - client_address: Address of the client
+        - client_email: Email of the client
+        - items: Iterable (list or generator) of models.LineItem objects or dictionaries with keys 'service_item', 'description', 'hours', 'rate', 'amount'
+        - notes: Additional notes to include on the invoice
+        - tax_rate: Tax rate percentage
+        - discount: Discount percentage
+        - invoice_date: Invoice date (datetime.date object)
+        - due_date: Due date (datetime.date object)
+        - services_heading: Custom heading for the services section
+        - column_names: Dictionary of custom column names {'service_item', 'description', 'hours', 'rate', 'amount'}
+        - max_pages: Only lay out and output the first max_pages pages (used for drafts and previews)
+        - progress: Optional callable receiving the number of item rows laid out so far
+        - output: Optional binary stream (open file, BytesIO, ...) the PDF is written into
+        
+        Returns:
+        - PDF bytes, or the number of bytes written when output is given. Pass an
+          io.BytesIO as output and use its getbuffer() for a memoryview without a copy
+        """
+        timer = self.stats.timer() if self.stats is not None else NULL_TIMER
+        current_date, due_date_str = _format_dates(invoice_date, due_date)
+        
+        # Reuse a previous rendering of identical inputs; streamed items are never cached
+        cache_key = self.last_cache_key = None
+        if self.render_cache is not None and isinstance(items, (list, tuple)):
+            cache_key = self.cache_key(invoice_number, client_name, client_address, client_email, items,
+                                       notes, tax_rate, discount, invoice_date, due_date,
+                                       services_heading, column_names, max_pages)
+            self.last_cache_key = cache_key
+            cached = self.render_cache.get(cache_key)
+            timer.lap('cache')
+            if cached is not None:
+                self._record_stats(timer, invoice_number, items, len(cached), cached=True)
+                if output is not None:
+                    output.write(cached)
+                    return len(cached)
+                return cached
+        
+        # Company-level layout is compiled once and replayed here
+        template = self.template(column_names)
+        # Text outside latin-1 switches the invoice to the TrueType font; streamed items cannot be checked ahead
+        texts = [invoice_number, client_name, client_address, client_email, notes, services_heading]
+        if isinstance(items, (list, tuple)):
+            family = choose_family(chain(texts, (item.get('service_item') for item in items),
+                                         (item['description'] for item in items)))
+        else:
+            family = choose_family(texts, unknown=True)
+        pdf = template.new_document(family)
+        timer.lap('header')
+        
+        # Invoice details
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font(pdf.family, 'B', 10)
+        
+        pdf.ln(5)
+        pdf.cell(30, 7, 'Invoice #:', 0)
+        pdf.set_font(pdf.family, '', 10)
+        pdf.cell(0, 7, invoice_number, ln=True)
+        
+        pdf.set_font(pdf.family, 'B', 10)
+        pdf.cell(30, 7, 'Date:', 0)
+        pdf.set_font(pdf.family, '', 10)
+        pdf.cell(0, 7, current_date, ln=True)
+        
+        pdf.set_font(pdf.family, 'B', 10)
+        pdf.cell(30, 7, 'Due Date:', 0)
+        pdf.set_font(pdf.family, '', 10)
+        pdf.cell(0, 7, due_date_str, ln=True)
+        
+        # Client information
+        pdf.ln(10)
+        pdf.set_font(pdf.family, 'B', 12)
+        pdf.cell(0, 7, 'Bill To:', ln=True)
+        
+        pdf.set_font(pdf.family, 'B', 10)
+        pdf.cell(0, 7, client_name, ln=True)
+        
+        pdf.set_font(pdf.family, '', 10)
+        for line in client_address.split('\n'):
+            pdf.cell(0, 5, line, ln=True)
+        
+        pdf.cell(0, 5, client_email, ln=True)
+        
+        # Services table
+        pdf.ln(10)
+        pdf.set_font(pdf.family, 'B', 12)
+        pdf.cell(0, 7, services_heading, ln=True)
+        
+        # Table header
+        template.draw_table_header(pdf)
+        timer.lap('details')
+        
+        # Table content, laid out over as many pages as needed (and no further than max_pages)
+        subtotal = template.draw_items(pdf, items, progress, max_pages)
+        timer.lap('items')
+        if subtotal is None:
+            # The table runs past max_pages; totals, notes and footer would all come after it
+            return self._output(pdf, timer, invoice_number, items, output, cache_key)
+        
+        # Calculate tax and total, exact to the cent
+        tax_rate = float(tax_rate)
+        discount_rate = float(discount)
+        totals = compute_totals(subtotal, tax_rate, discount_rate)
+        
+        # Totals, kept together on one page
+        totals_height = 5 + ROW_HEIGHT * (4 if discount_rate > 0 else 2) + 10
+        if pdf.get_y() + totals_height > pdf.page_break_trigger:
+            pdf.add_page()
+        pdf.ln(5)
+        pdf.set_x(120)  # Position closer to the right margin
+        pdf.set_font(pdf.family, 'B', 10)
+        pdf.cell(30, 7, 'Subtotal:', 0, 0, 'R')
+        pdf.set_font(pdf.family, '', 10)
+        pdf.cell(40, 7, f"${format_money(totals.subtotal_cents)}", 0, 1, 'R')
+        
+        if discount_rate > 0:
+            pdf.set_x(120)  # Position closer to the right margin
+            pdf.set_font(pdf.family, 'B', 10)
+            pdf.cell(30, 7, f'Discount ({discount_rate}%):', 0, 0, 'R')
+            pdf.set_font(pdf.family, '', 10)
+            pdf.cell(40, 7, f"-${format_money(totals.discount_cents)}", 0, 1, 'R')
+            
+            pdf.set_x(120)  # Position closer to the right margin
+            pdf.set_font(pdf.family, 'B', 10)
+            pdf.cell(30, 7, 'Subtotal after discount:', 0, 0, 'R')
+            pdf.set_font(pdf.family, '', 10)
+            pdf.cell(40, 7, f"${format_money(totals.discounted_subtotal_cents)}", 0, 1, 'R')
+        
+        pdf.set_x(120)  # Position closer to the right margin
+        pdf.set_font(pdf.family, 'B', 10)
+        pdf.cell(30, 7, f'Tax ({tax_rate}%):', 0, 0, 'R')
+        pdf.set_font(pdf.family, '', 10)
+        pdf.cell(40, 7, f"${format_money(totals.tax_cents)}", 0, 1, 'R')
+        
+        pdf.set_draw_color(200, 200, 200)
+        pdf.line(120, pdf.get_y(), 190, pdf.get_y())
+        
+        pdf.set_x(120)  # Position closer to the right margin
+        pdf.set_font(pdf.family, 'B', 12)
+        pdf.cell(30, 10, 'Total:', 0, 0, 'R')
+        pdf.cell(40, 10, f"${format_money(totals.total_cents)}", 0, 1, 'R')
+        timer.lap('totals')
+        
+        # Notes
+        if notes:
+            pdf.ln(10)
+            pdf.set_font(pdf.family, 'B', 10)
+            pdf.cell(0, 7, 'Notes:', ln=True)
+            pdf.set_font(pdf.family, '', 10)
+            pdf.multi_cell(0, 5, notes)
+            timer.lap('notes')
+        
+        # Footer
+        pdf.ln(15)
+        template.draw_footer(pdf)
+        timer.lap('footer')
+        
+        if max_pages and pdf.page > max_pages:
+            # Drop the trailing pages before they are serialized
+            for page in range(max_pages + 1, pdf.page + 1):
+                del pdf.pages[page]
+            pdf.page = max_pages
+        
+        return self._output(pdf, timer, invoice_number, items, output, cache_key)
+    
+    def _output(self, pdf, timer, invoice_number, items, output, cache_key):
+        """Serialize the laid out PDF into output (or bytes), storing it in the render cache under cache_key"""
+        # Serialize the PDF; the cache keeps its own bytes, so it is rendered into memory first
+        pages = pdf.page
+        if output is not None and cache_key is None:
+            size = pdf.output_to(output)
+            timer.lap('output')
+            self._record_stats(timer, invoice_number, items, size, pages)
+            return size
+        
+        buffer = io.BytesIO()
+        pdf.output_to(buffer)
+        pdf_bytes = buffer.getvalue()
+        timer.lap('output')
+        
+        if cache_key is not None:
+            self.render_cache.put(cache_key, pdf_bytes)
+            timer.lap('cache')
+        
+        self._record_stats(timer, invoice_number, items, len(pdf_bytes), pages)
+        if output is not None:
+            output.write(pdf_bytes)
+            return len(pdf_bytes)
+        return pdf_bytes
+    
+    def _record_stats(self, timer, invoice_number, items, output_bytes, pages=None, cached=False):
+        if self.stats is None:
+            return
+        total_ms = timer.total_ms()
+        timer.stop()
+        # Streamed items have been consumed and cannot be counted
+        item_count = len(items) if isinstance(items, (list, tuple)) else None
+        self.last_record = RenderRecord(invoice_number, timer.stages, total_ms, output_bytes,
+                                        item_count, pages, cached)
+        self.stats.record(self.last_record)
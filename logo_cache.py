@@ -0,0 +1,424 @@
+import hashlib
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from io import BytesIO
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SIGNATURE = b'\xff\xd8'
+
+# Width the logo is drawn at on the invoice, and the resolution it is kept at:
+# pixels beyond LOGO_DPI at that width only make the PDF bigger
+LOGO_WIDTH_MM = 30
+LOGO_DPI = 300
+# Opaque logos with more colors than this (photos, gradients) are stored as
+# JPEG; flat artwork is stored as PNG, which keeps edges and text sharp
+MAX_PALETTE_COLORS = 256
+JPEG_QUALITY = 85
+# EXIF tag holding how the camera was turned
+EXIF_ORIENTATION = 0x0112
+
+# PNG color types of normalized logos, as (color space, components written to the PDF)
+_PNG_COLOR_TYPES = {0: ('DeviceGray', 1), 2: ('DeviceRGB', 3), 3: ('Indexed', 1), 6: ('DeviceRGB', 3)}
+# JPEG start-of-frame markers (baseline, extended, progressive, lossless)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3}
+_JPEG_COLOR_SPACES = {1: 'DeviceGray', 3: 'DeviceRGB', 4: 'DeviceCMYK'}
+
+# Default logo shipped with the app, resolved relative to this file so that
+# batch runs started from another directory still find it
+DEFAULT_LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'asset', 'logo.png')
+
+_default_logo_bytes = None
+_default_logo_loaded = False
+
+
+def load_default_logo():
+    """Read the default logo once per process; returns None if it is missing"""
+    global _default_logo_bytes, _default_logo_loaded
+    if not _default_logo_loaded:
+        _default_logo_loaded = True
+        try:
+            with open(DEFAULT_LOGO_PATH, 'rb') as f:
+                _default_logo_bytes = f.read()
+        except Exception as e:
+            # If default logo file doesn't exist, invoices are rendered without a logo
+            print(f"Error loading default logo: {e}")
+    return _default_logo_bytes
+
+
+class NormalizedLogo:
+    """A logo decoded and normalized once, ready to be embedded by FPDF"""
+
+    def __init__(self, digest, image_bytes):
+        self.digest = digest
+        self.image_bytes = image_bytes
+        # Parse the image once; FPDF receives this dictionary instead of a file name
+        self.image_info = _image_info(image_bytes)
+
+    @property
+    def format(self):
+        return 'JPEG' if self.image_bytes[:2] == JPEG_SIGNATURE else 'PNG'
+
+    @property
+    def embedded_bytes(self):
+        """Size of the image streams written into each PDF"""
+        return len(self.image_info['data']) + len(self.image_info.get('smask', b''))
+
+    @property
+    def width(self):
+        return self.image_info['w']
+
+    @property
+    def height(self):
+        return self.image_info['h']
+
+    @property
+    def image_name(self):
+        """Key under which the logo is registered in an FPDF document"""
+        return f"logo-{self.digest}"
+
+    def embed(self, pdf, x, y, w=0, h=0):
+        """Draw the logo on the current page of pdf without re-reading any file"""
+        name = self.image_name
+        if name not in pdf.images:
+            # FPDF drops the image data after writing it out, so hand it a copy
+            info = dict(self.image_info)
+            info['i'] = len(pdf.images) + 1
+            pdf.images[name] = info
+        pdf.image(name, x=x, y=y, w=w, h=h)
+
+
+def _image_info(image_bytes):
+    """Build the FPDF image dictionary for a normalized logo"""
+    if image_bytes[:2] == JPEG_SIGNATURE:
+        return _jpeg_image_info(image_bytes)
+    return _png_image_info(image_bytes)
+
+
+def _png_image_info(png_bytes):
+    """
+    Build the FPDF image dictionary for a gray, RGB, palette or RGBA PNG without
+    decoding pixels. Gray and palette images may have 1, 2, 4 or 8 bits per
+    pixel (Pillow packs palettes of up to 16 colors), the others 8 bits.
+    """
+    if png_bytes[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    pos = 8
+    info = None
+    data = []
+    while pos < len(png_bytes):
+        length, chunk_type = struct.unpack('>I4s', png_bytes[pos:pos + 8])
+        chunk = png_bytes[pos + 8:pos + 8 + length]
+        pos += length + 12
+        if chunk_type == b'IHDR':
+            w, h, bpc, color_type = struct.unpack('>IIBB', chunk[:10])
+            if (color_type not in _PNG_COLOR_TYPES or chunk[12] != 0
+                    or bpc not in ((1, 2, 4, 8) if color_type in (0, 3) else (8,))):
+                raise ValueError("Normalized logos must be non-interlaced gray, palette, or 8-bit RGB or RGBA PNGs")
+            color_space, colors = _PNG_COLOR_TYPES[color_type]
+            info = {
+                'w': w, 'h': h, 'cs': color_space, 'bpc': bpc, 'f': 'FlateDecode',
+                'dp': f'/Predictor 15 /Colors {colors} /BitsPerComponent {bpc} /Columns {w}',
+                'pal': '', 'trns': '',
+            }
+        elif chunk_type == b'PLTE' and info is not None:
+            info['pal'] = chunk
+        elif chunk_type == b'IDAT':
+            data.append(chunk)
+        elif chunk_type == b'IEND':
+            break
+    if info is None:
+        raise ValueError("PNG file has no header")
+    if info['cs'] == 'Indexed' and not info['pal']:
+        raise ValueError("Palette PNG has no palette")
+    info['data'] = b''.join(data)
+    if color_type == 6:
+        # FPDF draws the alpha channel as a soft mask, a separate gray image
+        info['data'], info['smask'] = _split_alpha(info['data'], w)
+    return info
+
+
+def _split_alpha(data, width):
+    """Split the compressed scanlines of an 8-bit RGBA PNG into RGB and alpha scanlines"""
+    raw = zlib.decompress(data)
+    stride = 1 + 4 * width
+    color = bytearray()
+    alpha = bytearray()
+    line = bytearray(3 * width)
+    for start in range(0, len(raw), stride):
+        # PNG filters predict each byte from the same channel of the neighboring
+        # pixels, so the filtered channels can be separated without unfiltering
+        row = raw[start + 1:start + stride]
+        line[0::3] = row[0::4]
+        line[1::3] = row[1::4]
+        line[2::3] = row[2::4]
+        color.append(raw[start])
+        color += line
+        alpha.append(raw[start])
+        alpha += row[3::4]
+    return zlib.compress(color), zlib.compress(alpha)
+
+
+def _jpeg_image_info(jpeg_bytes):
+    """Build the FPDF image dictionary for a JPEG; the file is embedded as it is"""
+    pos = 2
+    while pos + 4 <= len(jpeg_bytes):
+        if jpeg_bytes[pos] != 0xFF:
+            raise ValueError("Corrupt JPEG file")
+        marker = jpeg_bytes[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        length = struct.unpack('>H', jpeg_bytes[pos + 2:pos + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            bpc, h, w, components = struct.unpack('>BHHB', jpeg_bytes[pos + 4:pos + 10])
+            if components not in _JPEG_COLOR_SPACES:
+                raise ValueError(f"Unsupported JPEG with {components} components")
+            return {'w': w, 'h': h, 'cs': _JPEG_COLOR_SPACES[components], 'bpc': bpc,
+                    'f': 'DCTDecode', 'data': jpeg_bytes}
+        pos += 2 + length
+    raise ValueError("JPEG file has no frame header")
+
+
+def _encode_png(image):
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def logo_pixels(width_mm=LOGO_WIDTH_MM, dpi=LOGO_DPI):
+    """Widest logo, in pixels, that still adds detail when drawn width_mm wide"""
+    return max(1, round(width_mm / 25.4 * dpi))
+
+
+def normalize_logo(data, max_width=None):
+    """
+    Decode an uploaded image and re-encode it for embedding.
+
+    The logo is scaled down (never up) to max_width pixels, by default enough
+    for LOGO_DPI at the width it is drawn at. Logos with transparency stay
+    RGBA PNGs and keep their alpha channel. Opaque ones become a PNG when
+    they have at most MAX_PALETTE_COLORS colors (a palette PNG if scaling
+    kept it that way) and a JPEG otherwise. Returns the PNG or JPEG bytes.
+    """
+    # Imported here so that the app starts without loading Pillow's codecs
+    from PIL import Image, ImageOps
+    max_width = max_width or logo_pixels()
+    image = Image.open(BytesIO(data))
+    # Phone photos are often stored sideways with an EXIF orientation tag;
+    # orientations 5 to 8 swap width and height once transposed
+    sideways = image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8)
+    width, height = (image.height, image.width) if sideways else image.size
+    if width > max_width:
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale, which is much faster
+        # than decoding a phone photo at full size and scaling it afterwards
+        size = (max_width, max(1, height * max_width // width))
+        image.draft('RGB', size[::-1] if sideways else size)
+    image = ImageOps.exif_transpose(image)
+
+    transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if transparent else 'RGB')
+    if transparent and image.getchannel('A').getextrema()[0] == 255:
+        image = image.convert('RGB')
+    # Judged before scaling, which blends the colors along every edge
+    flat = image.mode == 'RGB' and image.getcolors(MAX_PALETTE_COLORS) is not None
+    if image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.Resampling.LANCZOS)
+
+    if image.mode == 'RGBA':
+        return _encode_png(image)
+    if not flat:
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+        return buffer.getvalue()
+    colors = image.getcolors(MAX_PALETTE_COLORS)
+    if colors is None:
+        return _encode_png(image)
+    # Map every pixel onto its exact color; no dithering is needed
+    palette = Image.new('P', (1, 1))
+    palette.putpalette([channel for _, color in colors for channel in color])
+    return _encode_png(image.quantize(palette=palette, dither=Image.Dither.NONE))
+
+
+class LogoCache:
+    """
+    Content-addressed cache of normalized logos.
+
+    Entries are keyed on the SHA-256 of the original image bytes and the
+    pixel width logos are scaled to (see logo_pixels), and kept in a bounded
+    in-memory LRU. When cache_dir is set, normalized images are also written
+    there so that new processes (batch workers, app restarts) skip the
+    decode/encode step as well.
+    """
+
+    def __init__(self, max_entries=16, cache_dir=None, dpi=LOGO_DPI):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_width = logo_pixels(dpi=dpi)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, data):
+        """Return the NormalizedLogo for the raw image bytes, normalizing on first use"""
+        digest = f"{hashlib.sha256(data).hexdigest()}-{self.max_width}px"
+        with self._lock:
+            logo = self._entries.get(digest)
+            if logo is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return logo
+            self.misses += 1
+
+        logo = self._load_from_disk(digest)
+        if logo is None:
+            logo = NormalizedLogo(digest, normalize_logo(data, self.max_width))
+            self._save_to_disk(logo)
+
+        with self._lock:
+            self._entries[digest] = logo
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return logo
+
+    def load_file(self, path):
+        """Return the NormalizedLogo for an image file on disk"""
+        with open(path, 'rb') as f:
+            return self.get(f.read())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _disk_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.logo")
+
+    def _load_from_disk(self, digest):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(digest), 'rb') as f:
+                return NormalizedLogo(digest, f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _save_to_disk(self, logo):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(logo.digest)
+        # Write to a temporary name first so concurrent workers never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(logo.image_bytes)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing logo cache: {e}")
+
+
+class LogoStore:
+    """
+    Uploaded logos shared by all sessions, each distinct image stored once.
+
+    put() returns the SHA-256 of the image, which is all a session needs to
+    keep; get() returns the bytes. The most recently used logos are kept in
+    memory up to max_bytes in total. With store_dir set, every logo is also
+    written there, so logos evicted from memory (or uploaded before a
+    restart) are read back from disk.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, store_dir=None):
+        self.max_bytes = max_bytes
+        self.store_dir = store_dir
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def put(self, data):
+        """Store the image bytes (once per distinct image) and return their key"""
+        data = bytes(data)
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            known = key in self._entries
+            self._remember(key, data)
+        if not known:
+            self._write_disk(key, data)
+        return key
+
+    def get(self, key):
+        """Return the image bytes stored under key, or None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        data = self._read_disk(key)
+        if data is not None:
+            with self._lock:
+                self._remember(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {'logos': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = data
+        self._size += len(data)
+        # Always keep the newest logo, even if it alone is larger than max_bytes
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.store_dir, f"{key}.upload")
+
+    def _read_disk(self, key):
+        # Keys come from put(); anything else cannot name a stored file
+        if not self.store_dir or len(key) != 64 or not all(c in '0123456789abcdef' for c in key):
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.store_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing logo store: {e}")
+
+
+# Process-wide cache shared by every InvoiceGenerator; set LOGO_CACHE_DIR to persist it
+# and LOGO_DPI to change the resolution logos are kept at
+logo_cache = LogoCache(cache_dir=os.getenv('LOGO_CACHE_DIR'), dpi=int(os.getenv('LOGO_DPI', LOGO_DPI)))
@@ -0,0 +1,182 @@
+import math
+from datetime import date, datetime
+
+# Line item fields, in table column order
+ITEM_FIELDS = ('service_item', 'description', 'hours', 'rate', 'amount')
+
+# Invoice level fields (everything except the items)
+INVOICE_FIELDS = ('invoice_number', 'client_name', 'client_address', 'client_email',
+                  'invoice_date', 'due_date', 'notes', 'tax_rate', 'discount')
+
+
+def parse_number(value, field):
+    """Convert a form/CSV/JSON value to float; blanks become None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if value == '':
+            return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' must be a number, got {value!r}")
+    if not math.isfinite(number):
+        raise ValueError(f"'{field}' must be a finite number, got {value!r}")
+    return number
+
+
+def parse_date(value, field='date'):
+    """Accept a date, a datetime or an ISO (YYYY-MM-DD) string; blanks become None"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value).strip()[:10], '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"'{field}' must be a YYYY-MM-DD date, got {value!r}")
+
+
+class LineItem:
+    """
+    One line of an invoice: either hours x rate or a fixed amount.
+
+    A non-None amount makes the line a fixed amount item and clears hours and
+    rate; otherwise missing hours and rate count as 0. Items also answer
+    item['hours'] and item.get('hours') so code written for item dictionaries
+    keeps working.
+    """
+
+    __slots__ = ITEM_FIELDS
+
+    def __init__(self, service_item='', description='', hours=None, rate=None, amount=None):
+        self.service_item = '' if service_item is None else str(service_item)
+        self.description = '' if description is None else str(description)
+        self.amount = parse_number(amount, 'amount')
+        if self.amount is None:
+            hours = parse_number(hours, 'hours')
+            rate = parse_number(rate, 'rate')
+            self.hours = 0.0 if hours is None else hours
+            self.rate = 0.0 if rate is None else rate
+        else:
+            self.hours = None
+            self.rate = None
+
+    @property
+    def is_fixed(self):
+        return self.amount is not None
+
+    def __getitem__(self, key):
+        if key not in ITEM_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in ITEM_FIELDS:
+            return default
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if not isinstance(other, LineItem):
+            return NotImplemented
+        return self.to_tuple() == other.to_tuple()
+
+    def __repr__(self):
+        return f"LineItem{self.to_tuple()!r}"
+
+    def to_tuple(self):
+        return (self.service_item, self.description, self.hours, self.rate, self.amount)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in ITEM_FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a LineItem from a dictionary (or LineItem) with the ITEM_FIELDS keys"""
+        if isinstance(data, cls):
+            return data
+        return cls(data.get('service_item'), data.get('description'),
+                   data.get('hours'), data.get('rate'), data.get('amount'))
+
+
+def line_items_from_session_state(state):
+    """Line items stored in the Streamlit session state by the items editor"""
+    return [LineItem.from_dict(item) for item in state.get('items') or ()]
+
+
+class Invoice:
+    """
+    Client-specific content of an invoice.
+
+    Optional fields left as None (notes, tax_rate, discount and the dates) fall
+    back to the defaults passed to generate_arguments.
+    """
+
+    __slots__ = INVOICE_FIELDS + ('items',)
+
+    def __init__(self, invoice_number, client_name='', client_address='', client_email='', items=(),
+                 notes=None, tax_rate=None, discount=None, invoice_date=None, due_date=None):
+        if invoice_number is None or str(invoice_number).strip() == '':
+            raise ValueError("Invoice is missing 'invoice_number'")
+        self.invoice_number = str(invoice_number)
+        self.client_name = client_name or ''
+        self.client_address = client_address or ''
+        self.client_email = client_email or ''
+        self.items = [LineItem.from_dict(item) for item in items]
+        self.notes = notes or None
+        self.tax_rate = parse_number(tax_rate, 'tax_rate')
+        self.discount = parse_number(discount, 'discount')
+        self.invoice_date = parse_date(invoice_date, 'invoice_date')
+        self.due_date = parse_date(due_date, 'due_date')
+        if self.tax_rate is not None and self.tax_rate < 0:
+            raise ValueError("'tax_rate' cannot be negative")
+        if self.discount is not None and not 0 <= self.discount <= 100:
+            raise ValueError("'discount' must be between 0 and 100")
+
+    def generate_arguments(self, notes=None, tax_rate=6.0, discount=0.0):
+        """Keyword arguments for InvoiceGenerator.generate_invoice, using the given defaults for unset fields"""
+        return {
+            'invoice_number': self.invoice_number,
+            'client_name': self.client_name,
+            'client_address': self.client_address,
+            'client_email': self.client_email,
+            'items': self.items,
+            'notes': self.notes if self.notes is not None else notes,
+            'tax_rate': self.tax_rate if self.tax_rate is not None else tax_rate,
+            'discount': self.discount if self.discount is not None else discount,
+            'invoice_date': self.invoice_date,
+            'due_date': self.due_date,
+        }
+
+    def to_dict(self):
+        """JSON-ready dictionary; from_dict(to_dict()) gives an equal invoice"""
+        data = {field: getattr(self, field) for field in INVOICE_FIELDS}
+        data['invoice_date'] = self.invoice_date.isoformat() if self.invoice_date else None
+        data['due_date'] = self.due_date.isoformat() if self.due_date else None
+        data['items'] = [item.to_dict() for item in self.items]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build an Invoice from a dictionary such as a parsed JSON record"""
+        fields = {field: data.get(field) for field in INVOICE_FIELDS}
+        return cls(items=data.get('items') or (), **fields)
+
+    @classmethod
+    def from_session_state(cls, state):
+        """Build the invoice being edited in the Streamlit app"""
+        return cls(
+            state.get('invoice_number'),
+            state.get('client_name'),
+            state.get('client_address'),
+            state.get('client_email'),
+            line_items_from_session_state(state),
+            notes=state.get('notes'),
+            tax_rate=state.get('tax_rate'),
+            discount=state.get('discount'),
+            invoice_date=state.get('invoice_date'),
+            due_date=state.get('due_date'),
+        )
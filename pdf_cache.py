@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+from models import ITEM_FIELDS
+
+# Bump whenever the invoice layout changes so cached PDFs are not reused across versions
+RENDER_VERSION = 1
+
+
+def _normalize(value):
+    """Convert invoice inputs to JSON-stable values"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, float):
+        # Treat 12 and 12.0 alike
+        return repr(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return repr(float(value))
+    return value
+
+
+def invoice_cache_key(inputs):
+    """
+    Hash the inputs of an invoice into a cache key.
+
+    inputs is a dictionary holding everything that affects the PDF: company
+    name and address, the logo digest, client details, items, notes, rates,
+    dates and labels. Items are reduced to their known fields so extra keys
+    carried along by callers do not change the key.
+    """
+    normalized = dict(inputs)
+    if 'items' in normalized:
+        normalized['items'] = [[item.get(field) for field in ITEM_FIELDS] for item in normalized['items']]
+    normalized['render_version'] = RENDER_VERSION
+    payload = json.dumps(_normalize(normalized), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """
+    Cache of rendered invoice PDFs keyed on invoice_cache_key.
+
+    Recently used PDFs are kept in memory up to max_bytes. With cache_dir set,
+    every PDF is also written to disk, where the least recently used files are
+    evicted once their total size exceeds max_disk_bytes. The cache is safe to
+    share between threads (Streamlit sessions); several processes may share a
+    cache_dir.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, cache_dir=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # Estimated size of cache_dir; the directory is only scanned when this exceeds the limit
+        self._disk_size = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_size = self._evict_disk()
+
+    def get(self, key):
+        """Return the cached PDF bytes for key, or None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        """Store rendered PDF bytes under key"""
+        data = bytes(data)
+        with self._lock:
+            self._remember(key, data)
+        self._write_disk(key, data)
+
+    def get_or_render(self, key, render):
+        """Return the cached PDF for key, calling render() to produce it on a miss"""
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        if len(data) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Refresh the modification time so eviction keeps recently used files
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing render cache: {e}")
+            return
+        with self._lock:
+            self._disk_size += len(data)
+            over_limit = self._disk_size > self.max_disk_bytes
+        if over_limit:
+            disk_size = self._evict_disk()
+            with self._lock:
+                self._disk_size = disk_size
+
+    def _evict_disk(self):
+        """
+        Remove the least recently used files until the directory fits
+        max_disk_bytes and return the remaining size.
+        """
+        files = []
+        total = 0
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.pdf'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_disk_bytes:
+            return total
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Another process may have evicted it already
+                pass
+            total -= size
+        return total
@@ -0,0 +1,217 @@
+"""
+Vectorized, exact invoice pricing.
+
+Money is handled as integer cents and hours, rates and percentages as scaled
+integers, so a whole batch of line items is priced with a few numpy operations
+and the results match Decimal arithmetic with the chosen rounding rule.
+"""
+from decimal import Decimal
+import numpy as np
+
+# Fixed-point scales: inputs are rounded to these precisions before pricing
+HOURS_SCALE = 1000          # 0.001 hours
+RATE_SCALE = 10000          # 0.0001 per hour
+AMOUNT_SCALE = 10000        # 0.0001 for fixed amounts
+PERCENT_SCALE = 10000       # 0.0001 %
+CENTS = 100
+
+ROUND_HALF_UP = 'half_up'       # 0.005 -> 0.01, as on paper invoices
+ROUND_HALF_EVEN = 'half_even'   # banker's rounding
+
+
+def _divide(numerator, divisor, rounding=ROUND_HALF_UP):
+    """Divide int64 arrays by a positive integer, rounding to the nearest integer"""
+    numerator = np.asarray(numerator, dtype=np.int64)
+    sign = np.where(numerator < 0, -1, 1)
+    quotient, remainder = np.divmod(np.abs(numerator), divisor)
+    if rounding == ROUND_HALF_UP:
+        quotient += 2 * remainder >= divisor
+    elif rounding == ROUND_HALF_EVEN:
+        quotient += (2 * remainder > divisor) | ((2 * remainder == divisor) & (quotient % 2 == 1))
+    else:
+        raise ValueError(f"Unknown rounding rule: {rounding}")
+    return sign * quotient
+
+
+def _divide_int(numerator, divisor, rounding=ROUND_HALF_UP):
+    """Scalar version of _divide on Python integers (no overflow limit)"""
+    sign = -1 if numerator < 0 else 1
+    quotient, remainder = divmod(abs(numerator), divisor)
+    if 2 * remainder > divisor or (2 * remainder == divisor and
+                                   (rounding == ROUND_HALF_UP or quotient % 2 == 1)):
+        quotient += 1
+    return sign * quotient
+
+
+def _scaled(values, scale):
+    """Convert a float array to integers at the given scale (NaN becomes 0)"""
+    values = np.asarray(values, dtype=np.float64)
+    return np.rint(np.nan_to_num(values) * scale).astype(np.int64)
+
+
+def _number(value):
+    if value is None or value == '':
+        return np.nan
+    return float(value)
+
+
+def to_decimal(cents):
+    """Convert an integer number of cents to a two-place Decimal"""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def format_money(cents):
+    """Format integer cents as 1,234.56"""
+    cents = int(cents)
+    sign = '-' if cents < 0 else ''
+    whole, fraction = divmod(abs(cents), CENTS)
+    return f"{sign}{whole:,}.{fraction:02d}"
+
+
+class ItemBatch:
+    """
+    Columnar line items.
+
+    hours, rate and amount are float arrays of equal length; a row with a
+    non-NaN amount is a fixed amount item, every other row is priced as
+    hours * rate.
+    """
+
+    def __init__(self, hours, rate, amount):
+        self.hours = np.asarray(hours, dtype=np.float64)
+        self.rate = np.asarray(rate, dtype=np.float64)
+        self.amount = np.asarray(amount, dtype=np.float64)
+        if not (len(self.hours) == len(self.rate) == len(self.amount)):
+            raise ValueError("hours, rate and amount must have the same length")
+
+    def __len__(self):
+        return len(self.hours)
+
+    @classmethod
+    def from_items(cls, items):
+        """Build a batch from item dictionaries ('hours', 'rate', 'amount' keys)"""
+        hours = []
+        rate = []
+        amount = []
+        for item in items:
+            hours.append(_number(item.get('hours')))
+            rate.append(_number(item.get('rate')))
+            amount.append(_number(item.get('amount')))
+        return cls(hours, rate, amount)
+
+    @property
+    def is_fixed(self):
+        return ~np.isnan(self.amount)
+
+    def line_amounts(self, rounding=ROUND_HALF_UP):
+        """Return every line amount in integer cents, each rounded to the cent"""
+        product = _scaled(self.hours, HOURS_SCALE) * _scaled(self.rate, RATE_SCALE)
+        hourly = _divide(product, HOURS_SCALE * RATE_SCALE // CENTS, rounding)
+        fixed = _divide(_scaled(self.amount, AMOUNT_SCALE), AMOUNT_SCALE // CENTS, rounding)
+        return np.where(self.is_fixed, fixed, hourly)
+
+
+class Totals:
+    """Invoice totals in integer cents, with Decimal accessors for display"""
+
+    __slots__ = ('subtotal_cents', 'discount_cents', 'tax_cents')
+
+    def __init__(self, subtotal_cents, discount_cents, tax_cents):
+        self.subtotal_cents = int(subtotal_cents)
+        self.discount_cents = int(discount_cents)
+        self.tax_cents = int(tax_cents)
+
+    @property
+    def discounted_subtotal_cents(self):
+        return self.subtotal_cents - self.discount_cents
+
+    @property
+    def total_cents(self):
+        return self.discounted_subtotal_cents + self.tax_cents
+
+    @property
+    def subtotal(self):
+        return to_decimal(self.subtotal_cents)
+
+    @property
+    def discount_amount(self):
+        return to_decimal(self.discount_cents)
+
+    @property
+    def discounted_subtotal(self):
+        return to_decimal(self.discounted_subtotal_cents)
+
+    @property
+    def tax(self):
+        return to_decimal(self.tax_cents)
+
+    @property
+    def total(self):
+        return to_decimal(self.total_cents)
+
+    def as_dict(self):
+        return {
+            'subtotal': str(self.subtotal),
+            'discount': str(self.discount_amount),
+            'discounted_subtotal': str(self.discounted_subtotal),
+            'tax': str(self.tax),
+            'total': str(self.total),
+        }
+
+
+def _percent(value):
+    return int(round(float(value) * PERCENT_SCALE))
+
+
+def compute_totals(subtotal_cents, tax_rate=0.0, discount=0.0, rounding=ROUND_HALF_UP):
+    """
+    Apply discount and tax to a subtotal.
+
+    The discount is taken off the subtotal first and tax is charged on the
+    discounted subtotal, each rounded to the cent.
+    """
+    subtotal_cents = int(subtotal_cents)
+    percent_divisor = 100 * PERCENT_SCALE
+    discount_cents = _divide_int(subtotal_cents * _percent(discount), percent_divisor, rounding)
+    tax_cents = _divide_int((subtotal_cents - discount_cents) * _percent(tax_rate), percent_divisor, rounding)
+    return Totals(subtotal_cents, discount_cents, tax_cents)
+
+
+def price_items(items, tax_rate=0.0, discount=0.0, rounding=ROUND_HALF_UP):
+    """Price a list of item dictionaries and return their Totals"""
+    batch = items if isinstance(items, ItemBatch) else ItemBatch.from_items(items)
+    subtotal_cents = int(batch.line_amounts(rounding).sum())
+    return compute_totals(subtotal_cents, tax_rate, discount, rounding)
+
+
+def price_invoices(batch, invoice_index, tax_rates, discounts, rounding=ROUND_HALF_UP):
+    """
+    Price the line items of many invoices in one pass.
+
+    Parameters:
+    - batch: ItemBatch holding the line items of all invoices
+    - invoice_index: Integer array giving the invoice (0..n-1) of every line
+    - tax_rates: Tax rate percentage of every invoice
+    - discounts: Discount percentage of every invoice
+
+    Returns:
+    - Dictionary of int64 cent arrays, one value per invoice: subtotal,
+      discount, discounted_subtotal, tax and total
+    """
+    invoice_index = np.asarray(invoice_index, dtype=np.int64)
+    tax_rates = np.asarray(tax_rates, dtype=np.float64)
+    discounts = np.asarray(discounts, dtype=np.float64)
+    subtotal = np.zeros(len(tax_rates), dtype=np.int64)
+    np.add.at(subtotal, invoice_index, batch.line_amounts(rounding))
+
+    percent_divisor = 100 * PERCENT_SCALE
+    discount = _divide(subtotal * _scaled(discounts, PERCENT_SCALE), percent_divisor, rounding)
+    discounted = subtotal - discount
+    tax = _divide(discounted * _scaled(tax_rates, PERCENT_SCALE), percent_divisor, rounding)
+    return {
+        'subtotal': subtotal,
+        'discount': discount,
+        'discounted_subtotal': discounted,
+        'tax': tax,
+        'total': discounted + tax,
+    }
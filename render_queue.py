@@ -0,0 +1,264 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class QueueFull(Exception):
+    """Raised by RenderQueue.submit when max_pending jobs are already waiting or running"""
+
+
+class RenderJob:
+    """State of one queued invoice rendering"""
+
+    __slots__ = ('id', 'invoice_number', 'status', 'progress', 'result', 'error', 'record', 'cache_key',
+                 'submitted_at', 'started_at', 'finished_at', 'future')
+
+    def __init__(self, job_id, invoice_number):
+        self.id = job_id
+        self.invoice_number = invoice_number
+        self.status = QUEUED
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        # render_stats.RenderRecord of the rendering, when stats were requested
+        self.record = None
+        # Key of the PDF in the queue's render cache, when it has one
+        self.cache_key = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def as_dict(self):
+        """Job status without the PDF bytes"""
+        return {
+            'id': self.id,
+            'invoice_number': self.invoice_number,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'error': self.error,
+            'bytes': len(self.result) if self.result is not None else None,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+# Generators of the current worker process, keyed on the company settings
+_process_generators = {}
+
+
+def _render_in_process(company, arguments):
+    """Render one invoice in a pool process, reusing a generator per company"""
+    from invoice_generator import InvoiceGenerator
+    key = (company['company_name'], company['company_address'], company.get('logo'))
+    generator = _process_generators.get(key)
+    if generator is None:
+        if len(_process_generators) >= 8:
+            _process_generators.clear()
+        generator = _process_generators[key] = InvoiceGenerator(
+            company['company_name'], company['company_address'], company.get('logo'))
+    return generator.generate_invoice(**arguments)
+
+
+class RenderQueue:
+    """
+    Background invoice rendering with job ids, progress and backpressure.
+
+    submit() returns a job id at once and the invoice is rendered by a pool of
+    max_workers threads (or processes with processes=True, which render in
+    parallel but only report progress when a job finishes). At most
+    max_pending jobs may be queued or running; further submissions raise
+    QueueFull so a burst of requests is turned away quickly instead of piling
+    up behind each other. Results of finished jobs are kept for the most recent
+    keep_finished jobs, or until discard() is called.
+
+    Jobs are polled with status(), collected with result(), or awaited from
+    asyncio code with wait().
+
+    Pool threads reuse their generators, with the compiled templates and logo,
+    for later jobs of the same company settings. A generator renders one job
+    at a time; idle ones are kept for the MAX_COMPANIES most recent settings.
+    """
+
+    MAX_COMPANIES = 8
+
+    def __init__(self, max_workers=None, max_pending=32, processes=False, render_cache=None, keep_finished=64):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.processes = processes
+        self.render_cache = render_cache
+        self.keep_finished = keep_finished
+        if processes:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='render')
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        # Idle generators of the thread pool, a list per company settings key
+        self._generators = OrderedDict()
+
+    def submit(self, company, arguments, stats=None):
+        """
+        Queue an invoice and return its job id.
+
+        Parameters:
+        - company: Dictionary with company_name, company_address and logo (bytes or None)
+        - arguments: Keyword arguments for InvoiceGenerator.generate_invoice; items
+          must be a list so they can be counted and, with processes, pickled
+        - stats: Optional render_stats.RenderStats recording the job (threads only)
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} invoices are already being rendered; try again shortly")
+            self._pending += 1
+            job = RenderJob(f"{next(self._counter)}-{uuid.uuid4().hex[:8]}", arguments.get('invoice_number'))
+            self._jobs[job.id] = job
+        try:
+            if self.processes:
+                job.status = RUNNING
+                job.started_at = time.time()
+                job.future = self._executor.submit(_render_in_process, company, arguments)
+            else:
+                job.future = self._executor.submit(self._render, job, company, arguments, stats)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                del self._jobs[job.id]
+            raise
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job.id
+
+    def _take_generator(self, company, stats):
+        key = (company['company_name'], company['company_address'], company.get('logo'))
+        with self._lock:
+            idle = self._generators.get(key)
+            generator = idle.pop() if idle else None
+        if generator is None:
+            from invoice_generator import InvoiceGenerator
+            generator = InvoiceGenerator(company['company_name'], company['company_address'], company.get('logo'),
+                                         render_cache=self.render_cache)
+        generator.stats = stats
+        return key, generator
+
+    def _return_generator(self, key, generator):
+        generator.stats = None
+        with self._lock:
+            self._generators.setdefault(key, []).append(generator)
+            self._generators.move_to_end(key)
+            while len(self._generators) > self.MAX_COMPANIES:
+                self._generators.popitem(last=False)
+
+    def _render(self, job, company, arguments, stats):
+        # Runs on a pool thread; a job cancelled before it got here is not started
+        with self._lock:
+            if job.status != QUEUED:
+                return None
+            job.status = RUNNING
+            job.started_at = time.time()
+        items = arguments.get('items') or ()
+        total = len(items)
+
+        def report(rows):
+            # The layout of the items dominates; keep the last percent for output
+            job.progress = min(0.99, rows / total) if total else 0.0
+
+        key, generator = self._take_generator(company, stats)
+        try:
+            pdf_bytes = generator.generate_invoice(progress=report, **arguments)
+            job.record = generator.last_record
+            job.cache_key = generator.last_cache_key
+        finally:
+            self._return_generator(key, generator)
+        return pdf_bytes
+
+    def _finish(self, job, future):
+        if future.cancelled():
+            job.status = CANCELLED
+        elif future.exception() is not None:
+            job.status = FAILED
+            job.error = str(future.exception())
+        elif job.status != CANCELLED:
+            job.result = future.result()
+            job.status = DONE
+            job.progress = 1.0
+        job.finished_at = time.time()
+        with self._lock:
+            self._pending -= 1
+            self._trim()
+
+    def _trim(self):
+        # Caller holds the lock; drop the oldest finished jobs beyond keep_finished
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def job(self, job_id):
+        """Return the RenderJob for job_id (KeyError if unknown or discarded)"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown render job: {job_id}")
+        return job
+
+    def status(self, job_id):
+        return self.job(job_id).as_dict()
+
+    def result(self, job_id, timeout=None):
+        """Block until the job finishes and return the PDF bytes (raises if it failed)"""
+        return self.job(job_id).future.result(timeout)
+
+    async def wait(self, job_id):
+        """Await the PDF bytes of a job from asyncio code"""
+        return await asyncio.wrap_future(self.job(job_id).future)
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started yet; returns whether it was cancelled"""
+        job = self.job(job_id)
+        with self._lock:
+            if job.status != QUEUED:
+                return False
+            # Picked up by a thread that has not started rendering, it sees the status and returns
+            job.status = CANCELLED
+        job.future.cancel()
+        return True
+
+    def discard(self, job_id):
+        """Forget a finished job and release its PDF"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'queued': statuses.count(QUEUED),
+                'running': statuses.count(RUNNING),
+                'done': statuses.count(DONE),
+                'failed': statuses.count(FAILED),
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,299 @@
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Histogram buckets for stage durations (seconds) and PDF sizes (bytes)
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+class StageTimer:
+    """
+    Records the wall time (and optionally allocations) of consecutive stages.
+
+    Call lap(name) at the end of every stage; each lap covers the time since the
+    previous one. With trace_memory, tracemalloc is started for the duration of
+    the render and every stage also reports its net allocation and its peak
+    above the memory in use when it started. tracemalloc is process-wide, so
+    allocations of renders running in parallel threads are mixed together.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.stages = {}
+        self._owns_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+        self.trace_memory = trace_memory
+        self._start = self._last = time.perf_counter()
+        if trace_memory:
+            tracemalloc.reset_peak()
+            self._memory = tracemalloc.get_traced_memory()[0]
+
+    def lap(self, name):
+        now = time.perf_counter()
+        stage = {'ms': round((now - self._last) * 1000, 3)}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            stage['alloc_bytes'] = current - self._memory
+            stage['peak_bytes'] = peak - self._memory
+            tracemalloc.reset_peak()
+            self._memory = current
+        # Stages may repeat (e.g. pages); their costs add up
+        previous = self.stages.get(name)
+        if previous is not None:
+            stage = {key: previous[key] + value for key, value in stage.items()}
+        self.stages[name] = stage
+        self._last = time.perf_counter()
+
+    def total_ms(self):
+        return round((time.perf_counter() - self._start) * 1000, 3)
+
+    def stop(self):
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+
+class _NullTimer:
+    """Stand-in used when instrumentation is off"""
+
+    def lap(self, name):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class RenderRecord:
+    """Timings and sizes of one generate_invoice call"""
+
+    __slots__ = ('invoice_number', 'stages', 'total_ms', 'output_bytes', 'items', 'pages', 'cached')
+
+    def __init__(self, invoice_number, stages, total_ms, output_bytes, items=None, pages=None, cached=False):
+        self.invoice_number = invoice_number
+        self.stages = stages
+        self.total_ms = total_ms
+        self.output_bytes = output_bytes
+        self.items = items
+        self.pages = pages
+        self.cached = cached
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name, labels=''):
+        cumulative = 0
+        separator = ',' if labels else ''
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}' if labels else f'{name}_sum {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}' if labels else f'{name}_count {self.count}'
+
+
+class RenderStats:
+    """
+    Opt-in instrumentation shared by InvoiceGenerators.
+
+    Pass an instance as InvoiceGenerator(stats=...) to record a RenderRecord for
+    every render. The most recent records are kept in memory and aggregated
+    into counters and histograms, which are exported in the OpenMetrics text
+    format by openmetrics(), written to metrics_file after every render when it
+    is set, and served over HTTP by serve().
+    """
+
+    def __init__(self, trace_memory=False, metrics_file=None, keep=100):
+        self.trace_memory = trace_memory
+        self.metrics_file = metrics_file
+        self.records = deque(maxlen=keep)
+        self.renders = 0
+        self.cache_hits = 0
+        self._stage_seconds = {}
+        self._render_seconds = _Histogram(DURATION_BUCKETS)
+        self._output_bytes = _Histogram(SIZE_BUCKETS)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def timer(self):
+        return StageTimer(self.trace_memory)
+
+    def observe_stage(self, name, seconds):
+        """Record a stage that happens outside a render, such as logo loading"""
+        with self._lock:
+            self._stage_histogram(name).observe(seconds)
+
+    def record(self, record):
+        with self._lock:
+            self.records.append(record)
+            self.renders += 1
+            self.cache_hits += record.cached
+            self._render_seconds.observe(record.total_ms / 1000)
+            self._output_bytes.observe(record.output_bytes)
+            for name, stage in record.stages.items():
+                self._stage_histogram(name).observe(stage['ms'] / 1000)
+        if self.metrics_file:
+            self.write_metrics(self.metrics_file)
+
+    def _stage_histogram(self, name):
+        # Caller holds the lock
+        histogram = self._stage_seconds.get(name)
+        if histogram is None:
+            histogram = self._stage_seconds[name] = _Histogram(DURATION_BUCKETS)
+        return histogram
+
+    def openmetrics(self):
+        """Counters and histograms in the OpenMetrics text exposition format"""
+        with self._lock:
+            lines = [
+                '# TYPE invoice_renders counter',
+                '# HELP invoice_renders Invoices rendered or served from the render cache.',
+                f'invoice_renders_total {self.renders}',
+                '# TYPE invoice_render_cache_hits counter',
+                '# HELP invoice_render_cache_hits Renders answered by the render cache.',
+                f'invoice_render_cache_hits_total {self.cache_hits}',
+                '# TYPE invoice_render_seconds histogram',
+                '# HELP invoice_render_seconds Wall time of generate_invoice.',
+            ]
+            lines.extend(self._render_seconds.lines('invoice_render_seconds'))
+            lines.append('# TYPE invoice_render_stage_seconds histogram')
+            lines.append('# HELP invoice_render_stage_seconds Wall time of each render stage.')
+            for name in sorted(self._stage_seconds):
+                lines.extend(self._stage_seconds[name].lines('invoice_render_stage_seconds', f'stage="{name}"'))
+            lines.append('# TYPE invoice_output_bytes histogram')
+            lines.append('# HELP invoice_output_bytes Size of the rendered PDFs.')
+            lines.extend(self._output_bytes.lines('invoice_output_bytes'))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self, path):
+        """Write openmetrics() to path atomically (e.g. for a textfile collector)"""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.openmetrics())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing render metrics: {e}")
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve openmetrics() on http://host:port/metrics from a daemon thread"""
+        if self._server is not None:
+            return self._server
+        stats = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = stats.openmetrics().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+
+class RequestStats:
+    """
+    Request counts and latencies of the HTTP API, exported like RenderStats.
+
+    Every request is counted by endpoint and status code and its wall time is
+    added to a histogram per endpoint. Renders done for the requests are
+    observed separately, so time spent waiting for a free worker shows up as
+    the difference between the two.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.rejected = 0
+        self._requests = {}
+        self._request_seconds = {}
+        self._render_seconds = _Histogram(DURATION_BUCKETS)
+        self._output_bytes = _Histogram(SIZE_BUCKETS)
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, endpoint, status, seconds):
+        with self._lock:
+            self.in_flight -= 1
+            key = (endpoint, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._request_seconds.get(endpoint)
+            if histogram is None:
+                histogram = self._request_seconds[endpoint] = _Histogram(DURATION_BUCKETS)
+            histogram.observe(seconds)
+
+    def reject(self):
+        """Count a request turned away because every worker was busy"""
+        with self._lock:
+            self.rejected += 1
+
+    def observe_render(self, seconds, output_bytes):
+        with self._lock:
+            self._render_seconds.observe(seconds)
+            self._output_bytes.observe(output_bytes)
+
+    def openmetrics(self):
+        """Counters and histograms in the OpenMetrics text exposition format"""
+        with self._lock:
+            lines = [
+                '# TYPE invoice_api_requests counter',
+                '# HELP invoice_api_requests Requests answered, by endpoint and status code.',
+            ]
+            for (endpoint, status), count in sorted(self._requests.items()):
+                lines.append(f'invoice_api_requests_total{{endpoint="{endpoint}",code="{status}"}} {count}')
+            lines.extend([
+                '# TYPE invoice_api_rejected counter',
+                '# HELP invoice_api_rejected Requests turned away because every worker was busy.',
+                f'invoice_api_rejected_total {self.rejected}',
+                '# TYPE invoice_api_in_flight gauge',
+                '# HELP invoice_api_in_flight Requests being handled.',
+                f'invoice_api_in_flight {self.in_flight}',
+                '# TYPE invoice_api_request_seconds histogram',
+                '# HELP invoice_api_request_seconds Wall time of each request, from parsing to the last byte sent.',
+            ])
+            for endpoint in sorted(self._request_seconds):
+                lines.extend(self._request_seconds[endpoint].lines('invoice_api_request_seconds',
+                                                                   f'endpoint="{endpoint}"'))
+            lines.append('# TYPE invoice_api_render_seconds histogram')
+            lines.append('# HELP invoice_api_render_seconds Wall time of rendering each invoice in the workers.')
+            lines.extend(self._render_seconds.lines('invoice_api_render_seconds'))
+            lines.append('# TYPE invoice_api_output_bytes histogram')
+            lines.append('# HELP invoice_api_output_bytes Size of the rendered PDFs.')
+            lines.extend(self._output_bytes.lines('invoice_api_output_bytes'))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
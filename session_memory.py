@@ -0,0 +1,91 @@
+import io
+import sys
+import types
+
+# Shared code and type objects are not memory of any one session
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def estimate_size(value, seen=None):
+    """
+    Approximate bytes held by value and everything it references.
+
+    Each object is counted once per seen set, so sharing seen between calls
+    does not count objects reachable from several values twice. Buffers,
+    NumPy arrays and pandas objects report the size of their data.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen or isinstance(value, _SHARED_TYPES):
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, (str, bytes, bytearray, int, float, bool, type(None))):
+        return sys.getsizeof(value)
+    if isinstance(value, memoryview):
+        return value.nbytes
+    if isinstance(value, io.BytesIO):
+        # Uploaded files are BytesIO objects holding the whole upload
+        return sys.getsizeof(value) + value.getbuffer().nbytes
+    memory_usage = getattr(value, 'memory_usage', None)
+    if callable(memory_usage) and hasattr(value, 'dtypes'):
+        # pandas DataFrame or Series
+        usage = memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if hasattr(value, 'nbytes') and hasattr(value, 'dtype'):
+        # NumPy array
+        return sys.getsizeof(value) + int(value.nbytes)
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key, seen) + estimate_size(item, seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item, seen)
+    else:
+        for name in getattr(type(value), '__slots__', ()):
+            size += estimate_size(getattr(value, name, None), seen)
+        if hasattr(value, '__dict__'):
+            size += estimate_size(vars(value), seen)
+    return size
+
+
+def session_memory_report(state):
+    """
+    Estimated memory of every entry of a session state mapping.
+
+    Returns a dictionary with total_bytes and entries, a list of (key, bytes)
+    pairs with the largest first.
+    """
+    seen = set()
+    entries = []
+    for key in list(state.keys()):
+        try:
+            value = state[key]
+        except KeyError:
+            # Widget state dropped since the keys were listed
+            continue
+        entries.append((str(key), estimate_size(value, seen)))
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    return {'total_bytes': sum(size for _, size in entries), 'entries': entries}
+
+
+def trim_session_state(state, limit_bytes, disposable):
+    """
+    Delete disposable keys of state, largest first, while the estimated size
+    of the whole state exceeds limit_bytes.
+
+    Returns the report after trimming (see session_memory_report) and the
+    list of deleted keys. Keys not in disposable are never deleted.
+    """
+    report = session_memory_report(state)
+    removed = []
+    for key, size in list(report['entries']):
+        if report['total_bytes'] <= limit_bytes:
+            break
+        if key in disposable:
+            del state[key]
+            removed.append(key)
+            report['total_bytes'] -= size
+            report['entries'].remove((key, size))
+    return report, removed
@@ -0,0 +1,408 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from models import ITEM_FIELDS, Invoice, LineItem
+from pricing import price_items
+
+SCHEMA_VERSION = 2
+
+# Invoice numbers and client names compare case-insensitively, which also lets
+# SQLite answer "starts with" searches (LIKE 'abc%') from their indexes
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS companies (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL COLLATE NOCASE UNIQUE,
+    address TEXT NOT NULL DEFAULT '',
+    notes TEXT,
+    tax_rate REAL,
+    discount REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clients (
+    id INTEGER PRIMARY KEY,
+    company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+    name TEXT NOT NULL COLLATE NOCASE,
+    address TEXT NOT NULL DEFAULT '',
+    email TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    UNIQUE (company_id, name, email)
+);
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+    client_id INTEGER REFERENCES clients(id) ON DELETE SET NULL,
+    invoice_number TEXT NOT NULL COLLATE NOCASE,
+    client_name TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    client_address TEXT NOT NULL DEFAULT '',
+    client_email TEXT NOT NULL DEFAULT '',
+    invoice_date TEXT,
+    due_date TEXT,
+    notes TEXT,
+    tax_rate REAL,
+    discount REAL,
+    total_cents INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (company_id, invoice_number)
+);
+CREATE INDEX IF NOT EXISTS invoices_client_name ON invoices (company_id, client_name);
+CREATE INDEX IF NOT EXISTS invoices_date ON invoices (company_id, invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_client ON invoices (client_id, invoice_date);
+CREATE TABLE IF NOT EXISTS line_items (
+    invoice_id INTEGER NOT NULL REFERENCES invoices(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    service_item TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    hours REAL,
+    rate REAL,
+    amount REAL,
+    PRIMARY KEY (invoice_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS invoice_sequences (
+    company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+    prefix TEXT NOT NULL,
+    next_value INTEGER NOT NULL,
+    PRIMARY KEY (company_id, prefix)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS services (
+    company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+    code TEXT NOT NULL COLLATE NOCASE,
+    description TEXT NOT NULL DEFAULT '',
+    rate REAL,
+    unit TEXT NOT NULL DEFAULT 'hour',
+    PRIMARY KEY (company_id, code)
+) WITHOUT ROWID;
+"""
+
+DEFAULT_PREFIX = 'INV-'
+DEFAULT_WIDTH = 3
+
+
+class DuplicateInvoiceNumber(ValueError):
+    """Raised when an invoice is saved under a number another invoice of the company already has"""
+
+
+def _like_prefix(text):
+    """LIKE pattern matching values that start with text"""
+    return re.sub(r'([\\%_])', r'\\\1', text) + '%'
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+class InvoiceStore:
+    """
+    Companies, clients, invoices and their line items in a local SQLite file.
+
+    Each thread gets its own connection; the database runs in WAL mode so
+    searches never wait for a session that is saving. Invoice numbers are
+    unique per company: save_invoice() refuses a number that is taken, and
+    allocate_invoice_number() hands out the next free number inside a write
+    transaction, so sessions asking at the same time never get the same one.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly by _transaction()
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA foreign_keys = ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the write lock up front so it cannot deadlock later"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        """Close the connection of the calling thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # Companies and clients
+
+    def save_company(self, name, address='', notes=None, tax_rate=None, discount=None):
+        """Create or update the company profile called name and return its id"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "INSERT INTO companies (name, address, notes, tax_rate, discount, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET name = excluded.name, address = excluded.address, "
+                "notes = coalesce(excluded.notes, notes), tax_rate = coalesce(excluded.tax_rate, tax_rate), "
+                "discount = coalesce(excluded.discount, discount), updated_at = excluded.updated_at "
+                "RETURNING id",
+                (name, address or '', notes, tax_rate, discount, time.time())
+            ).fetchone()[0]
+
+    def company_id(self, name, address=''):
+        """Id of the company called name, creating its profile when it does not exist yet"""
+        row = self._connection().execute("SELECT id FROM companies WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self.save_company(name, address)
+
+    def latest_company(self):
+        """Profile of the most recently saved company as a dictionary, or None"""
+        row = self._connection().execute(
+            "SELECT id, name, address, notes, tax_rate, discount FROM companies ORDER BY updated_at DESC LIMIT 1"
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def _client_id(self, conn, company_id, name, address, email):
+        # Caller holds a write transaction
+        return conn.execute(
+            "INSERT INTO clients (company_id, name, address, email) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (company_id, name, email) DO UPDATE SET address = excluded.address "
+            "RETURNING id",
+            (company_id, name, address or '', email or '')
+        ).fetchone()[0]
+
+    def save_client(self, company_id, name, address='', email=''):
+        """Create or update a client of the company and return its id"""
+        with self._transaction() as conn:
+            return self._client_id(conn, company_id, name, address, email)
+
+    def clients(self, company_id):
+        """Yield the clients of a company as dictionaries with id, name, address and email"""
+        for row in self._connection().execute(
+                "SELECT id, name, address, email FROM clients WHERE company_id = ?", (company_id,)):
+            yield dict(row)
+
+    def services(self, company_id):
+        """Yield the service catalog of a company as dictionaries with code, description, rate and unit"""
+        for row in self._connection().execute(
+                "SELECT code, description, rate, unit FROM services WHERE company_id = ? ORDER BY code",
+                (company_id,)):
+            yield dict(row)
+
+    def save_services(self, company_id, services):
+        """Replace the service catalog of a company with services (dictionaries or catalog.Service objects)"""
+        rows = []
+        for service in services:
+            if not isinstance(service, dict):
+                service = service.to_dict()
+            rows.append((company_id, service['code'], service.get('description') or '', service.get('rate'),
+                         service.get('unit') or 'hour'))
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM services WHERE company_id = ?", (company_id,))
+            conn.executemany("INSERT OR REPLACE INTO services (company_id, code, description, rate, unit) "
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+
+    # Invoice numbers
+
+    def _number_taken(self, conn, company_id, invoice_number):
+        return conn.execute("SELECT 1 FROM invoices WHERE company_id = ? AND invoice_number = ?",
+                            (company_id, invoice_number)).fetchone() is not None
+
+    def _first_free_value(self, conn, company_id, prefix):
+        """Next counter value for prefix, continuing after the highest number already used"""
+        row = conn.execute("SELECT next_value FROM invoice_sequences WHERE company_id = ? AND prefix = ?",
+                           (company_id, prefix)).fetchone()
+        if row is not None:
+            return row[0]
+        # First allocation for this prefix: continue after invoices numbered by hand
+        highest = 0
+        pattern = re.compile(re.escape(prefix) + r'(\d+)$', re.IGNORECASE)
+        for (number,) in conn.execute(
+                "SELECT invoice_number FROM invoices WHERE company_id = ? AND invoice_number LIKE ? ESCAPE '\\'",
+                (company_id, _like_prefix(prefix))):
+            match = pattern.match(number)
+            if match:
+                highest = max(highest, int(match.group(1)))
+        return highest + 1
+
+    def next_invoice_number(self, company_id, prefix=DEFAULT_PREFIX, width=DEFAULT_WIDTH):
+        """
+        The number allocate_invoice_number() would return now, without reserving
+        it. Use it as a suggestion only; another session may take it first.
+        """
+        conn = self._connection()
+        value = self._first_free_value(conn, company_id, prefix)
+        while self._number_taken(conn, company_id, f"{prefix}{value:0{width}d}"):
+            value += 1
+        return f"{prefix}{value:0{width}d}"
+
+    def allocate_invoice_number(self, company_id, prefix=DEFAULT_PREFIX, width=DEFAULT_WIDTH):
+        """
+        Reserve and return the next free invoice number, such as INV-042.
+
+        The counter is read and advanced in one write transaction, so concurrent
+        sessions and processes always get distinct numbers. Numbers already
+        used by saved invoices are skipped. A reserved number that is never
+        saved leaves a gap; it is not handed out again.
+        """
+        with self._transaction() as conn:
+            value = self._first_free_value(conn, company_id, prefix)
+            while self._number_taken(conn, company_id, f"{prefix}{value:0{width}d}"):
+                value += 1
+            conn.execute(
+                "INSERT INTO invoice_sequences (company_id, prefix, next_value) VALUES (?, ?, ?) "
+                "ON CONFLICT (company_id, prefix) DO UPDATE SET next_value = excluded.next_value",
+                (company_id, prefix, value + 1)
+            )
+        return f"{prefix}{value:0{width}d}"
+
+    # Invoices
+
+    def save_invoice(self, company_id, invoice, invoice_id=None):
+        """
+        Save a models.Invoice with its line items and return its id.
+
+        Parameters:
+        - company_id: Id of the issuing company (see company_id())
+        - invoice: The Invoice to save
+        - invoice_id: Id of the saved invoice to overwrite, or None to add a new
+          one (also used when invoice_id no longer exists)
+
+        Raises DuplicateInvoiceNumber when another invoice of the company
+        already has the invoice number.
+        """
+        totals = price_items(invoice.items, invoice.tax_rate or 0.0, invoice.discount or 0.0)
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                client_id = None
+                if invoice.client_name:
+                    client_id = self._client_id(conn, company_id, invoice.client_name,
+                                                invoice.client_address, invoice.client_email)
+                values = (client_id, invoice.invoice_number, invoice.client_name, invoice.client_address,
+                          invoice.client_email, _iso(invoice.invoice_date), _iso(invoice.due_date), invoice.notes,
+                          invoice.tax_rate, invoice.discount, totals.total_cents, now)
+                updated = None
+                if invoice_id is not None:
+                    updated = conn.execute(
+                        "UPDATE invoices SET client_id = ?, invoice_number = ?, client_name = ?, client_address = ?, "
+                        "client_email = ?, invoice_date = ?, due_date = ?, notes = ?, tax_rate = ?, discount = ?, "
+                        "total_cents = ?, updated_at = ? WHERE id = ? AND company_id = ? RETURNING id",
+                        values + (invoice_id, company_id)
+                    ).fetchone()
+                if updated is None:
+                    invoice_id = conn.execute(
+                        "INSERT INTO invoices (client_id, invoice_number, client_name, client_address, client_email, "
+                        "invoice_date, due_date, notes, tax_rate, discount, total_cents, updated_at, "
+                        "company_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING id",
+                        values + (company_id, now)
+                    ).fetchone()[0]
+                else:
+                    conn.execute("DELETE FROM line_items WHERE invoice_id = ?", (invoice_id,))
+                conn.executemany(
+                    "INSERT INTO line_items (invoice_id, position, service_item, description, hours, rate, amount) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((invoice_id, position) + item.to_tuple() for position, item in enumerate(invoice.items))
+                )
+        except sqlite3.IntegrityError as e:
+            if 'invoice_number' not in str(e):
+                raise
+            raise DuplicateInvoiceNumber(f"Invoice number {invoice.invoice_number} is already used")
+        return invoice_id
+
+    def load_invoice(self, invoice_id):
+        """Return the saved invoice as a models.Invoice (KeyError if there is none)"""
+        conn = self._connection()
+        # Read the invoice and its items from one snapshot
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT * FROM invoices WHERE id = ?", (invoice_id,)).fetchone()
+            items = conn.execute(
+                f"SELECT {', '.join(ITEM_FIELDS)} FROM line_items WHERE invoice_id = ? ORDER BY position",
+                (invoice_id,)
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        if row is None:
+            raise KeyError(f"Unknown invoice: {invoice_id}")
+        return Invoice(
+            row['invoice_number'], row['client_name'], row['client_address'], row['client_email'],
+            [LineItem(*item) for item in items],
+            notes=row['notes'], tax_rate=row['tax_rate'], discount=row['discount'],
+            invoice_date=row['invoice_date'], due_date=row['due_date']
+        )
+
+    def duplicate_invoice(self, invoice_id, prefix=DEFAULT_PREFIX, width=DEFAULT_WIDTH):
+        """
+        Copy of a saved invoice under a newly allocated number, dated today with
+        the same payment term. The copy is returned unsaved.
+        """
+        row = self._connection().execute("SELECT company_id FROM invoices WHERE id = ?", (invoice_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown invoice: {invoice_id}")
+        invoice = self.load_invoice(invoice_id)
+        today = date.today()
+        term = invoice.due_date - invoice.invoice_date if invoice.invoice_date and invoice.due_date else timedelta(days=30)
+        invoice.invoice_number = self.allocate_invoice_number(row['company_id'], prefix, width)
+        invoice.invoice_date = today
+        invoice.due_date = today + term
+        return invoice
+
+    def delete_invoice(self, invoice_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM invoices WHERE id = ?", (invoice_id,))
+
+    def search_invoices(self, company_id, text='', client_id=None, date_from=None, date_to=None, limit=50):
+        """
+        Saved invoices of a company, newest first, as dictionaries with id,
+        invoice_number, client_name, invoice_date, due_date and total_cents.
+
+        Parameters:
+        - text: Only invoices whose number or client name starts with text
+          (case-insensitive)
+        - client_id: Only invoices of this client
+        - date_from, date_to: Only invoices dated within this range (inclusive)
+        - limit: Maximum number of invoices returned
+        """
+        sql = "SELECT id, invoice_number, client_name, invoice_date, due_date, total_cents FROM invoices WHERE "
+        text = (text or '').strip()
+        if text:
+            # Rows found by two index range scans; with OR, or with company_id
+            # repeated here, the planner walks the whole date index instead
+            sql += ("id IN (SELECT id FROM invoices WHERE company_id = ? AND invoice_number LIKE ? ESCAPE '\\'"
+                    " UNION ALL SELECT id FROM invoices WHERE company_id = ? AND client_name LIKE ? ESCAPE '\\')")
+            parameters = [company_id, _like_prefix(text)] * 2
+        else:
+            sql += "company_id = ?"
+            parameters = [company_id]
+        if client_id is not None:
+            sql += " AND client_id = ?"
+            parameters.append(client_id)
+        if date_from:
+            sql += " AND invoice_date >= ?"
+            parameters.append(_iso(date_from))
+        if date_to:
+            sql += " AND invoice_date <= ?"
+            parameters.append(_iso(date_to))
+        sql += " ORDER BY invoice_date DESC, id DESC LIMIT ?"
+        parameters.append(limit)
+        return [dict(row) for row in self._connection().execute(sql, parameters)]
+
+    def invoice_count(self, company_id):
+        return self._connection().execute("SELECT count(*) FROM invoices WHERE company_id = ?",
+                                          (company_id,)).fetchone()[0]
@@ -0,0 +1,36 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+from invoice_generator import InvoiceGenerator
+from logo_cache import normalize_logo
+
+
+def flat_logo(colors, width=300, height=120):
+    """PNG of vertical stripes in the given number of colors, white included"""
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    fills = [(255, 0, 0), (0, 0, 255), (0, 128, 0), (0, 0, 0), (200, 200, 0), (0, 200, 200), (200, 0, 200)]
+    for i in range(colors - 1):
+        draw.rectangle([i * 40, 0, i * 40 + 29, height], fill=fills[i])
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('colors', [2, 3, 5, 6, 8])
+def test_small_flat_logo_is_embedded(colors):
+    # Pillow packs palettes of up to 16 colors into 1, 2 or 4 bits per pixel
+    generator = InvoiceGenerator("ABC123 INC", "123 Broadway", flat_logo(colors))
+    assert generator.logo is not None
+    pdf = generator.generate_invoice("1", "Client", "Address", "client@example.com",
+                                     [{'description': "Work", 'hours': 1, 'rate': 10}])
+    assert b'/Subtype /Image' in pdf
+
+
+def test_flat_logo_stays_palette_png():
+    image = Image.open(BytesIO(normalize_logo(flat_logo(2, width=101))))
+    assert image.format == 'PNG'
+    assert image.mode == 'P'
+    assert image.size == (101, 120)
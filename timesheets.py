@@ -0,0 +1,186 @@
+import csv
+import io
+import re
+
+from models import LineItem, parse_date, parse_number
+
+# Accepted export column names for each entry field, in order of preference
+TIMESHEET_COLUMNS = {
+    'client': ('client_name', 'client', 'customer'),
+    'code': ('code', 'service_code', 'service_item', 'task_code'),
+    'hours': ('hours', 'duration'),
+    'rate': ('rate', 'hourly_rate', 'billable_rate'),
+    'description': ('description', 'task_name', 'task'),
+    'date': ('date', 'start_date'),
+    'billable': ('billable',),
+}
+
+# Values of a billable column marking entries that are not billed
+_NOT_BILLABLE = {'no', 'n', 'false', '0'}
+_DURATION = re.compile(r'^(-?)(\d+):(\d{1,2})(?::(\d{1,2}))?$')
+
+
+def parse_seconds(value, line=None):
+    """Seconds of a duration given as decimal hours (1.5) or h:mm[:ss] (1:30)"""
+    text = str(value).strip()
+    match = _DURATION.match(text)
+    if match:
+        sign, hours, minutes, seconds = match.groups()
+        total = int(hours) * 3600 + int(minutes) * 60 + int(seconds or 0)
+        return -total if sign else total
+    where = f" on line {line}" if line else ''
+    hours = parse_number(text, f'hours{where}')
+    return 0 if hours is None else round(hours * 3600)
+
+
+def _columns(fieldnames):
+    """Map each entry field to the first matching column of the export (case-insensitive)"""
+    present = {name.strip().lower(): name for name in fieldnames or ()}
+    columns = {}
+    for field, names in TIMESHEET_COLUMNS.items():
+        for name in names:
+            if name in present:
+                columns[field] = present[name]
+                break
+    missing = [field for field in ('client', 'code', 'hours') if field not in columns]
+    if missing:
+        raise ValueError(f"Timesheet export has no {', '.join(missing)} column; expected one of "
+                         + '; '.join(', '.join(TIMESHEET_COLUMNS[field]) for field in missing))
+    return columns
+
+
+class TimesheetTotals:
+    """
+    Billable time summed per client, service code and rate.
+
+    Durations are added up as whole seconds, so hundreds of thousands of
+    entries sum exactly. Only one running total per group is kept, however
+    many entries the export has.
+    """
+
+    def __init__(self):
+        # {client: {(code, rate): [seconds, entries, description]}} in first-seen order
+        self.clients = {}
+        self.entries = 0
+        self.skipped = 0
+        self.first_date = None
+        self.last_date = None
+
+    def add(self, client, code, seconds, rate=None, description=''):
+        groups = self.clients.get(client)
+        if groups is None:
+            groups = self.clients[client] = {}
+        group = groups.get((code, rate))
+        if group is None:
+            groups[(code, rate)] = [seconds, 1, description]
+        else:
+            group[0] += seconds
+            group[1] += 1
+            if not group[2]:
+                group[2] = description
+        self.entries += 1
+
+    def add_dates(self, days):
+        """Widen the period covered by the entries to include days"""
+        days = [day for day in days if day is not None]
+        days.extend(day for day in (self.first_date, self.last_date) if day is not None)
+        if days:
+            self.first_date, self.last_date = min(days), max(days)
+
+    def items(self, client, catalog=None):
+        """
+        Item dictionaries for generate_invoice (or a batch record) billing the
+        time of client, one per service code and rate, ordered by code. With a
+        catalog (catalog.ServiceCatalog) the description and any missing rate
+        come from the service; unknown codes raise ValueError.
+        """
+        items = []
+        for (code, rate), (seconds, _, description) in sorted(
+                self.clients.get(client, {}).items(), key=lambda group: (group[0][0], group[0][1] or 0)):
+            hours = round(seconds / 3600, 2)
+            if catalog is not None:
+                item = catalog.resolve({'code': code, 'hours': hours, 'rate': rate})
+            else:
+                item = {'service_item': code, 'description': description, 'hours': hours, 'rate': rate}
+            items.append(item)
+        return items
+
+    def line_items(self, client, catalog=None):
+        return [LineItem.from_dict(item) for item in self.items(client, catalog)]
+
+    def hours(self, client):
+        return round(sum(group[0] for group in self.clients.get(client, {}).values()) / 3600, 2)
+
+    def records(self, number_prefix='INV-', first_number=1, width=3, catalog=None):
+        """
+        Yield one invoice record (as read by batch.normalize_record) per
+        client, numbered consecutively from number_prefix + first_number
+        """
+        for offset, client in enumerate(self.clients):
+            yield {
+                'invoice_number': f"{number_prefix}{first_number + offset:0{width}d}",
+                'client_name': client,
+                'items': self.items(client, catalog),
+            }
+
+
+def aggregate_timesheet(source, totals=None):
+    """
+    Sum a timesheet export in one pass and return the TimesheetTotals.
+
+    Parameters:
+    - source: Path of a CSV export, or an open text or binary file
+    - totals: TimesheetTotals to add to, for exports split over several files
+
+    The file is read a line at a time, so exports larger than memory are fine;
+    memory grows only with the number of client, code and rate combinations.
+    Entries without a client or code, or marked as not billable, are counted
+    in totals.skipped. Hours may be decimal or h:mm.
+    """
+    totals = totals if totals is not None else TimesheetTotals()
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        with open(source, 'r', encoding='utf-8-sig', newline='') as f:
+            return aggregate_timesheet(f, totals)
+    if not isinstance(source, io.TextIOBase):
+        text = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+        try:
+            return aggregate_timesheet(text, totals)
+        finally:
+            # Leave the binary file open for the caller
+            text.detach()
+
+    reader = csv.reader(source)
+    header = next(reader, None)
+    columns = _columns(header)
+    index = {field: header.index(name) for field, name in columns.items()}
+    client_at, code_at, hours_at = index['client'], index['code'], index['hours']
+    rate_at = index.get('rate')
+    description_at = index.get('description')
+    date_at = index.get('date')
+    billable_at = index.get('billable')
+    width = max(index.values()) + 1
+    add = totals.add
+    # Exports repeat the same few dates and durations; parse each once
+    days = {}
+    durations = {}
+
+    for line, row in enumerate(reader, start=2):
+        if len(row) < width:
+            row = row + [''] * (width - len(row))
+        client = row[client_at].strip()
+        code = row[code_at].strip()
+        if not client or not code or (billable_at is not None
+                                       and row[billable_at].strip().lower() in _NOT_BILLABLE):
+            totals.skipped += 1
+            continue
+        rate = parse_number(row[rate_at], f'rate on line {line}') if rate_at is not None else None
+        if date_at is not None and row[date_at] not in days:
+            days[row[date_at]] = parse_date(row[date_at], f'date on line {line}')
+        seconds = durations.get(row[hours_at])
+        if seconds is None:
+            if len(durations) >= 4096:
+                durations.clear()
+            seconds = durations[row[hours_at]] = parse_seconds(row[hours_at], line)
+        add(client, code, seconds, rate, row[description_at].strip() if description_at is not None else '')
+    totals.add_dates(days.values())
+    return totals